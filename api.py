@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+"""
+Headless HTTP/WebSocket API for programmatic clients.
+
+Drives the same TurnPipeline (CoachAgent, persistence backend, per-user turn
+ordering) as the Gradio UI, without the UI protocol:
+
+    POST   /users/{user_id}/turns          {"message": "...", "request_id": "..."}
+                                           -> turn result
+    GET    /users/{user_id}/state          ?fields=a,b projects the state
+    DELETE /users/{user_id}                204, or 404 for unknown users
+    WS     /users/{user_id}/stream         send {"message": "..."}, receive
+                                           {"type": "token", "text": ...}
+                                           frames, then {"type": "turn", ...}
+    GET    /metrics                        Prometheus text (utils/metrics.py)
+
+A turn's optional "request_id" (or an Idempotency-Key header) makes retries
+safe: a repeated id with the same message returns the first reply
+("replayed": true); reused with a different message it runs as a new turn.
+
+While the LLM is failing, turns are answered from templates ("degraded":
+true, see engine/fallback.py).
+
+Abandoned turns are cancelled and save nothing (engine/cancellation.py): a
+client that disconnects before its reply, or a DELETE of the user (the turn
+gets 409). On the stream a new message sent while a turn is running
+supersedes it: the old turn ends with {"type": "cancelled", "reason":
+"superseded"}, its message stays in the history and the new turn answers.
+
+A user sending turns faster than allowed (utils/scheduler.py: turn rate,
+turns queued per user) gets 429 with a Retry-After header when known, and on
+the stream a {"type": "slow_down", ...} frame; nothing is queued.
+
+Responses are compact JSON (orjson when installed). The app is plain ASGI,
+so tests drive it in-process with starlette.testclient.TestClient.
+
+Run:
+    API_ENABLED=true python app.py   # mounted at /api next to the UI
+    python api.py                    # API only, on Config.API_PORT
+
+Mounted next to the UI, both share one pipeline: a UI turn and an API turn of
+the same user never overlap. Run standalone only against a backend that is
+safe to share between processes (sqlite, redis, shared in_memory).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import math
+from collections import deque
+from typing import Any, Optional
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route, WebSocketRoute
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+from engine.cancellation import (
+    CANCEL_DISCONNECTED,
+    CancelToken,
+    TurnCancelled,
+)
+from engine.pipeline import TurnPipeline, TurnResult, get_pipeline
+from memory.schemas.session_state import SessionState
+from utils.metrics import CONTENT_TYPE, REGISTRY
+from utils.scheduler import SlowDown
+from config import Config
+
+try:
+    import orjson
+except ImportError:  # optional: faster JSON
+    orjson = None
+
+
+def _dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class CompactJSONResponse(JSONResponse):
+    """JSON without whitespace, encoded by orjson when available."""
+
+    def render(self, content: Any) -> bytes:
+        return _dumps(content)
+
+
+def _error(status_code: int, message: str) -> CompactJSONResponse:
+    return CompactJSONResponse({"error": message}, status_code=status_code)
+
+
+def _slow_down(exc: SlowDown) -> CompactJSONResponse:
+    headers = {}
+    if exc.retry_after_s is not None:
+        headers["Retry-After"] = str(max(1, math.ceil(exc.retry_after_s)))
+    return CompactJSONResponse(
+        {"error": str(exc), "reason": exc.reason, "retry_after_s": exc.retry_after_s},
+        status_code=429,
+        headers=headers,
+    )
+
+
+def _message(payload: Any) -> Optional[str]:
+    """The non-empty "message" of a request body, else None."""
+    if not isinstance(payload, dict):
+        return None
+    message = payload.get("message")
+    if not isinstance(message, str) or not message.strip():
+        return None
+    return message
+
+
+async def _disconnected(request: Request) -> None:
+    """Return when the client of a request whose body was read disconnects."""
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+
+def _turn_payload(result: TurnResult) -> dict[str, Any]:
+    return {
+        "user_id": result.user_id,
+        "reply": result.reply,
+        "new_messages": result.new_messages,
+        "changes": result.changes,
+        "timings_ms": {k: round(v, 2) for k, v in result.timings_ms.items()},
+        "queued_ms": round(result.queued_ms, 2),
+        "replayed": result.replayed,
+        "degraded": result.degraded,
+    }
+
+
+def create_app(pipeline: TurnPipeline) -> Starlette:
+    """
+    Build the API around an existing pipeline.
+
+    Args:
+        pipeline: Turn pipeline shared with the caller (e.g. app.py's)
+
+    Returns:
+        ASGI application
+    """
+    storage = pipeline.storage
+
+    async def post_turn(request: Request) -> Response:
+        user_id = request.path_params["user_id"]
+        try:
+            payload = json.loads(await request.body())
+        except ValueError:
+            return _error(400, "Body must be JSON")
+        message = _message(payload)
+        if message is None:
+            return _error(400, 'Body must be {"message": "<non-empty text>"}')
+
+        request_id = payload.get("request_id") or request.headers.get("idempotency-key")
+        cancel = CancelToken()
+        watch = asyncio.ensure_future(_disconnected(request))
+        watch.add_done_callback(
+            lambda w: w.cancelled() or cancel.cancel(CANCEL_DISCONNECTED)
+        )
+        try:
+            result = await pipeline.arun(
+                user_id, message, request_id=request_id, cancel=cancel
+            )
+        except SlowDown as exc:
+            return _slow_down(exc)
+        except TurnCancelled as exc:
+            return _error(409, str(exc))
+        except Exception as exc:
+            print(f"[API] Turn failed for {user_id}: {exc}")
+            return _error(502, f"Error generating response: {exc}")
+        finally:
+            watch.cancel()
+        return CompactJSONResponse(_turn_payload(result))
+
+    async def get_state(request: Request) -> Response:
+        user_id = request.path_params["user_id"]
+        fields = None
+        if request.query_params.get("fields"):
+            fields = [f.strip() for f in request.query_params["fields"].split(",")]
+            unknown = sorted(set(fields) - set(SessionState.model_fields))
+            if unknown:
+                return _error(400, f"Unknown fields: {', '.join(unknown)}")
+
+        state = await storage.aload(user_id, fields=fields)
+        if state is None:
+            return _error(404, f"User {user_id} not found")
+        return CompactJSONResponse(state)
+
+    async def delete_user(request: Request) -> Response:
+        user_id = request.path_params["user_id"]
+        if not await pipeline.areset(user_id):
+            return _error(404, f"User {user_id} not found")
+        return Response(status_code=204)
+
+    async def stream_turns(websocket: WebSocket) -> None:
+        user_id = websocket.path_params["user_id"]
+        loop = asyncio.get_running_loop()
+        await websocket.accept()
+
+        # Started turns, oldest first: (turn, its tokens, its cancel token).
+        # Frames go out in this order; a newer turn supersedes the older ones
+        # through arun(supersede=True), which end with a "cancelled" frame.
+        turns: deque[tuple[asyncio.Future, asyncio.Queue, CancelToken]] = deque()
+
+        async def send(frame: dict[str, Any]) -> None:
+            await websocket.send_text(_dumps(frame).decode("utf-8"))
+
+        def interrupt(received: asyncio.Future) -> None:
+            # A closed connection leaves nobody to read the replies
+            if not received.cancelled() and received.exception() is not None:
+                for _, _, cancel in turns:
+                    cancel.cancel(CANCEL_DISCONNECTED)
+
+        def receive() -> asyncio.Future:
+            received = asyncio.ensure_future(websocket.receive_text())
+            received.add_done_callback(interrupt)
+            return received
+
+        async def take(received: asyncio.Future) -> None:
+            """Start a turn for a received frame, or answer it with an error."""
+            try:
+                payload = json.loads(received.result())
+            except ValueError:
+                payload = None
+            message = _message(payload)
+            if message is None:
+                await send({"type": "error", "error": 'Send {"message": "<text>"}'})
+                return
+
+            # Tokens arrive from the pipeline's worker thread; the turn's
+            # completion is scheduled after its last token
+            tokens: asyncio.Queue[Optional[str]] = asyncio.Queue()
+            cancel = CancelToken()
+            turn = asyncio.ensure_future(
+                pipeline.arun(
+                    user_id,
+                    message,
+                    on_token=lambda text: loop.call_soon_threadsafe(
+                        tokens.put_nowait, text
+                    ),
+                    request_id=payload.get("request_id"),
+                    cancel=cancel,
+                    supersede=True,
+                )
+            )
+            turn.add_done_callback(lambda _: tokens.put_nowait(None))
+            turns.append((turn, tokens, cancel))
+
+        async def finish(turn: asyncio.Future) -> None:
+            try:
+                result = turn.result()
+            except SlowDown as exc:
+                await send(
+                    {
+                        "type": "slow_down",
+                        "error": str(exc),
+                        "reason": exc.reason,
+                        "retry_after_s": exc.retry_after_s,
+                    }
+                )
+            except TurnCancelled as exc:
+                await send({"type": "cancelled", "reason": exc.reason})
+            except Exception as exc:
+                print(f"[API] Turn failed for {user_id}: {exc}")
+                await send({"type": "error", "error": f"Error generating response: {exc}"})
+            else:
+                await send({"type": "turn", **_turn_payload(result)})
+
+        incoming = receive()
+        try:
+            # One connection carries any number of turns; frames are read
+            # while a turn streams, so a new message can supersede it
+            while True:
+                if not turns:
+                    await asyncio.wait({incoming})
+                    received, incoming = incoming, receive()
+                    await take(received)
+                    continue
+
+                turn, tokens, _ = turns[0]
+                token = asyncio.ensure_future(tokens.get())
+                await asyncio.wait({token, incoming}, return_when=asyncio.FIRST_COMPLETED)
+                if incoming.done():
+                    received, incoming = incoming, receive()
+                    try:
+                        await take(received)
+                    finally:
+                        if not token.done():
+                            token.cancel()
+                    if not token.done():
+                        continue
+                text = token.result()
+                if text is not None:
+                    await send({"type": "token", "text": text})
+                else:
+                    turns.popleft()
+                    await finish(turn)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            incoming.cancel()
+            for turn, _, cancel in turns:
+                if not turn.done():
+                    cancel.cancel(CANCEL_DISCONNECTED)
+            await asyncio.gather(*(turn for turn, _, _ in turns), return_exceptions=True)
+
+    async def metrics(request: Request) -> Response:
+        return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+    return Starlette(
+        routes=[
+            Route("/users/{user_id}/turns", post_turn, methods=["POST"]),
+            Route("/users/{user_id}/state", get_state, methods=["GET"]),
+            Route("/users/{user_id}", delete_user, methods=["DELETE"]),
+            WebSocketRoute("/users/{user_id}/stream", stream_turns),
+            Route("/metrics", metrics, methods=["GET"]),
+        ]
+    )
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    Config.validate()
+    app = create_app(get_pipeline())
+    print(f"[API] Serving on 0.0.0.0:{Config.API_PORT}")
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=Config.API_PORT,
+        timeout_keep_alive=Config.API_KEEPALIVE_S,
+    )
@@ -10,20 +10,27 @@ import gradio as gr
 from gradio.themes import Default
 import json
 import tempfile
+import uuid
+from collections import defaultdict
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Optional
+from typing import Optional
 from dotenv import load_dotenv
-from engine.coach import CoachAgent
-from persistence import get_backend
-from memory.logic.manager import MemoryManager
+from engine.cancellation import CANCEL_DISCONNECTED, CancelToken, TurnCancelled
+from engine.client import LLM_BREAKER
+from engine.pipeline import TURNS_IN_FLIGHT, get_pipeline
 from memory.schemas.session_state import SessionState
 from config import Config
 from utils.leaderboard_parser import parse_leaderboard_card, filter_checks_by_priority
 from utils.evaluator import (
+    conversation_hash,
     evaluate_conversation as evaluate_conv_llm,
     format_evaluation_results,
 )
+from utils.jobs import Job, JobQueue, JobStatus
+from utils.metrics import REGISTRY
+from utils.queue_metrics import QueueMetrics, gradio_queue_depths
+from utils.scheduler import SlowDown
 
 # Load environment variables from .env (for OPENAI_API_KEY, etc.)
 load_dotenv()
@@ -32,9 +39,21 @@ load_dotenv()
 # Global instances (singleton pattern)
 # ===================================================================
 
-coach = CoachAgent()
-storage = get_backend()
-memory_manager = MemoryManager()
+# Coach, backend and turn pipeline: get_pipeline(), built on first use
+queue_metrics = QueueMetrics()
+
+# LLM-as-Judge evaluations run as background jobs, at most EVAL_CONCURRENCY
+# at once, and wait while chat turns fill all turn slots
+eval_jobs = JobQueue(
+    "eval",
+    workers=Config.EVAL_CONCURRENCY,
+    timeout_s=Config.EVAL_TIMEOUT_S,
+    cache_size=Config.EVAL_CACHE_ENTRIES,
+    defer_while=lambda: TURNS_IN_FLIGHT.labels().value >= Config.TURN_SLOTS,
+)
+
+# Turns of every browser session still queued or running (see end_session)
+session_turns: dict[str, set[CancelToken]] = defaultdict(set)
 
 
 # ===================================================================
@@ -42,116 +61,193 @@ memory_manager = MemoryManager()
 # ===================================================================
 
 
-def interact(message: str, history: list, user_id: str):
+def new_request_id() -> str:
+    """Client token of the next message (see interact)."""
+    return uuid.uuid4().hex
+
+
+def take_message(message: str, request_id: str):
+    """
+    Hand the typed message and its token to interact, and free the textbox
+    and the token for the next message before the turn starts: a message sent
+    while a turn is in flight gets a token of its own.
+
+    Returns:
+        Tuple: (sent message, sent token, cleared textbox, next token)
+    """
+    return message, request_id, "", new_request_id()
+
+
+async def interact(
+    message: str,
+    history: list,
+    user_id: str,
+    request_id: str = "",
+    request: Optional[gr.Request] = None,
+):
     """
     Main function handling interaction with coach.
 
+    Turns of one user_id run strictly in order (TurnPipeline.arun). A newer
+    message supersedes a turn still in flight: its LLM request is aborted and
+    only its user message is saved, so the newest turn answers both. Clear
+    and closing the tab cancel it too, saving nothing.
+
+    Every message carries the token the page held when it was sent (see
+    take_message); Enter and Send on the same text, or a retried request,
+    replay the first turn's reply instead of running it twice.
+
+    A user over their turn rate or queue limit (utils/scheduler.py) gets a
+    "slow down" warning and the message stays unanswered; turn slots are
+    shared fairly with other users.
+
+    Per-turn work does not grow with the session: only the new messages are
+    rendered and the state viewer receives only the fields the turn changed.
+
     Args:
         message: User message
         history: Chat history (Gradio messages format: list of dicts)
         user_id: User ID
+        request_id: Client token of this message
+        request: Gradio request (its session_hash, injected by Gradio)
 
     Returns:
-        Tuple: (updated_history, state_dict, export_json)
+        Tuple: (updated_history, state_changes)
     """
     if not message or not message.strip():
-        return history, {"status": "No message"}, ""
+        return history, {"status": "No message"}
 
     # Use default user_id if empty
     if not user_id or not user_id.strip():
         user_id = Config.DEFAULT_USER_ID
 
-    # Get or create state
-    if storage.exists(user_id):
-        state_dict: dict[str, Any] = storage.load(user_id)  # type: ignore[assignment]
-        state = SessionState(**state_dict)
-    else:
-        state = memory_manager.create_empty_state(user_id)
-
-    # Rebuild chat history from stored state (ensures UI shows prior turns)
-    chat_history: list[dict[str, str]] = [
-        {"role": msg.get("role", "user"), "content": msg.get("content", "")}
-        for msg in state.conversation_history
-    ]
-
-    # Persist the user's turn into state before generating a response
-    state = memory_manager.add_user_message(state, message)
+    session = request.session_hash if request is not None else None
+    cancel = CancelToken()
+    if session:
+        session_turns[session].add(cancel)
 
-    # Generate coach response
+    # Run the whole turn (load -> LLM -> save) through the pipeline
     try:
-        response_text, updated_state = coach.respond(message, state)
+        with queue_metrics.track("chat", ordered=True) as tracked:
+            result = await get_pipeline().arun(
+                user_id,
+                message,
+                on_start=tracked.started,
+                request_id=request_id or None,
+                cancel=cancel,
+                supersede=True,
+            )
+    except SlowDown as e:
+        gr.Warning(str(e))
+        return history, {"status": str(e)}
+    except TurnCancelled as e:
+        return history, {"status": f"Cancelled ({e.reason})"}
     except Exception as e:
         error_msg = f"Error generating response: {str(e)}"
         print(f"ERROR: {error_msg}")
-        return history, {"error": error_msg}, ""
+        return history, {"error": error_msg}
+    finally:
+        if session:
+            session_turns[session].discard(cancel)
+            if not session_turns[session]:
+                del session_turns[session]
+
+    stored = len(result.state.conversation_history) - len(result.new_messages)
+    if history is not None and len(history) == stored:
+        chat_history = list(history) + result.new_messages
+    else:
+        # The browser's view is out of sync (other tab, user switch): full render
+        chat_history = result.chat_history
 
-    # Save state
-    storage.save(user_id, updated_state.model_dump())
+    if result.degraded:
+        return chat_history, {"changed": result.changes, "degraded": "LLM unavailable"}
+    return chat_history, {"changed": result.changes}
 
-    # Update chat history from updated state so UI shows full conversation
-    chat_history.extend(
-        [
-            {"role": "user", "content": message},
-            {"role": "assistant", "content": response_text},
-        ]
-    )
 
-    # Prepare state visualization (dict for gr.JSON)
-    state_dict = updated_state.model_dump()
-
-    # Prepare export data (convert history to tuples for export)
-    export_history = []
-    for i in range(0, len(chat_history) - 1, 2):
-        if i + 1 < len(chat_history):
-            export_history.append(
-                (
-                    chat_history[i].get("content", ""),
-                    chat_history[i + 1].get("content", ""),
-                )
-            )
+def build_export(user_id: str) -> Optional[dict]:
+    """
+    Export data of a user's persisted session (None if nothing is stored).
+
+    Returns:
+        {"user_id", "exported_at", "conversation": [(user, coach), ...], "state"}
+    """
+    state = get_pipeline().storage.load_state(user_id)
+    if state is None:
+        return None
+    session_state = state.model_dump()
+
+    # Conversation as (user message, coach reply) pairs
+    messages = session_state["conversation_history"]
+    conversation = [
+        (messages[i].get("content", ""), messages[i + 1].get("content", ""))
+        for i in range(0, len(messages) - 1, 2)
+    ]
 
-    export_data = {
+    return {
         "user_id": user_id,
         "exported_at": datetime.now().isoformat(),
-        "conversation": export_history,
-        "state": updated_state.model_dump(),
+        "conversation": conversation,
+        "state": session_state,
     }
-    export_json = json.dumps(export_data, indent=5, ensure_ascii=False)
 
-    return chat_history, state_dict, export_json
 
+def show_state(user_id: str) -> dict:
+    """Full persisted state without conversation_history (shown in the chat)."""
+    if not user_id or not user_id.strip():
+        user_id = Config.DEFAULT_USER_ID
+    state = get_pipeline().storage.load(user_id, fields=SessionState.scalar_fields())
+    return state if state is not None else {"status": "No state - start conversation"}
+
+
+async def end_session(request: gr.Request):
+    """
+    Tab closed or reloaded: cancel the session's turns (nobody will see them).
 
-def reset_conversation(user_id: str):
+    Gradio drops the session's queued events itself, but lets a running
+    handler finish.
+    """
+    for cancel in session_turns.pop(request.session_hash, ()):
+        cancel.cancel(CANCEL_DISCONNECTED)
+
+
+async def reset_conversation(user_id: str):
     """
     Resets conversation (clears history and state).
 
+    Cancels the user's pending turns first (their LLM requests are aborted)
+    and runs after them, so a turn still in flight cannot save its state back
+    over the reset.
+
     Args:
         user_id: User ID
 
     Returns:
-        Tuple: (empty_history, message, empty_export)
+        Tuple: (empty_history, message)
     """
     if not user_id or not user_id.strip():
         user_id = Config.DEFAULT_USER_ID
 
-    if storage.exists(user_id):
-        storage.delete(user_id)
+    await get_pipeline().areset(user_id)
 
-    return [], {"status": "State cleared"}, ""
+    return [], {"status": "State cleared"}
 
 
-def export_to_file(export_json: str, user_id: str) -> Optional[str]:
+@queue_metrics.tracked("export")
+def export_to_file(user_id: str) -> Optional[str]:
     """
-    Exports conversation to temporary JSON file.
+    Exports the persisted conversation to a temporary JSON file.
 
     Args:
-        export_json: JSON string with conversation data
-        user_id: User ID (for filename)
+        user_id: User ID
 
     Returns:
-        str: Path to temporary file
+        str: Path to temporary file (None if the user has no saved state)
     """
-    if not export_json or export_json == "":
+    if not user_id or not user_id.strip():
+        user_id = Config.DEFAULT_USER_ID
+
+    export_data = build_export(user_id)
+    if export_data is None:
         return None
 
     # Create temp file with meaningful name
@@ -163,86 +259,145 @@ def export_to_file(export_json: str, user_id: str) -> Optional[str]:
     filepath = temp_dir / filename
 
     with open(filepath, "w", encoding="utf-8") as f:
-        f.write(export_json)
+        json.dump(export_data, f, indent=5, ensure_ascii=False)
 
     return str(filepath)
 
 
-def evaluate_conversation(
-    export_json: str, priority_filter: str, progress=gr.Progress()
-) -> str:
+def run_evaluation(job: Job, session_state: dict, priority_filter: str) -> str:
     """
-    Evaluate conversation using LLM-as-Judge.
+    Evaluation job body (runs on an eval_jobs worker).
 
     Args:
-        export_json: JSON string with conversation data
+        job: The running job (progress reports, deadline)
+        session_state: Snapshot of the persisted session to evaluate
         priority_filter: "MUST-HAVE", "SHOULD-HAVE", or "ALL"
-        progress: Gradio progress tracker
 
     Returns:
         Formatted evaluation results
-    """
-    progress(0, desc="Starting evaluation...")
 
-    if not export_json or export_json == "":
-        return "⚠️ **No conversation to evaluate.** Start a conversation first."
+    Raises:
+        ValueError: The session cannot be evaluated (job fails with the message)
+    """
+    # Parse leaderboard card
+    job.report(0.2, "Loading evaluation criteria...")
+    leaderboard_path = Path(__file__).parent / "leaderboard_card_coach.md"
+    all_checks = parse_leaderboard_card(str(leaderboard_path))
+    if not all_checks:
+        raise ValueError("No criteria found in leaderboard card.")
 
-    # Parse export data
-    progress(0.1, desc="Parsing conversation...")
-    try:
-        export_data = json.loads(export_json)
-        session_state = export_data.get("state", {})
+    # Filter checks by priority
+    job.report(0.3, f"Filtering criteria ({priority_filter})...")
+    filtered_checks = filter_checks_by_priority(all_checks, priority_filter)
+    if not filtered_checks:
+        raise ValueError(f"No criteria match filter: {priority_filter}")
 
-        if not session_state:
-            return "⚠️ **No session state to evaluate.** Have a conversation first."
+    # Evaluate using LLM (the request gives up at the job's deadline)
+    job.report(0.4, f"Evaluating {len(filtered_checks)} criteria with LLM...")
+    eval_result = evaluate_conv_llm(
+        session_state, filtered_checks, timeout_s=job.remaining_s()
+    )
+    if "error" in eval_result:
+        raise ValueError(eval_result["error"])
+
+    # Format results
+    job.report(0.9, "Formatting results...")
+    formatted = format_evaluation_results(eval_result)
+    job.report(1.0, "Done!")
+    return formatted
+
+
+def render_evaluation(job: Optional[Job]) -> str:
+    """Leaderboard panel text for the state of an evaluation job."""
+    if job is None:
+        return "*Click 'Evaluate' to see results...*"
+    if job.status is JobStatus.QUEUED:
+        return f"⏳ **Queued** (position {eval_jobs.position(job.id) + 1})"
+    if job.status is JobStatus.RUNNING:
+        return f"⏳ **{job.progress:.0%}** - {job.desc}"
+    if job.status is JobStatus.DONE:
+        return job.result
+    if job.status is JobStatus.CANCELLED:
+        return "⏹️ **Evaluation cancelled.**"
+    if job.status is JobStatus.TIMED_OUT:
+        return f"⌛ **Evaluation timed out** after {job.timeout_s:.0f}s."
+    return f"❌ **Evaluation failed:** {job.error}"
+
+
+def submit_evaluation(user_id: str, priority_filter: str):
+    """
+    Queue an LLM-as-Judge evaluation of the persisted session.
 
-        conversation = session_state.get("conversation_history", [])
+    Returns at once; the panel is refreshed by poll_evaluation. A session that
+    was already evaluated with the same filter gets the stored result.
 
-        if not conversation:
-            return "⚠️ **No messages in conversation.** Have a conversation with the coach first."
+    Args:
+        user_id: User ID (the persisted session is evaluated)
+        priority_filter: "MUST-HAVE", "SHOULD-HAVE", or "ALL"
 
-    except Exception as e:
-        return f"❌ **Error parsing conversation:** {str(e)}"
+    Returns:
+        Tuple: (job_id, panel text, polling timer update)
+    """
+    if not user_id or not user_id.strip():
+        user_id = Config.DEFAULT_USER_ID
 
-    # Parse leaderboard card
-    progress(0.2, desc="Loading evaluation criteria...")
+    # Snapshot the persisted session (the job evaluates exactly this)
     try:
-        leaderboard_path = Path(__file__).parent / "leaderboard_card_coach.md"
-        all_checks = parse_leaderboard_card(str(leaderboard_path))
-
-        if not all_checks:
-            return "❌ **Error:** No criteria found in leaderboard card."
-
+        state = get_pipeline().storage.load_state(user_id)
     except Exception as e:
-        return f"❌ **Error parsing leaderboard:** {str(e)}"
+        return None, f"❌ **Error loading conversation:** {str(e)}", gr.Timer(active=False)
+    if state is None:
+        return (
+            None,
+            "⚠️ **No conversation to evaluate.** Start a conversation first.",
+            gr.Timer(active=False),
+        )
+    session_state = state.model_dump()
+    conversation = session_state.get("conversation_history", [])
+    if not conversation:
+        return (
+            None,
+            "⚠️ **No messages in conversation.** Have a conversation with the coach first.",
+            gr.Timer(active=False),
+        )
+
+    job = eval_jobs.submit(
+        lambda job: run_evaluation(job, session_state, priority_filter),
+        key=(user_id, conversation_hash(conversation), priority_filter),
+    )
+    return job.id, render_evaluation(job), gr.Timer(active=not job.status.finished)
 
-    # Filter checks by priority
-    progress(0.3, desc=f"Filtering criteria ({priority_filter})...")
-    filtered_checks = filter_checks_by_priority(all_checks, priority_filter)
 
-    if not filtered_checks:
-        return f"⚠️ **No criteria match filter:** {priority_filter}"
+def poll_evaluation(job_id: Optional[str]):
+    """Current state of the evaluation job; stops polling once it finished."""
+    job = eval_jobs.get(job_id) if job_id else None
+    active = job is not None and not job.status.finished
+    return render_evaluation(job), gr.Timer(active=active)
 
-    # Evaluate using LLM
-    progress(0.4, desc=f"Evaluating {len(filtered_checks)} criteria with LLM...")
-    try:
-        eval_result = evaluate_conv_llm(session_state, filtered_checks)
 
-        if "error" in eval_result:
-            return f"❌ **Evaluation error:** {eval_result['error']}"
+def cancel_evaluation(job_id: Optional[str]):
+    """Cancel the evaluation job (queued or running)."""
+    if job_id:
+        eval_jobs.cancel(job_id)
+    return poll_evaluation(job_id)
 
-        # Format results
-        progress(0.9, desc="Formatting results...")
-        formatted = format_evaluation_results(eval_result)
 
-        progress(1.0, desc="Done!")
-        return formatted
+def queued_events() -> dict[str, int]:
+    """Events waiting in Gradio's queue per concurrency group."""
+    depths = gradio_queue_depths(demo)
+    return {group: depths.get(group, 0) for group in ("chat", "export")}
 
-    except Exception as e:
-        import traceback
 
-        error_detail = traceback.format_exc()
-        return f"❌ **Evaluation failed:**\n\n```\n{error_detail}\n```"
+def queue_snapshot() -> dict:
+    """Per-group queue metrics (Gradio queue depth, in flight, wait/run times),
+    the evaluation jobs, the turn scheduler and the LLM circuit breaker."""
+    groups = queue_metrics.snapshot()
+    for group, queued in queued_events().items():
+        groups.setdefault(group, {})["queued"] = queued
+    groups["eval_jobs"] = eval_jobs.stats()
+    groups["turn_slots"] = get_pipeline().scheduler.stats()
+    groups["llm_circuit"] = LLM_BREAKER.snapshot()
+    return groups
 
 
 # ===================================================================
@@ -261,6 +416,11 @@ with gr.Blocks(title="Life Coach System", theme=Default()) as demo:
             chatbot = gr.Chatbot(height=600, show_label=False)
 
             msg = gr.Textbox(placeholder="Message...", lines=2, show_label=False)
+            # Token of the message being typed; renewed as soon as it is sent
+            request_id = gr.Textbox(value=new_request_id, visible=False)
+            # The message (and its token) handed to interact by take_message
+            sent_msg = gr.State("")
+            sent_request_id = gr.State("")
 
             with gr.Row():
                 send_btn = gr.Button("Send", variant="primary", scale=3)
@@ -284,24 +444,24 @@ with gr.Blocks(title="Life Coach System", theme=Default()) as demo:
             # Memory State (collapsed)
             with gr.Accordion("🧠 Memory State", open=False):
                 state_viewer = gr.JSON(
-                    label="Session State",
+                    label="Session State (last turn: changed fields)",
                     value={"status": "No state - start conversation"},
                 )
+                state_btn = gr.Button("🔍 Full state", size="sm")
 
             # Export (collapsed)
             with gr.Accordion("⚙️ Advanced", open=False):
                 gr.Markdown("**Export Session**")
 
-                export_data = gr.Textbox(
-                    label="Export data (JSON)",
-                    lines=1,
-                    visible=False,  # Hidden field for storing JSON
-                )
-
                 export_btn = gr.Button("📥 Export JSON", size="sm")
 
                 export_file = gr.File(label="Download", visible=True)
 
+            # Queue metrics (collapsed)
+            with gr.Accordion("📈 Queue", open=False):
+                queue_viewer = gr.JSON(label="Queue metrics", value={})
+                queue_refresh_btn = gr.Button("🔄 Refresh", size="sm")
+
             # Leaderboard (collapsed) - NEW
             with gr.Accordion("📊 Leaderboard", open=False):
                 gr.Markdown("**Evaluate Conversation Quality**")
@@ -314,53 +474,116 @@ with gr.Blocks(title="Life Coach System", theme=Default()) as demo:
                     interactive=True,
                 )
 
-                evaluate_btn = gr.Button("🎯 Evaluate", variant="primary", size="sm")
+                with gr.Row():
+                    evaluate_btn = gr.Button("🎯 Evaluate", variant="primary", size="sm")
+                    cancel_eval_btn = gr.Button("⏹️ Cancel", size="sm")
 
                 leaderboard_results = gr.Markdown(
                     value="*Click 'Evaluate' to see results...*"
                 )
+                eval_job_id = gr.State(None)
+                eval_timer = gr.Timer(1.0, active=False)  # Polls a running job
 
     # ===================================================================
     # Event handlers
     # ===================================================================
 
-    # Send message (button)
+    # Concurrency groups: chat turns and exports each get their own slots;
+    # evaluations run as background jobs (eval_jobs), off the queue
+
+    # Send message (button): take the message and clear the text field at
+    # once (the next message gets a new token), then run the turn
     send_btn.click(
-        fn=interact,
-        inputs=[msg, chatbot, user_id_input],
-        outputs=[chatbot, state_viewer, export_data],
+        fn=take_message,
+        inputs=[msg, request_id],
+        outputs=[sent_msg, sent_request_id, msg, request_id],
+        queue=False,
     ).then(
-        lambda: "", None, msg  # Clear text field after sending
+        fn=interact,
+        inputs=[sent_msg, chatbot, user_id_input, sent_request_id],
+        outputs=[chatbot, state_viewer],
+        concurrency_id="chat",
+        concurrency_limit=Config.CHAT_CONCURRENCY,
     )
 
     # Send message (Enter)
     msg.submit(
-        fn=interact,
-        inputs=[msg, chatbot, user_id_input],
-        outputs=[chatbot, state_viewer, export_data],
+        fn=take_message,
+        inputs=[msg, request_id],
+        outputs=[sent_msg, sent_request_id, msg, request_id],
+        queue=False,
     ).then(
-        lambda: "", None, msg  # Clear text field
+        fn=interact,
+        inputs=[sent_msg, chatbot, user_id_input, sent_request_id],
+        outputs=[chatbot, state_viewer],
+        concurrency_id="chat",
+        concurrency_limit=Config.CHAT_CONCURRENCY,
     )
 
     # Reset conversation
     clear_btn.click(
         fn=reset_conversation,
         inputs=[user_id_input],
-        outputs=[chatbot, state_viewer, export_data],
+        outputs=[chatbot, state_viewer],
+        concurrency_id="chat",
+        concurrency_limit=Config.CHAT_CONCURRENCY,
     )
 
-    # Export conversation to file
+    # Full state (from persisted state, on demand)
+    state_btn.click(
+        fn=show_state,
+        inputs=[user_id_input],
+        outputs=[state_viewer],
+        concurrency_id="export",
+        concurrency_limit=Config.EXPORT_CONCURRENCY,
+    )
+
+    # Export conversation to file (built from persisted state on click)
     export_btn.click(
-        fn=export_to_file, inputs=[export_data, user_id_input], outputs=[export_file]
+        fn=export_to_file,
+        inputs=[user_id_input],
+        outputs=[export_file],
+        concurrency_id="export",
+        concurrency_limit=Config.EXPORT_CONCURRENCY,
     )
 
-    # Evaluate conversation
+    # Evaluate conversation: submit a job, poll its progress, cancel it
     evaluate_btn.click(
-        fn=evaluate_conversation,
-        inputs=[export_data, priority_dropdown],
-        outputs=[leaderboard_results],
-        show_progress="full",  # Show progress bar and disable button during execution
+        fn=submit_evaluation,
+        inputs=[user_id_input, priority_dropdown],
+        outputs=[eval_job_id, leaderboard_results, eval_timer],
+        queue=False,
     )
+    eval_timer.tick(
+        fn=poll_evaluation,
+        inputs=[eval_job_id],
+        outputs=[leaderboard_results, eval_timer],
+        queue=False,
+        show_progress="hidden",
+    )
+    cancel_eval_btn.click(
+        fn=cancel_evaluation,
+        inputs=[eval_job_id],
+        outputs=[leaderboard_results, eval_timer],
+        queue=False,
+    )
+
+    # Queue metrics (outside the queue, so they load while it is full)
+    queue_refresh_btn.click(
+        fn=queue_snapshot, inputs=None, outputs=[queue_viewer], queue=False
+    )
+
+    # Closed tab: abandon its turns
+    demo.unload(end_session)
+
+demo.queue(
+    max_size=Config.QUEUE_MAX_SIZE or None,
+    default_concurrency_limit=Config.CHAT_CONCURRENCY,
+)
+
+REGISTRY.gauge(
+    "coach_queue_depth", "Events waiting in Gradio's queue", ["group"]
+).set_function(queued_events)
 
 
 # ===================================================================
@@ -368,6 +591,7 @@ with gr.Blocks(title="Life Coach System", theme=Default()) as demo:
 # ===================================================================
 
 if __name__ == "__main__":
+    Config.validate()  # Fail at launch, not on the first message
     print("=" * 70)
     print("Life Coach System - MVP")
     print("=" * 70)
@@ -377,8 +601,37 @@ if __name__ == "__main__":
     print(f"Debug Mode: {Config.DEBUG}")
     print("=" * 70)
 
-    demo.launch(
-        server_name="0.0.0.0",
-        server_port=8080,
-        share=False,  # Set True if you want public link
-    )
+    if Config.METRICS_ENABLED or Config.API_ENABLED:
+        # One server: the UI, /metrics and the headless API (api.py),
+        # all sharing the pipeline
+        import uvicorn
+        from fastapi import FastAPI
+        from starlette.responses import Response
+        from utils.metrics import CONTENT_TYPE
+
+        server = FastAPI()
+        if Config.METRICS_ENABLED:
+            server.add_route(
+                "/metrics",
+                lambda request: Response(REGISTRY.render(), media_type=CONTENT_TYPE),
+                include_in_schema=False,
+            )
+            print("Metrics: http://0.0.0.0:8080/metrics")
+        if Config.API_ENABLED:
+            from api import create_app
+
+            server.mount("/api", create_app(get_pipeline()))
+            print("API: http://0.0.0.0:8080/api")
+        server = gr.mount_gradio_app(server, demo, path="/")
+        uvicorn.run(
+            server,
+            host="0.0.0.0",
+            port=8080,
+            timeout_keep_alive=Config.API_KEEPALIVE_S,
+        )
+    else:
+        demo.launch(
+            server_name="0.0.0.0",
+            server_port=8080,
+            share=False,  # Set True if you want public link
+        )
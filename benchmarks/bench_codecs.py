@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+State codecs: encode/decode time and stored size on SessionState dumps.
+
+Uses the states stored in --source (FileBackend directory) when there are
+enough of them, otherwise generates realistic ones through SessionState. The
+shared dictionary is trained on one half of the states and measured on the
+other half, so its ratio is not flattered by having seen the test data.
+
+Run:
+    python -m benchmarks.bench_codecs [--source data] [--users 200] [--repeat 5]
+"""
+
+from __future__ import annotations
+
+import argparse
+import copy
+import random
+import time
+from pathlib import Path
+
+from memory.schemas.session_state import SessionState
+from persistence.backend import PersistenceError
+from persistence.codecs import StateCodec, train_dictionary
+from persistence.file_backend import FileBackend
+
+_USER_LINES = [
+    "Chcę w końcu zmienić pracę, ale boję się, że nie dam rady.",
+    "Ostatnio ciągle jestem zmęczona i nie mam na nic czasu.",
+    "Mój szef nie docenia tego, co robię w zespole.",
+    "I keep procrastinating on my thesis and I feel guilty about it.",
+    "Chciałbym zacząć biegać trzy razy w tygodniu.",
+]
+_COACH_LINES = [
+    "Słyszę, że to dla Ciebie ważne. Co dokładnie sprawia, że się wahasz?",
+    "Brzmi to jak duże obciążenie. Jak to wpływa na Twoje samopoczucie?",
+    "Co byłoby pierwszym, najmniejszym krokiem w tym kierunku?",
+    "It sounds like this matters a lot to you. What would success look like?",
+    "Jak zmierzysz, że Ci się udało?",
+]
+
+
+def _generated_states(users: int, seed: int = 7) -> list[dict]:
+    rng = random.Random(seed)
+    states = []
+    for i in range(users):
+        history = []
+        for _ in range(rng.randint(2, 40)):
+            history.append({"role": "user", "content": rng.choice(_USER_LINES)})
+            history.append({"role": "assistant", "content": rng.choice(_COACH_LINES)})
+        state = SessionState(
+            user_id=f"user_{i}",
+            user_name=rng.choice(["Ala", "Bartek", "Kasia", None]),
+            conversation_history=history,
+            current_phase=rng.choice(["OPENING", "EXPLORATION", "ACTION_PLANNING"]),
+            detected_emotions=rng.sample(["stres", "lęk", "nadzieja", "złość"], 2),
+            key_facts=[f"fakt {j}" for j in range(rng.randint(0, 6))],
+            topics=rng.sample(["praca", "zdrowie", "relacje", "nauka"], 2),
+            main_goal=rng.choice([None, "Zmiana pracy", "Regularny sport"]),
+        )
+        states.append(state.model_dump())
+    return states
+
+
+def _stored_states(source: Path) -> list[dict]:
+    backend = FileBackend(source)
+    states = []
+    for user_id in backend.list_users():
+        try:
+            state = backend.load(user_id)
+        except PersistenceError:
+            continue
+        if state is not None:
+            states.append(SessionState(**state).model_dump())
+    return states
+
+
+def _measure(codec: StateCodec, states: list[dict], repeat: int) -> tuple:
+    blobs = [codec.encode(s) for s in states]  # warm up
+    started = time.perf_counter()
+    for _ in range(repeat):
+        blobs = [codec.encode(s) for s in states]
+    encode_us = (time.perf_counter() - started) / (repeat * len(states)) * 1e6
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for blob in blobs:
+            codec.decode(blob)
+    decode_us = (time.perf_counter() - started) / (repeat * len(states)) * 1e6
+    return encode_us, decode_us, sum(len(b) for b in blobs)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--source", type=Path, default=None, help="FileBackend dir")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--dict-size", type=int, default=16 * 1024)
+    args = parser.parse_args()
+
+    states = _stored_states(args.source) if args.source else []
+    origin = f"stored ({args.source})"
+    if len(states) < 16:
+        states = _generated_states(args.users)
+        origin = "generated"
+    random.Random(0).shuffle(states)
+    train, test = states[: len(states) // 2], states[len(states) // 2 :]
+
+    dictionaries = {}
+    for fmt in ("json", "msgpack"):
+        plain = StateCodec(fmt)
+        samples = [plain.encode(s) for s in train]
+        if fmt != "json":
+            samples = [b[1:] for b in samples]
+        dictionaries[fmt] = train_dictionary(samples, args.dict_size)
+
+    cases = []
+    for fmt in ("json", "msgpack"):
+        for compression in (None, "zlib", "zstd"):
+            cases.append(StateCodec(fmt, compression))
+            if compression:
+                cases.append(StateCodec(fmt, compression, dictionary=dictionaries[fmt]))
+
+    # Reference: what InMemoryBackend used to do (two deep copies per round trip)
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        for state in test:
+            copy.deepcopy(copy.deepcopy(state))
+    deepcopy_us = (time.perf_counter() - started) / (args.repeat * len(test)) * 1e6
+
+    print(f"{origin} states: {len(test)} measured, {len(train)} used for the dictionary")
+    print(f"{'codec':<24} {'encode':>10} {'decode':>10} {'avg size':>10} {'ratio':>7}")
+    baseline = None
+    for codec in cases:
+        encode_us, decode_us, total = _measure(codec, test, args.repeat)
+        baseline = baseline or total
+        print(
+            f"{codec.name:<24} {encode_us:>8.1f}us {decode_us:>8.1f}us "
+            f"{total / len(test):>9.0f}B {baseline / total:>6.2f}x"
+        )
+    print(f"{'deepcopy x2 (old memory)':<24} {deepcopy_us:>8.1f}us (save + load)")
+
+
+if __name__ == "__main__":
+    main()
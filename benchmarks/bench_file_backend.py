@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+FileBackend save throughput with durability disabled and enabled.
+
+Simulates concurrent turns: every thread owns a set of users and appends one
+user+assistant message pair per save, like TurnPipeline does.
+
+Run:
+    python -m benchmarks.bench_file_backend [--threads 8] [--users 64] [--turns 20]
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from persistence.durability import GroupCommitter
+from persistence.file_backend import FileBackend
+
+
+def _state(user_id: str, turns: int) -> dict:
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"Wiadomość {i} " + "x" * 200})
+        history.append({"role": "assistant", "content": f"Odpowiedź {i} " + "y" * 400})
+    return {
+        "user_id": user_id,
+        "user_name": "Ala",
+        "conversation_history": history,
+        "current_phase": "EXPLORATION",
+        "key_facts": ["fakt"] * 5,
+        "open_questions_count": turns,
+    }
+
+
+def run_case(
+    name: str, backend: FileBackend, threads: int, users: int, turns: int
+) -> None:
+    latencies: list[float] = []
+    lock = threading.Lock()
+
+    def worker(worker_id: int) -> None:
+        own = [f"u{worker_id}_{i}" for i in range(users // threads)]
+        local: list[float] = []
+        for turn in range(1, turns + 1):
+            for user_id in own:
+                started = time.perf_counter()
+                backend.save(user_id, _state(user_id, turn))
+                local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    extra = ""
+    if backend.group_commit is not None:
+        gc = backend.group_commit
+        extra = f"  fsync batches={gc.batches} (files={gc.synced_files}, dirs={gc.synced_dirs})"
+    print(
+        f"{name:<28} {len(latencies) / elapsed:>9.0f} saves/s  "
+        f"p50={p50:6.2f}ms  p99={p99:7.2f}ms{extra}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--users", type=int, default=64)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--dir", type=Path, default=None, help="Target directory")
+    args = parser.parse_args()
+
+    cases = [
+        ("no fsync", dict(fsync=False)),
+        ("fsync", dict(fsync=True)),
+        ("fsync + group commit", dict(fsync=True, group_commit=GroupCommitter())),
+        (
+            "fsync + group commit 1ms",
+            dict(fsync=True, group_commit=GroupCommitter(window_ms=1.0)),
+        ),
+    ]
+    print(
+        f"threads={args.threads} users={args.users} turns={args.turns} "
+        f"(saves per case: {args.users // args.threads * args.threads * args.turns})"
+    )
+    for name, kwargs in cases:
+        with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+            run_case(name, FileBackend(Path(tmp), **kwargs), args.threads, args.users, args.turns)
+
+
+if __name__ == "__main__":
+    main()
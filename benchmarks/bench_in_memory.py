@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+InMemoryBackend: copy overhead, lock contention and the shared store.
+
+- copy:       per save+load pair, deep copies (old behaviour) vs codec-encoded
+              immutable snapshots
+- contention: save+load throughput of N threads on distinct users and on one
+              user, with 1 lock (global) vs striped locks
+- shared:     the same work from N processes through the shared store process
+
+Run:
+    python -m benchmarks.bench_in_memory [--threads 8] [--ops 2000] [--processes 4]
+"""
+
+from __future__ import annotations
+
+import argparse
+import copy
+import multiprocessing
+import secrets
+import socket
+import threading
+import time
+
+from benchmarks.bench_codecs import _generated_states
+from persistence.codecs import StateCodec
+from persistence.in_memory import InMemoryBackend
+from persistence.shared_store import DEFAULT_STRIPES, StripedStore, connect, start_server
+
+
+def bench_copy(states: list[dict], repeat: int) -> None:
+    cases = [("deepcopy", lambda s: copy.deepcopy(copy.deepcopy(s)))]
+    for fmt in ("json", "msgpack"):
+        try:
+            codec = StateCodec(fmt)
+        except Exception:  # msgpack not installed
+            continue
+        cases.append((f"codec {fmt}", lambda s, c=codec: c.decode(c.encode(s))))
+
+    print("copy overhead (save + load of one state)")
+    for name, fn in cases:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for state in states:
+                fn(state)
+        per_state = (time.perf_counter() - started) / (repeat * len(states)) * 1e6
+        print(f"  {name:<16} {per_state:>8.1f}us")
+
+
+def _hammer(backend: InMemoryBackend, threads: int, ops: int, states, same_user: bool):
+    def worker(worker_id: int) -> None:
+        for i in range(ops):
+            user_id = "shared" if same_user else f"u{worker_id}_{i % 16}"
+            backend.save(user_id, states[i % len(states)])
+            backend.load(user_id)
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return threads * ops / (time.perf_counter() - started)
+
+
+def bench_contention(states: list[dict], threads: int, ops: int) -> None:
+    print(f"contention ({threads} threads x {ops} save+load)")
+    for stripes in (1, DEFAULT_STRIPES):
+        for same_user in (False, True):
+            backend = InMemoryBackend(store=StripedStore(stripes=stripes))
+            rate = _hammer(backend, threads, ops, states, same_user)
+            users = "one user" if same_user else "distinct users"
+            print(f"  stripes={stripes:<3} {users:<15} {rate:>9.0f} ops/s")
+
+
+def _shared_worker(address: str, authkey: str, worker_id: int, ops: int, states):
+    backend = InMemoryBackend(store=connect(address, authkey))
+    started = time.perf_counter()
+    for i in range(ops):
+        user_id = f"p{worker_id}_{i % 16}"
+        backend.save(user_id, states[i % len(states)])
+        backend.load(user_id)
+    return time.perf_counter() - started
+
+
+def bench_shared(states: list[dict], processes: int, ops: int) -> None:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    address, authkey = f"127.0.0.1:{port}", secrets.token_hex(16)
+    manager = start_server(address, authkey)
+    try:
+        local = InMemoryBackend()
+        started = time.perf_counter()
+        for i in range(ops):
+            local.save(f"u{i % 16}", states[i % len(states)])
+            local.load(f"u{i % 16}")
+        local_us = (time.perf_counter() - started) / ops * 1e6
+
+        print(f"shared store ({processes} processes x {ops} save+load)")
+        print(f"  private store, 1 process  {local_us:>8.1f}us per save+load")
+        for n in (1, processes):
+            with multiprocessing.Pool(n) as pool:
+                started = time.perf_counter()
+                elapsed = pool.starmap(
+                    _shared_worker,
+                    [(address, authkey, w, ops, states) for w in range(n)],
+                )
+                wall = time.perf_counter() - started
+            per_op = sum(elapsed) / (n * ops) * 1e6
+            print(
+                f"  shared store, {n} process(es) {per_op:>6.1f}us per save+load, "
+                f"{n * ops / wall:>8.0f} ops/s total"
+            )
+    finally:
+        manager.shutdown()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=50, help="Distinct sample states")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=2000)
+    parser.add_argument("--processes", type=int, default=4)
+    args = parser.parse_args()
+
+    states = _generated_states(args.users)
+    bench_copy(states, args.repeat)
+    bench_contention(states, args.threads, args.ops)
+    bench_shared(states, args.processes, args.ops)
+
+
+if __name__ == "__main__":
+    main()
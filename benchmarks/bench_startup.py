@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Startup cost: import time of the entry points, with a regression budget.
+
+Each module is imported in a fresh interpreter under `python -X importtime`
+(best of --repeat runs; OPENAI_API_KEY unset, so importing must work offline).
+A module fails when its cumulative import time exceeds its budget or when it
+pulls in a module it must load only on demand (gradio, openai, instructor).
+
+Run:
+    python -m benchmarks.bench_startup [--repeat 5] [--top 10]
+
+Exits with status 1 on any failure (usable as a CI check).
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Cumulative import time budget (ms), about 2x the measured time; modules
+# that must not be imported while importing each entry point
+BUDGETS: dict[str, tuple[float, tuple[str, ...]]] = {
+    "config": (100, ("openai", "instructor", "gradio")),
+    "engine.pipeline": (500, ("openai", "instructor", "gradio")),
+    "cli": (500, ("openai", "instructor", "gradio")),
+    "api": (600, ("openai", "instructor", "gradio")),
+    "app": (8000, ("openai", "instructor")),
+}
+
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def _import_once(module: str) -> tuple[dict[str, tuple[int, int]], set[str]]:
+    """{module: (self us, cumulative us)} and the set of loaded module names."""
+    env = {k: v for k, v in os.environ.items() if k != "OPENAI_API_KEY"}
+    code = f"import sys, {module}; print('\\n'.join(sys.modules))"
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    times = {}
+    for line in proc.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            times[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+    return times, set(proc.stdout.split())
+
+
+def bench_module(module: str, repeat: int, top: int) -> bool:
+    budget_ms, forbidden = BUDGETS[module]
+    runs = [_import_once(module) for _ in range(repeat)]
+    best = min(times[module][1] for times, _ in runs) / 1000
+    loaded = runs[0][1]
+
+    # Heaviest top-level packages by self time (first run)
+    per_package: dict[str, int] = defaultdict(int)
+    for name, (self_us, _) in runs[0][0].items():
+        per_package[name.split(".")[0]] += self_us
+    heaviest = sorted(per_package.items(), key=lambda kv: -kv[1])[:top]
+
+    leaked = sorted(m for m in forbidden if m in loaded)
+    ok = best <= budget_ms and not leaked
+    status = "ok" if ok else "FAIL"
+    print(f"  {module:<16} {best:>8.1f}ms  budget {budget_ms:>6.0f}ms  {status}")
+    if leaked:
+        print(f"    imports on demand-only modules: {', '.join(leaked)}")
+    print(
+        "    heaviest: "
+        + ", ".join(f"{name} {us / 1000:.0f}ms" for name, us in heaviest)
+    )
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=5, help="Heaviest packages shown")
+    parser.add_argument("modules", nargs="*", default=list(BUDGETS))
+    args = parser.parse_args()
+
+    print(f"startup (cumulative import time, best of {args.repeat})")
+    results = [bench_module(m, args.repeat, args.top) for m in args.modules]
+    if not all(results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Command-line coach: the same turn pipeline as the UI, without gradio.
+
+Run:
+    python cli.py chat [--user-id ID]            # interactive session
+    python cli.py turn [--user-id ID] MESSAGE    # one turn, reply on stdout
+    python cli.py state [--user-id ID] [--fields a,b]
+    python cli.py reset [--user-id ID]
+
+Replies are streamed as they are generated (--no-stream waits for the whole
+reply). Nothing here imports gradio, and openai/instructor load only when a
+turn first calls the LLM.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from typing import Optional
+
+from config import Config
+from engine.pipeline import get_pipeline
+
+
+def _print_token(text: str) -> None:
+    print(text, end="", flush=True)
+
+
+def _turn(user_id: str, message: str, stream: bool) -> None:
+    if stream:
+        result = get_pipeline().run(user_id, message, on_token=_print_token)
+        print()
+    else:
+        result = get_pipeline().run(user_id, message)
+        print(result.reply)
+    if Config.DEBUG and result.changes:
+        print(f"[CLI] changed: {json.dumps(result.changes, ensure_ascii=False)}")
+
+
+def _chat(user_id: str, stream: bool) -> None:
+    print(f"{Config.COACH_NAME} ({user_id}) - Ctrl+D to quit")
+    while True:
+        try:
+            message = input("> ")
+        except (EOFError, KeyboardInterrupt):
+            print()
+            return
+        if message.strip():
+            _turn(user_id, message, stream)
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """CLI entry point."""
+    parser = argparse.ArgumentParser(description="Life Coach on the command line.")
+    parser.add_argument("command", choices=["chat", "turn", "state", "reset"])
+    parser.add_argument("message", nargs="*", help="Message (turn)")
+    parser.add_argument("--user-id", default=Config.DEFAULT_USER_ID)
+    parser.add_argument("--fields", help="Comma-separated state fields (state)")
+    parser.add_argument("--no-stream", action="store_true", help="Print replies whole")
+    args = parser.parse_intermixed_args(argv)
+
+    if args.command == "chat":
+        _chat(args.user_id, stream=not args.no_stream)
+    elif args.command == "turn":
+        if not args.message:
+            parser.error("turn needs a message")
+        _turn(args.user_id, " ".join(args.message), stream=not args.no_stream)
+    elif args.command == "state":
+        fields = args.fields.split(",") if args.fields else None
+        state = get_pipeline().storage.load(args.user_id, fields=fields)
+        if state is None:
+            sys.exit(f"No state for {args.user_id}")
+        print(json.dumps(state, ensure_ascii=False, indent=2))
+    elif args.command == "reset":
+        if get_pipeline().reset(args.user_id):
+            print(f"[CLI] State of {args.user_id} cleared")
+        else:
+            print(f"[CLI] No state for {args.user_id}")
+
+if __name__ == "__main__":
+    main()
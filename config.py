@@ -14,6 +14,36 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# Bledne liczby z env: nazwa -> surowa wartosc; zglasza je Config.validate()
+_INVALID_ENV: dict[str, str] = {}
+
+
+def _env_number(name: str, default, cast=int, minimum=1):
+    """
+    Czyta liczbe z env bez wyjatku przy imporcie: bledna wartosc (nie liczba
+    albo ponizej `minimum`) daje `default` i trafia do _INVALID_ENV.
+
+    Args:
+        name: Nazwa zmiennej srodowiskowej
+        default: Wartosc, gdy zmiennej brak albo jest bledna
+        cast: int albo float
+        minimum: Najmniejsza poprawna wartosc
+
+    Returns:
+        Wartosc zmiennej albo `default`
+    """
+    raw = os.getenv(name, "").strip()
+    if not raw:
+        return default
+    try:
+        value = cast(raw)
+    except ValueError:
+        value = None
+    if value is None or not minimum <= value < float("inf"):
+        _INVALID_ENV[name] = raw
+        return default
+    return value
+
 
 class Config:
     """
@@ -35,13 +65,6 @@ class Config:
     TEMPERATURE = 0.0
     MAX_TOKENS = 10_000
 
-    # Sprawdzenie czy klucz API istnieje
-    if not OPENAI_API_KEY:
-        raise ValueError(
-            "OPENAI_API_KEY nie znaleziony! "
-            "Upewnij sie, ze plik .env zawiera: OPENAI_API_KEY=sk-..."
-        )
-
     # Sciezki
     BASE_DIR = Path(__file__).parent
     TEMPLATES_DIR = BASE_DIR / "templates"  # Main templates (main.j2)
@@ -49,16 +72,143 @@ class Config:
         BASE_DIR / "memory" / "templates"
     )  # Memory templates (core.j2, etc.)
     DATA_DIR = BASE_DIR / "data"  # Storage directory for file backend
+    PROFILES_DIR = DATA_DIR / "profiles"  # Semantic profiles (consolidator)
+    SQLITE_PATH = DATA_DIR / "coach.db"  # Database for sqlite backend
 
     # Domyslne wartosci coacha
     COACH_NAME = "Coach Majkel Bagieta"  # TODO: Mozesz zmienic na wlasne imie (np. "Nova", "Jasiu")
     DEFAULT_USER_ID = "default_user"
 
     # Persistence
-    PERSISTENCE_BACKEND = "file"  # Mozliwe: "in_memory", "redis", "postgres"
+    PERSISTENCE_BACKEND = "file"  # Mozliwe: "in_memory", "file", "sqlite", "redis"
+    REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    REDIS_PREFIX = "coach"  # Przestrzen nazw kluczy w Redis
+    # FileBackend: fsync przed zakonczeniem zapisu (trwalosc kosztem szybkosci)
+    FILE_FSYNC = os.getenv("FILE_FSYNC", "false").lower() == "true"
+    FILE_GROUP_COMMIT = False  # Grupowanie fsync (wlacz po pomiarze: benchmarks/bench_file_backend.py)
+    FILE_GROUP_COMMIT_MS = 0.0  # Dodatkowe okno czekania lidera na kolejne zapisy
+    # Backend in_memory wspoldzielony przez kilka procesow (persistence/shared_store.py)
+    SHARED_STORE_ADDRESS = os.getenv("SHARED_STORE_ADDRESS") or None  # np. "127.0.0.1:50055"
+    SHARED_STORE_AUTHKEY = os.getenv("SHARED_STORE_AUTHKEY", "")
+    # Pula watkow dla async API persystencji (aload/asave, persistence/aio.py)
+    PERSISTENCE_THREADS = 8
+    # Kodek zapisu stanu (persistence/codecs.py): "json" lub "msgpack"
+    STATE_CODEC = os.getenv("STATE_CODEC", "json")
+    STATE_COMPRESSION = os.getenv("STATE_COMPRESSION") or None  # None, "zlib", "zstd"
+    STATE_COMPRESSION_LEVEL = 3
+    STATE_CODEC_DICT = DATA_DIR / "codec.dict"  # Slownik: python -m persistence.codecs train
+    # Cache stanu z zapisem odroczonym (persistence/cached.py). Domyslnie
+    # wylaczony: przy awarii procesu ginie do CACHE_FLUSH_INTERVAL_S zapisanych
+    # tur. Nigdy nad backendem, do ktorego pisza inne procesy (file, sqlite,
+    # redis, wspoldzielony in_memory): czytalyby nawzajem nieaktualne stany.
+    STATE_CACHE_ENABLED = os.getenv("STATE_CACHE_ENABLED", "false").lower() == "true"
+    CACHE_MAX_ENTRIES = 1024  # Pojemnosc LRU (liczba uzytkownikow)
+    CACHE_IDLE_TTL_S = 900.0  # Usuwanie z cache po tylu sekundach bezczynnosci
+    CACHE_FLUSH_INTERVAL_S = 1.0  # Co ile sekund zapisywac zmiany do backendu
+    # Archiwum nieaktywnych uzytkownikow (persistence/lifecycle.py)
+    ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "false").lower() == "true"
+    ARCHIVE_DIR = DATA_DIR / "archive"
+    ARCHIVE_TTL_DAYS = 30.0  # Po tylu dniach bez zapisu stan trafia do archiwum
+    ARCHIVE_SWEEP_INTERVAL_S = 3600.0  # Co ile sekund szukac nieaktywnych
+
+    # Idempotentne tury: ile ostatnich request_id na uzytkownika i jak dlugo
+    TURN_DEDUP_WINDOW = 16
+    TURN_DEDUP_TTL_S = 600.0
+
+    # Circuit breaker wokol wywolan LLM (utils/circuit_breaker.py): gdy LLM
+    # zawodzi, tury dostaja odpowiedz z szablonow skills/ (engine/fallback.py)
+    LLM_BREAKER_ENABLED = os.getenv("LLM_BREAKER_ENABLED", "true").lower() == "true"
+    LLM_BREAKER_WINDOW = 20  # Ile ostatnich wywolan brac pod uwage
+    LLM_BREAKER_MIN_CALLS = 5  # Minimum wywolan w oknie, zanim obwod moze sie otworzyc
+    LLM_BREAKER_FAILURE_RATE = 0.5  # Udzial bledow i wolnych wywolan, ktory go otwiera
+    LLM_BREAKER_SLOW_CALL_S = 30.0  # Wywolanie dluzsze niz tyle liczy sie jak blad
+    LLM_BREAKER_OPEN_S = 30.0  # Ile obwod zostaje otwarty przed proba (half-open)
+    LLM_BREAKER_PROBES = 1  # Udane proby z rzedu, ktore go zamykaja
+
+    # Sprawiedliwy podzial LLM miedzy uzytkownikow (utils/scheduler.py);
+    # liczby z env przez _env_number(): bledna wartosc nie psuje importu
+    TURN_SLOTS = _env_number("TURN_SLOTS", 8)  # Tury naraz (wszyscy uzytkownicy)
+    # Tempo tur uzytkownika (na minute)
+    TURN_RATE_PER_MIN = _env_number("TURN_RATE_PER_MIN", 20.0, float, 0.001)
+    TURN_BURST = _env_number("TURN_BURST", 5)  # Ile tur naraz ponad to tempo
+    MAX_QUEUED_TURNS_PER_USER = 3  # Tury czekajace za biezaca; kolejne -> "slow down"
+    # Wagi uzytkownikow, np. "alice:2,batch-bot:0.5" (domyslnie 1); surowy
+    # tekst, parsowany w user_weights(), zeby zla wartosc nie psula importu
+    USER_WEIGHTS = os.getenv("USER_WEIGHTS", "")
 
     # Limity konwersacji (dla context window)
     MAX_HISTORY_MESSAGES = 10  # Ile ostatnich wiadomosci przekazywac do LLM
 
+    # Konsolidacja pamieci semantycznej (offline, memory/logic/consolidator.py)
+    PROFILE_MAX_ITEMS = 10  # Limit elementow na liste w profilu
+
+    # Kolejka Gradio (app.py): ile zdarzen kazdej grupy moze dzialac naraz;
+    # CHAT_CONCURRENCY > TURN_SLOTS, zeby czekajace tury ustawial FairScheduler
+    CHAT_CONCURRENCY = _env_number("CHAT_CONCURRENCY", 16)
+    # Ewaluacje (dlugie wywolania LLM) to zadania w tle (utils/jobs.py): ile naraz
+    EVAL_CONCURRENCY = _env_number("EVAL_CONCURRENCY", 2)
+    EVAL_TIMEOUT_S = 180.0  # Limit czasu jednej ewaluacji
+    EVAL_CACHE_ENTRIES = 256  # Wyniki per (uzytkownik, hash rozmowy, filtr)
+    EXPORT_CONCURRENCY = _env_number("EXPORT_CONCURRENCY", 4)
+    QUEUE_MAX_SIZE = _env_number("QUEUE_MAX_SIZE", 256, minimum=0)  # 0 = bez limitu
+
+    # API HTTP/WebSocket dla klientow programowych (api.py)
+    API_ENABLED = os.getenv("API_ENABLED", "false").lower() == "true"  # Pod /api obok UI
+    API_PORT = _env_number("API_PORT", 8081)  # Tylko dla samodzielnego python api.py
+    API_KEEPALIVE_S = 75  # Jak dlugo trzymac bezczynne polaczenie keep-alive
+    # Metryki w formacie Prometheus pod /metrics (utils/metrics.py)
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
     # Debug mode
     DEBUG = os.getenv("DEBUG", "true").lower() == "true"
+
+    @classmethod
+    def validate(cls) -> None:
+        """
+        Sprawdza konfiguracje przy pierwszym uzyciu (get_llm_client), nie przy
+        imporcie: narzedzia i testy bez LLM dzialaja bez klucza API.
+
+        Raises:
+            ValueError: Brak OPENAI_API_KEY, bledne USER_WEIGHTS albo bledna
+                liczba w env (np. TURN_SLOTS=abc)
+        """
+        cls.user_weights()
+        if _INVALID_ENV:
+            invalid = ", ".join(f"{name}={raw!r}" for name, raw in _INVALID_ENV.items())
+            raise ValueError(f"Bledne liczby w env: {invalid}")
+        # Klucz mogl zostac ustawiony po imporcie (np. w tescie)
+        cls.OPENAI_API_KEY = cls.OPENAI_API_KEY or os.getenv("OPENAI_API_KEY")
+        if not cls.OPENAI_API_KEY:
+            raise ValueError(
+                "OPENAI_API_KEY nie znaleziony! "
+                "Upewnij sie, ze plik .env zawiera: OPENAI_API_KEY=sk-..."
+            )
+
+    @classmethod
+    def user_weights(cls) -> dict[str, float]:
+        """
+        Parsuje USER_WEIGHTS ("alice:2,batch-bot:0.5") do slownika wag.
+
+        Returns:
+            Waga per uzytkownik (pominieci maja wage 1)
+
+        Raises:
+            ValueError: Wpis bez "uzytkownik:waga", waga nie jest liczba albo
+                nie jest dodatnia
+        """
+        weights = {}
+        for item in cls.USER_WEIGHTS.split(","):
+            if not item.strip():
+                continue
+            user, _, raw = item.partition(":")
+            try:
+                weight = float(raw)
+            except ValueError:
+                weight = None
+            if not user.strip() or weight is None or not 0 < weight < float("inf"):
+                raise ValueError(
+                    f"USER_WEIGHTS: bledny wpis {item.strip()!r}, "
+                    "oczekiwano uzytkownik:waga z waga > 0 (np. alice:2)"
+                )
+            weights[user.strip()] = weight
+        return weights
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Cancellation of abandoned turns.
+
+A turn nobody waits for any more (newer message, Clear, closed tab or
+connection) is cancelled through its CancelToken:
+
+    token = CancelToken()
+    await pipeline.arun(user_id, message, cancel=token)
+    token.cancel(CANCEL_RESET)        # from anywhere (any thread)
+
+The pipeline checks the token before the LLM call and before saving, and the
+LLM client aborts the streamed HTTP request the moment the token fires
+(engine/client.py), so a cancelled turn stops paying for tokens and never
+writes a reply. A superseded turn still saves its user message (the newer
+turn answers it); a reset or abandoned turn writes nothing.
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import Callable, Optional
+
+# Reasons (label values of coach_turns_cancelled_total)
+CANCEL_SUPERSEDED = "superseded"  # the user sent a newer message
+CANCEL_RESET = "reset"  # the conversation was cleared
+CANCEL_DISCONNECTED = "disconnected"  # the client went away
+
+
+class TurnCancelled(Exception):
+    """Raised inside a turn whose token was cancelled; no reply was saved."""
+
+    def __init__(self, reason: str):
+        super().__init__(f"Turn cancelled ({reason})")
+        self.reason = reason
+
+
+class CancelToken:
+    """One-shot, thread-safe cancellation flag of a turn."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._callbacks: list[Callable[[], None]] = []
+        self.reason: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None
+
+    def cancel(self, reason: str) -> bool:
+        """
+        Cancel the turn and run the registered callbacks.
+
+        Returns:
+            False if the token was already cancelled
+        """
+        with self._lock:
+            if self.reason is not None:
+                return False
+            self.reason = reason
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as exc:  # one failing abort must not stop the others
+                print(f"[Cancel] Callback failed: {exc}")
+        return True
+
+    def check(self) -> None:
+        """Checkpoint: raise TurnCancelled if the token was cancelled."""
+        if self.reason is not None:
+            raise TurnCancelled(self.reason)
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """
+        Call `callback()` when the token is cancelled (at once if it already is).
+
+        Returns:
+            Function that unregisters the callback
+        """
+        with self._lock:
+            if self.reason is None:
+                self._callbacks.append(callback)
+                return lambda: self._discard(callback)
+        callback()
+        return lambda: None
+
+    def _discard(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
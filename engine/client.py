@@ -3,14 +3,220 @@
 LLM Client - wrapper for OpenAI API with Instructor (structured output).
 
 This module provides the only place for LLM calls in the entire system.
+
+openai and instructor are imported on the first call (they take over a second
+to import), so modules that merely import this one start fast and offline.
+
+Calls go through a circuit breaker (LLM_BREAKER, utils/circuit_breaker.py):
+after too many failed or slow calls (streamed calls: slow to their first
+chunk) they raise CircuitOpen at once, and the turn pipeline answers from
+templates (engine/fallback.py) until a probe call succeeds again.
+
+Streamed calls can be cancelled (engine/cancellation.py): the token closes the
+HTTP response, which aborts the generation upstream, and the completion tokens
+the request did not produce are counted as avoided (estimated from the mean
+completion size of finished requests).
 """
 
+import functools
+import socket
+import threading
+from contextlib import contextmanager, nullcontext
 from functools import lru_cache
-from typing import List, Optional, Any
-from openai import OpenAI
-import instructor
+from typing import Any, Callable, Iterator, List, Optional
+from engine.cancellation import CancelToken, TurnCancelled
+from utils.circuit_breaker import CircuitBreaker
+from utils.metrics import REGISTRY
 from config import Config
 
+LLM_REQUESTS = REGISTRY.counter(
+    "coach_llm_requests_total", "Requests sent to the LLM API (incl. retries)", ["outcome"]
+)
+LLM_RETRIES = REGISTRY.counter(
+    "coach_llm_retries_total", "Repeated requests after invalid structured output"
+)
+LLM_TOKENS = REGISTRY.counter(
+    "coach_llm_tokens_total", "Tokens reported by the LLM API", ["kind"]
+)
+LLM_CANCELLED = REGISTRY.counter(
+    "coach_llm_cancelled_total", "Streamed requests aborted by a cancelled turn"
+)
+LLM_CANCELLED_TOKENS = REGISTRY.counter(
+    "coach_llm_cancelled_tokens_total",
+    "Completion tokens of aborted requests (estimated): received or avoided",
+    ["kind"],
+)
+
+LLM_BREAKER = CircuitBreaker(
+    "llm",
+    window=Config.LLM_BREAKER_WINDOW,
+    min_calls=Config.LLM_BREAKER_MIN_CALLS,
+    failure_rate=Config.LLM_BREAKER_FAILURE_RATE,
+    slow_call_s=Config.LLM_BREAKER_SLOW_CALL_S,
+    open_s=Config.LLM_BREAKER_OPEN_S,
+    probes=Config.LLM_BREAKER_PROBES,
+    # A cancelled turn says nothing about the LLM
+    ignore=(TurnCancelled,),
+)
+
+# Rough size of a token in characters (for streamed text without usage)
+CHARS_PER_TOKEN = 4
+
+# State of the structured call running on this thread: requests made
+# (count) and the token that cancels it (cancel)
+_call = threading.local()
+
+
+class _CompletionSize:
+    """Moving average of completion tokens of finished requests."""
+
+    def __init__(self, weight: float = 0.1):
+        self.weight = weight
+        self.mean: Optional[float] = None
+
+    def add(self, tokens: int) -> None:
+        if self.mean is None:
+            self.mean = float(tokens)
+        else:
+            self.mean += self.weight * (tokens - self.mean)
+
+
+_completion_size = _CompletionSize()
+
+
+def _record_usage(usage: Any) -> None:
+    LLM_TOKENS.labels(kind="prompt").inc(usage.prompt_tokens or 0)
+    LLM_TOKENS.labels(kind="completion").inc(usage.completion_tokens or 0)
+    if usage.completion_tokens:
+        _completion_size.add(usage.completion_tokens)
+
+
+def _record_cancelled(received_chars: int) -> None:
+    received = received_chars / CHARS_PER_TOKEN
+    LLM_CANCELLED.inc()
+    LLM_CANCELLED_TOKENS.labels(kind="received").inc(received)
+    # Unknown until a request finished: nothing is claimed as avoided
+    if _completion_size.mean is not None:
+        LLM_CANCELLED_TOKENS.labels(kind="avoided").inc(
+            max(0.0, _completion_size.mean - received)
+        )
+
+
+def _guarded() -> Any:
+    """Context of one LLM call: the circuit breaker (CircuitOpen) if enabled."""
+    return LLM_BREAKER.call() if Config.LLM_BREAKER_ENABLED else nullcontext()
+
+
+def _guarded_stream(open_stream: Callable[[], Iterator[Any]]) -> Iterator[Any]:
+    """Chunks of one streamed LLM call, through the breaker if enabled."""
+    if Config.LLM_BREAKER_ENABLED:
+        # Timed to the first chunk only: long replies are not slow calls
+        return LLM_BREAKER.stream(open_stream)
+    return open_stream()
+
+
+@contextmanager
+def _reporting_cancel(cancel: Optional[CancelToken]) -> Iterator[None]:
+    """Report any failure of a cancelled call as TurnCancelled."""
+    try:
+        yield
+    except Exception as exc:
+        if cancel is not None and cancel.cancelled and not isinstance(exc, TurnCancelled):
+            # Instructor may wrap the abort (e.g. in its retry error)
+            raise TurnCancelled(cancel.reason) from exc
+        raise
+
+
+def _abort(stream: Any) -> None:
+    """Abort a streamed response from another thread than the reading one."""
+    # Closing the response does not wake a read blocked on the socket (e.g.
+    # while the model has not sent its first token); shutting it down does,
+    # and the reading thread then closes the response itself
+    network = stream.response.extensions.get("network_stream")
+    sock = network.get_extra_info("socket") if network is not None else None
+    if sock is None:
+        stream.close()
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:  # already closed
+        pass
+
+
+def _watch_stream(stream: Any, cancel: Optional[CancelToken]) -> Iterator[Any]:
+    """Iterate a raw streamed response: record its usage, abort it on cancel."""
+    unregister = None
+    if cancel is not None:
+        unregister = cancel.on_cancel(lambda: _abort(stream))
+    received = 0
+    completed = False
+    try:
+        for chunk in stream:
+            if cancel is not None:
+                cancel.check()
+            # The last chunk carries the usage (stream_options) and no choices
+            usage = getattr(chunk, "usage", None)
+            if usage is not None:
+                _record_usage(usage)
+            for choice in chunk.choices or ():
+                received += len(choice.delta.content or "")
+            yield chunk
+        completed = True
+    except Exception as exc:
+        if cancel is not None and cancel.cancelled and not isinstance(exc, TurnCancelled):
+            # The read failed because the response was closed under it
+            raise TurnCancelled(cancel.reason) from exc
+        raise
+    finally:
+        if unregister is not None:
+            unregister()
+        stream.close()
+        if not completed and cancel is not None and cancel.cancelled:
+            _record_cancelled(received)
+
+
+def _counting_requests(create: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Wrap the raw API call: count every request and its token usage; streamed
+    responses are watched for cancellation (see _watch_stream).
+    """
+
+    @functools.wraps(create)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        cancel = getattr(_call, "cancel", None)
+        if cancel is not None:
+            cancel.check()  # no new request (e.g. a retry) for a cancelled turn
+        _call.count = getattr(_call, "count", 0) + 1
+        try:
+            response = create(*args, **kwargs)
+        except Exception:
+            LLM_REQUESTS.labels(outcome="error").inc()
+            raise
+        LLM_REQUESTS.labels(outcome="ok").inc()
+        if kwargs.get("stream"):
+            return _watch_stream(response, cancel)
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            _record_usage(usage)
+        return response
+
+    return wrapper
+
+
+def _counting_retries(create: Callable[..., Any]) -> Callable[..., Any]:
+    """Wrap Instructor's call: requests beyond the first one are retries."""
+
+    @functools.wraps(create)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        _call.count = 0
+        try:
+            return create(*args, **kwargs)
+        finally:
+            if _call.count > 1:
+                LLM_RETRIES.inc(_call.count - 1)
+
+    return wrapper
+
 
 @lru_cache()
 def get_llm_client():
@@ -25,11 +231,20 @@ def get_llm_client():
 
     NOTE: This function is complete - no modification needed.
     """
+    from openai import OpenAI
+    import instructor
+
+    Config.validate()
     client = OpenAI(
         api_key=Config.OPENAI_API_KEY,
         base_url=Config.OPENAI_BASE_URL  # Custom base URL for dataworkshop.eu
     )
-    return instructor.patch(client, mode=instructor.Mode.MD_JSON)
+    # Metrics (utils/metrics.py): Instructor retries by calling the raw
+    # create again, so requests are counted below it and retries above it
+    client.chat.completions.create = _counting_requests(client.chat.completions.create)
+    client = instructor.patch(client, mode=instructor.Mode.MD_JSON)
+    client.chat.completions.create = _counting_retries(client.chat.completions.create)
+    return client
 
 
 def call_llm(
@@ -49,6 +264,9 @@ def call_llm(
         - If response_model provided: Pydantic model instance
         - If response_model=None: String (plain text)
 
+    Raises:
+        CircuitOpen: Recent calls failed or were too slow (LLM_BREAKER)
+
     Example usage without structured output:
     ```python
     messages = [
@@ -81,11 +299,68 @@ def call_llm(
     }
     default_params.update(kwargs)
 
-    if response_model:
-        # Structured output (Pydantic model)
-        default_params["response_model"] = response_model
-        return client.chat.completions.create(**default_params)
-    else:
-        # Plain text (no structured output) - level 1
-        response = client.chat.completions.create(**default_params)
-        return response.choices[0].message.content
+    with _guarded():
+        if response_model:
+            # Structured output (Pydantic model)
+            default_params["response_model"] = response_model
+            return client.chat.completions.create(**default_params)
+        else:
+            # Plain text (no structured output) - level 1
+            response = client.chat.completions.create(**default_params)
+            return response.choices[0].message.content
+
+
+def stream_llm(
+    messages: List[dict],
+    response_model: Any,
+    cancel: Optional[CancelToken] = None,
+    **kwargs
+) -> Iterator[Any]:
+    """
+    Calls LLM API with streamed structured output.
+
+    Args:
+        messages: List of messages (as in call_llm)
+        response_model: Pydantic model for structured output
+        cancel: Aborts the request (closes the HTTP response) when cancelled
+        **kwargs: Additional parameters (temperature, max_tokens, etc.)
+
+    Yields:
+        Partial instances of response_model (every field optional), each one
+        more complete than the previous; fields fill in the order they are
+        declared. The last one holds the complete output.
+
+    Raises:
+        CircuitOpen: Recent calls failed or were too slow (LLM_BREAKER)
+        TurnCancelled: The token was cancelled before the output was complete
+    """
+    import instructor
+
+    client = get_llm_client()
+
+    params = {
+        "model": Config.MODEL_NAME,
+        "messages": messages,
+        "temperature": Config.TEMPERATURE,
+        "max_tokens": Config.MAX_TOKENS,
+    }
+    params.update(kwargs)
+    params["response_model"] = instructor.Partial[response_model]
+    params["stream"] = True
+    # The complete object is validated from parsed JSON (python mode), where
+    # strict validation would reject enum values given as strings
+    params.setdefault("strict", False)
+    # Usage of streamed requests arrives in a last, choice-less chunk
+    params.setdefault("stream_options", {"include_usage": True})
+
+    # Read by _counting_requests: the raw request runs on this thread while
+    # the partials are consumed
+    def partials() -> Iterator[Any]:
+        with _reporting_cancel(cancel):
+            yield from client.chat.completions.create(**params)
+
+    _call.cancel = cancel
+    try:
+        yield from _guarded_stream(partials)
+    finally:
+        _call.cancel = None
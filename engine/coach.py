@@ -5,13 +5,25 @@ from __future__ import annotations
 Coach Agent - główny agent coachingowy ze Structured Output.
 """
 
-from engine.client import call_llm
+from typing import Callable, Optional
+from engine.cancellation import CancelToken
+from engine.client import call_llm, stream_llm
 from engine.prompter import SystemPrompter
 from memory.schemas.session_state import SessionState
 from memory.schemas.coach_types import CoachResponseAnalysis, CoachingPhase
 from memory.logic.manager import MemoryManager
+from utils.metrics import REGISTRY
 from config import Config
 
+PHASES = REGISTRY.counter(
+    "coach_responses_by_phase_total", "Coach responses per CoachingPhase", ["phase"]
+)
+QUESTION_TYPES = REGISTRY.counter(
+    "coach_responses_by_question_type_total",
+    "Coach responses per QuestionType",
+    ["question_type"],
+)
+
 
 class CoachAgent:
     """
@@ -22,6 +34,9 @@ class CoachAgent:
     - Structured Output (CoachResponseAnalysis) do wymuszenia Chain of Thought
 
     Wspiera kryteria LC-001 do LC-014.
+
+    Udostępnia etapy tury (build_messages -> generate -> apply_response);
+    całą turę orkiestruje engine/pipeline.py (TurnPipeline).
     """
 
     def __init__(self):
@@ -29,27 +44,26 @@ class CoachAgent:
         self.memory_manager = MemoryManager()
         self.prompter = SystemPrompter()
 
-    def respond(
-        self, user_message: str, state: SessionState
-    ) -> tuple[str, SessionState]:
-        """
-        Generuje odpowiedź coacha używając Structured Output.
+    def build_messages(self, state: SessionState) -> list[dict]:
         """
-        # 1. Dodaj wiadomość użytkownika do historii
-        state = self.memory_manager.add_user_message(state, user_message)
+        Buduje listę wiadomości dla LLM (system prompt + ostatnia historia).
 
-        # 2. Pobierz kontekst ostatnich wiadomości
+        Zakłada, że wiadomość użytkownika jest już w `state.conversation_history`
+        (dodaje ją TurnPipeline - jedyny właściciel tego kroku).
+        """
+        # 1. Pobierz kontekst ostatnich wiadomości
         recent_history = self.memory_manager.get_recent_history(
             state, limit=Config.MAX_HISTORY_MESSAGES
         )
 
-        # 3. Zbuduj system prompt dynamicznie (wstrzykujemy stan z pamięci)
+        # 2. Zbuduj system prompt dynamicznie (wstrzykujemy stan z pamięci)
         # Przekazujemy wszystkie pola potrzebne dla kryteriów LC-001 do LC-014
         system_prompt = self.prompter.build_system_prompt(
             core={
                 "coach_name": Config.COACH_NAME,
             },
             profile={
+                "user_id": state.user_id,
                 "user_name": state.user_name,
                 "main_goal": state.main_goal,
             },
@@ -74,18 +88,44 @@ class CoachAgent:
             history=recent_history,
         )
 
-        # 4. Przygotuj strukturę wiadomości dla API
+        # 3. Przygotuj strukturę wiadomości dla API
         messages = [{"role": "system", "content": system_prompt}]
         messages.extend(recent_history)
 
-        # 5. === STRUCTURED OUTPUT ===
-        # Wywołujemy LLM i oczekujemy konkretnego modelu danych
-        response: CoachResponseAnalysis = call_llm(
-            messages, response_model=CoachResponseAnalysis
-        )
+        return messages
 
-        # 6. === AKTUALIZACJA STANU ===
-        # Mapujemy ustrukturyzowaną odpowiedź na trwałą pamięć sesji
+    def generate(
+        self,
+        messages: list[dict],
+        on_token: Optional[Callable[[str], None]] = None,
+        cancel: Optional[CancelToken] = None,
+    ) -> CoachResponseAnalysis:
+        """Wywołuje LLM ze Structured Output (wymuszony Chain of Thought).
+
+        Z on_token odpowiedź jest strumieniowana: on_token dostaje kolejne
+        fragmenty ai_response, gdy tylko nadejdą. Z cancel zapytanie tez idzie
+        strumieniem, zeby anulowanie moglo je przerwac (TurnCancelled).
+        """
+        if on_token is None and cancel is None:
+            return call_llm(messages, response_model=CoachResponseAnalysis)
+
+        sent = ""
+        partial = None
+        parts = stream_llm(messages, response_model=CoachResponseAnalysis, cancel=cancel)
+        for partial in parts:
+            text = partial.ai_response or ""
+            if on_token is not None and len(text) > len(sent) and text.startswith(sent):
+                on_token(text[len(sent):])
+                sent = text
+        if partial is None:
+            raise ValueError("LLM returned an empty stream")
+        # Ostatni fragment jest kompletny: walidacja pelnym modelem
+        return CoachResponseAnalysis.model_validate(partial.model_dump())
+
+    def apply_response(
+        self, state: SessionState, response: CoachResponseAnalysis
+    ) -> SessionState:
+        """Mapuje ustrukturyzowaną odpowiedź na nowy stan sesji."""
         # Przekazujemy wszystkie pola z CoachResponseAnalysis
         state = self.memory_manager.update_from_output(
             state,
@@ -116,6 +156,9 @@ class CoachAgent:
             },
         )
 
+        PHASES.labels(response.coaching_phase.value).inc()
+        QUESTION_TYPES.labels(response.question_type.value).inc()
+
         # Opcjonalny debug w konsoli
         if Config.DEBUG:
             print(f"[CoachAgent] Faza: {response.coaching_phase}")
@@ -127,4 +170,4 @@ class CoachAgent:
             if response.contains_judgment:
                 print(f"[CoachAgent] ⚠️ UWAGA: Odpowiedź zawiera ocenę!")
 
-        return response.ai_response, state
+        return state
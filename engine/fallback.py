@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Degraded-mode responder: a coaching reply without the LLM.
+
+While the LLM circuit is open (engine/client.py, LLM_BREAKER), TurnPipeline
+answers turns with FallbackResponder instead of waiting for a failing
+upstream. Replies are built from the skills/ template banks and chosen by
+the session's current_phase and detected_language:
+
+    not introduced yet          introduction (INTRODUCTION_TEMPLATES_*)
+    ACTION_PLANNING, SUMMARIZING,
+    CLOSING                     paraphrase + ACTION_QUESTIONS_*
+    DEEPENING, EXPLORATION      emotion naming (EMOTION_NAMING_*, when an
+                                emotion is known) or paraphrase
+                                + DEEPENING_QUESTIONS_*
+    other phases                paraphrase (PARAPHRASE_STARTERS_*)
+                                + DEEPENING_QUESTIONS_*
+
+The output is deterministic: the template rotates with the turn number, so
+a replayed turn gets the same reply and consecutive turns differ.
+"""
+
+from __future__ import annotations
+
+from memory.schemas.coach_types import CoachResponseAnalysis, CoachingPhase, QuestionType
+from memory.schemas.session_state import SessionState
+from skills.action import ACTION_QUESTIONS_EN, ACTION_QUESTIONS_PL
+from skills.context import (
+    INTRODUCTION_TEMPLATES_EN,
+    INTRODUCTION_TEMPLATES_PL,
+    PARAPHRASE_STARTERS_EN,
+    PARAPHRASE_STARTERS_PL,
+)
+from skills.exploration import (
+    DEEPENING_QUESTIONS_EN,
+    DEEPENING_QUESTIONS_PL,
+    EMOTION_NAMING_EN,
+    EMOTION_NAMING_PL,
+)
+from config import Config
+
+# Template banks per language (LC-006)
+BANKS = {
+    "pl": {
+        "introduction": INTRODUCTION_TEMPLATES_PL,
+        "paraphrase": PARAPHRASE_STARTERS_PL,
+        "emotion": EMOTION_NAMING_PL,
+        "deepening": DEEPENING_QUESTIONS_PL,
+        "action": ACTION_QUESTIONS_PL,
+    },
+    "en": {
+        "introduction": INTRODUCTION_TEMPLATES_EN,
+        "paraphrase": PARAPHRASE_STARTERS_EN,
+        "emotion": EMOTION_NAMING_EN,
+        "deepening": DEEPENING_QUESTIONS_EN,
+        "action": ACTION_QUESTIONS_EN,
+    },
+}
+
+ACTION_PHASES = {"ACTION_PLANNING", "SUMMARIZING", "CLOSING"}
+EMOTION_PHASES = {"EXPLORATION", "DEEPENING"}
+
+# Longest quoted fragment of the user's message in a paraphrase
+MAX_QUOTE_CHARS = 120
+
+
+def _quote(message: str, language: str) -> str:
+    """The user's message as a short quotation."""
+    text = " ".join(message.split())
+    if len(text) > MAX_QUOTE_CHARS:
+        text = text[:MAX_QUOTE_CHARS].rsplit(" ", 1)[0].rstrip(".!?,;: ") + "..."
+    else:
+        text = text.rstrip(".!?,;: ")
+    return f"„{text}”" if language == "pl" else f'"{text}"'
+
+
+class FallbackResponder:
+    """Deterministic replies from the skills/ templates (no LLM call)."""
+
+    def respond(self, state: SessionState) -> CoachResponseAnalysis:
+        """
+        Reply to the last user message of `state`.
+
+        Args:
+            state: Session state with the user message already appended
+
+        Returns:
+            CoachResponseAnalysis applied like an LLM response; the phase is
+            kept and no facts, goals or emotions are extracted
+        """
+        language = "en" if state.detected_language == "en" else "pl"
+        bank = BANKS[language]
+        phase = state.current_phase or CoachingPhase.INTRODUCTION.value
+        turn = len(state.conversation_history) // 2
+
+        def pick(kind: str) -> str:
+            templates = bank[kind]
+            return templates[turn % len(templates)]
+
+        message = next(
+            (
+                m.get("content", "")
+                for m in reversed(state.conversation_history)
+                if m.get("role") == "user"
+            ),
+            "",
+        )
+
+        if not state.coach_introduced:
+            reply = pick("introduction").format(name=Config.COACH_NAME)
+            question_type = QuestionType.OPEN
+        else:
+            if phase in EMOTION_PHASES and state.detected_emotions:
+                opening = pick("emotion").format(emotion=state.detected_emotions[-1])
+            else:
+                starter = pick("paraphrase").rstrip(".")
+                opening = f"{starter} {_quote(message, language)}." if message else ""
+            if phase in ACTION_PHASES:
+                question, question_type = pick("action"), QuestionType.OPEN
+            else:
+                question, question_type = pick("deepening"), QuestionType.DEEPENING
+            reply = f"{opening} {question}".strip()
+
+        try:
+            coaching_phase = CoachingPhase(phase)
+        except ValueError:
+            coaching_phase = CoachingPhase.EXPLORATION
+
+        return CoachResponseAnalysis(
+            analysis_summary=f"Degraded mode (LLM unavailable): {phase} template reply",
+            coaching_phase=coaching_phase,
+            question_type=question_type,
+            response_language=language,
+            ai_response=reply,
+        )
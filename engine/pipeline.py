@@ -0,0 +1,549 @@
+# -*- coding: utf-8 -*-
+"""
+Turn Pipeline - single owner of every stage of a coaching turn.
+
+    load -> append_user_message -> build_prompt -> llm -> update_state
+         -> persist -> render (new messages + changed fields only)
+
+Each stage is executed exactly once, in one place, and records its own wall
+time. app.py, api.py and any batch tool drive turns through TurnPipeline.run()
+instead of wiring these steps by hand.
+
+Async callers use arun()/areset(): operations on one user run strictly one
+after another in arrival order (two quick messages never both load the same
+state, so no turn is lost to a last-save-wins race), while different users
+run concurrently on worker threads.
+
+Turns may carry a client request id. The last few ids of every user are
+remembered with their results (RecentTurns), so a replayed submission (double
+submit, browser retry) returns the original reply instead of running the LLM
+again and appending the message twice. A replay must carry the same message:
+an id reused with different text runs as a new turn.
+
+Turns nobody waits for any more are cancelled (engine/cancellation.py): a
+newer message of the same user (arun(supersede=True)), a reset, or a caller
+that went away. A cancelled turn aborts its LLM request and saves no reply; a
+superseded one still saves its user message (the newer turn answers both), a
+reset or abandoned one saves nothing.
+
+While the LLM circuit breaker is open (engine/client.py), the llm stage is
+answered by FallbackResponder (engine/fallback.py) in milliseconds; such turns
+are saved as usual and marked degraded.
+
+arun() turns pass admission control and fair scheduling (utils/scheduler.py):
+a user over their turn rate or queue limit gets SlowDown at once, and turn
+slots are shared across users by weighted fair queuing, so one flooding user
+or script cannot starve everyone else of the LLM.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Callable, Iterator, Optional
+
+from engine.cancellation import (
+    CANCEL_DISCONNECTED,
+    CANCEL_RESET,
+    CANCEL_SUPERSEDED,
+    CancelToken,
+    TurnCancelled,
+)
+from engine.coach import CoachAgent
+from engine.fallback import FallbackResponder
+from memory.logic.manager import MemoryManager
+from memory.schemas.session_state import SessionState
+from persistence import get_backend
+from persistence.aio import UserOrdering
+from persistence.backend import PersistenceBackend
+from utils.circuit_breaker import CircuitOpen
+from utils.metrics import REGISTRY
+from utils.scheduler import FairScheduler
+from config import Config
+
+TURN_STAGES = (
+    "load",
+    "append_user_message",
+    "build_prompt",
+    "llm",
+    "update_state",
+    "persist",
+    "render",
+)
+
+TURN_STAGE_SECONDS = REGISTRY.histogram(
+    "coach_turn_stage_seconds", "Wall time of each turn stage", ["stage"]
+)
+TURNS = REGISTRY.counter("coach_turns_total", "Turns run, by outcome", ["outcome"])
+TURNS_IN_FLIGHT = REGISTRY.gauge("coach_turns_in_flight", "Turns currently running")
+TURNS_DEDUPLICATED = REGISTRY.counter(
+    "coach_turns_deduplicated_total", "Replayed submissions answered from RecentTurns"
+)
+TURNS_CANCELLED = REGISTRY.counter(
+    "coach_turns_cancelled_total", "Turns cancelled before saving, by reason", ["reason"]
+)
+
+
+def state_changes(before: SessionState, after: SessionState) -> dict[str, Any]:
+    """Fields other than conversation_history whose value differs."""
+    return {
+        name: getattr(after, name)
+        for name in SessionState.scalar_fields()
+        if getattr(after, name) != getattr(before, name)
+    }
+
+
+@dataclass
+class TurnResult:
+    """Outcome of a single turn."""
+
+    user_id: str
+    reply: str
+    state: SessionState
+    # Chat view (Gradio messages format) of the messages this turn added
+    new_messages: list[dict[str, str]]
+    # Fields the turn changed (see state_changes)
+    changes: dict[str, Any] = field(default_factory=dict)
+    timings_ms: dict[str, float] = field(default_factory=dict)
+    # Time queued before the turn started (arun only): behind earlier
+    # operations of the same user and for a scheduler slot
+    queued_ms: float = 0.0
+    # Answer to a replayed request id (no LLM call; state as currently stored)
+    replayed: bool = False
+    # Reply from FallbackResponder: the LLM circuit was open
+    degraded: bool = False
+
+    @property
+    def chat_history(self) -> list[dict[str, str]]:
+        """Chat view of the whole conversation (rendered on access)."""
+        return TurnPipeline.render_history(self.state)
+
+    @property
+    def total_ms(self) -> float:
+        return sum(self.timings_ms.values())
+
+
+def _digest(message: str) -> str:
+    """Fingerprint of a message: a replay must match the original text."""
+    return hashlib.blake2b(message.encode("utf-8"), digest_size=16).hexdigest()
+
+
+@dataclass
+class _Replay:
+    digest: str
+    reply: str
+    new_messages: list[dict[str, str]]
+    changes: dict[str, Any]
+    at: float
+
+
+class RecentTurns:
+    """
+    Window of the last request ids of every user, with what their turns
+    returned. Keeps replies and changed fields only, not states, and the
+    digest of each message: an id only replays the text it was sent with.
+    """
+
+    def __init__(self, per_user: int = 16, ttl_s: float = 600.0, max_users: int = 10_000):
+        """
+        Args:
+            per_user: Request ids remembered per user
+            ttl_s: Age after which a request id is forgotten
+            max_users: Users tracked (least recently active dropped first)
+        """
+        self.per_user = per_user
+        self.ttl_s = ttl_s
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        self._users: "OrderedDict[str, OrderedDict[str, _Replay]]" = OrderedDict()
+
+    def get(self, user_id: str, request_id: str, message: str) -> Optional[_Replay]:
+        with self._lock:
+            replay = self._users.get(user_id, {}).get(request_id)
+        if (
+            replay is None
+            or time.time() - replay.at > self.ttl_s
+            or replay.digest != _digest(message)
+        ):
+            return None
+        return replay
+
+    def put(
+        self, user_id: str, request_id: str, message: str, result: TurnResult
+    ) -> None:
+        replay = _Replay(
+            _digest(message),
+            result.reply,
+            result.new_messages,
+            result.changes,
+            time.time(),
+        )
+        with self._lock:
+            window = self._users.get(user_id)
+            if window is None:
+                window = self._users[user_id] = OrderedDict()
+            self._users.move_to_end(user_id)
+            window[request_id] = replay
+            while len(window) > self.per_user:
+                window.popitem(last=False)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+
+    def forget(self, user_id: str) -> None:
+        with self._lock:
+            self._users.pop(user_id, None)
+
+
+class TurnPipeline:
+    """
+    Runs a coaching turn end to end.
+
+    Owns loading and persisting state, appending the user message (exactly
+    once), and rendering the chat view. Prompt building, the LLM call and the
+    state update are delegated to CoachAgent's stage methods.
+    """
+
+    def __init__(
+        self,
+        coach: CoachAgent,
+        storage: PersistenceBackend,
+        memory_manager: Optional[MemoryManager] = None,
+        fallback: Optional[FallbackResponder] = None,
+        scheduler: Optional[FairScheduler] = None,
+    ):
+        self.coach = coach
+        self.storage = storage
+        self.memory_manager = memory_manager or MemoryManager()
+        self.fallback = fallback or FallbackResponder()
+        self.scheduler = scheduler or FairScheduler(
+            slots=Config.TURN_SLOTS,
+            rate_per_s=Config.TURN_RATE_PER_MIN / 60,
+            burst=Config.TURN_BURST,
+            max_queued=Config.MAX_QUEUED_TURNS_PER_USER,
+            weights=Config.user_weights(),
+        )
+        self._per_user = UserOrdering()
+        self.recent = RecentTurns(
+            per_user=Config.TURN_DEDUP_WINDOW, ttl_s=Config.TURN_DEDUP_TTL_S
+        )
+        # user_id -> {token: (request id, message digest)} of the user's
+        # queued and running turns (None: no request id)
+        self._active_lock = threading.Lock()
+        self._active: dict[str, dict[CancelToken, Optional[tuple[str, str]]]] = {}
+
+    @contextmanager
+    def _stage(self, name: str, timings: dict[str, float]) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            timings[name] = elapsed * 1000
+            TURN_STAGE_SECONDS.labels(name).observe(elapsed)
+
+    def load_state(self, user_id: str) -> SessionState:
+        """Load stored state or create an empty one for a new user."""
+        state = self.storage.load_state(user_id)
+        if state is None:
+            return self.memory_manager.create_empty_state(user_id)
+        return state
+
+    @staticmethod
+    def render_history(state: SessionState, start: int = 0) -> list[dict[str, str]]:
+        """Chat view (Gradio messages format) of the conversation from `start`."""
+        return [
+            {"role": msg.get("role", "user"), "content": msg.get("content", "")}
+            for msg in state.conversation_history[start:]
+        ]
+
+    def run(
+        self,
+        user_id: str,
+        message: str,
+        on_token: Optional[Callable[[str], None]] = None,
+        request_id: Optional[str] = None,
+        cancel: Optional[CancelToken] = None,
+    ) -> TurnResult:
+        """
+        Execute one turn.
+
+        Args:
+            user_id: User ID
+            message: User message
+            on_token: Streams the reply: called with each new piece of it
+                while the LLM is still generating
+            request_id: Client token of this submission; a request id seen
+                recently with the same message returns the earlier turn's
+                reply (replayed=True)
+            cancel: Abandons the turn when cancelled: the LLM request is
+                aborted and nothing is persisted
+
+        Returns:
+            TurnResult with the reply, the new state and per-stage timings
+            (degraded=True: answered from templates, the LLM circuit is open)
+
+        Raises:
+            TurnCancelled: The token was cancelled before the persist stage;
+                nothing was saved, except the user message of a superseded
+                turn
+            Exception: Errors from the LLM or the backend are propagated;
+                nothing is persisted when the LLM stage fails.
+        """
+        if request_id:
+            replay = self.recent.get(user_id, request_id, message)
+            if replay is not None:
+                TURNS_DEDUPLICATED.inc()
+                if on_token is not None:
+                    on_token(replay.reply)
+                return TurnResult(
+                    user_id=user_id,
+                    reply=replay.reply,
+                    state=self.load_state(user_id),
+                    new_messages=replay.new_messages,
+                    changes=replay.changes,
+                    replayed=True,
+                )
+
+        TURNS_IN_FLIGHT.inc()
+        try:
+            result = self._run(user_id, message, on_token, cancel)
+        except TurnCancelled as exc:
+            TURNS.labels(outcome="cancelled").inc()
+            TURNS_CANCELLED.labels(exc.reason).inc()
+            if Config.DEBUG:
+                print(f"[TurnPipeline] {user_id}: cancelled ({exc.reason}), no reply saved")
+            raise
+        except Exception:
+            TURNS.labels(outcome="error").inc()
+            raise
+        finally:
+            TURNS_IN_FLIGHT.dec()
+        TURNS.labels(outcome="degraded" if result.degraded else "ok").inc()
+        if request_id:
+            self.recent.put(user_id, request_id, message, result)
+        return result
+
+    def _run(
+        self,
+        user_id: str,
+        message: str,
+        on_token: Optional[Callable[[str], None]],
+        cancel: Optional[CancelToken],
+    ) -> TurnResult:
+        timings: dict[str, float] = {}
+        if cancel is not None and cancel.reason != CANCEL_SUPERSEDED:
+            cancel.check()  # reset or abandoned while queued: nothing to keep
+
+        with self._stage("load", timings):
+            loaded = state = self.load_state(user_id)
+            rendered_upto = len(loaded.conversation_history)
+
+        with self._stage("append_user_message", timings):
+            state = asked = self.memory_manager.add_user_message(state, message)
+
+        try:
+            if cancel is not None:
+                cancel.check()  # superseded while queued: skip the LLM
+
+            with self._stage("build_prompt", timings):
+                messages = self.coach.build_messages(state)
+
+            degraded = False
+            with self._stage("llm", timings):
+                try:
+                    response = self.coach.generate(
+                        messages, on_token=on_token, cancel=cancel
+                    )
+                except CircuitOpen:
+                    # Degraded mode: do not wait for a failing LLM
+                    response = self.fallback.respond(state)
+                    degraded = True
+                    if on_token is not None:
+                        on_token(response.ai_response)
+
+            with self._stage("update_state", timings):
+                state = self.coach.apply_response(state, response)
+
+            # Last checkpoint: past it the turn is saved even if cancelled (a
+            # reset runs after it, see areset)
+            if cancel is not None:
+                cancel.check()
+        except TurnCancelled as exc:
+            if exc.reason == CANCEL_SUPERSEDED:
+                # The newer turn answers this message too: keep it in the
+                # history, without a reply (it runs after this save)
+                with self._stage("persist", timings):
+                    self.storage.save_state(user_id, asked)
+            raise
+
+        with self._stage("persist", timings):
+            self.storage.save_state(user_id, state)
+
+        with self._stage("render", timings):
+            # Only what the turn added: the cost does not grow with the session
+            new_messages = self.render_history(state, start=rendered_upto)
+            changes = state_changes(loaded, state)
+
+        if Config.DEBUG:
+            breakdown = ", ".join(f"{k}={v:.1f}ms" for k, v in timings.items())
+            print(f"[TurnPipeline] {user_id}: {breakdown}")
+
+        return TurnResult(
+            user_id=user_id,
+            reply=response.ai_response,
+            state=state,
+            new_messages=new_messages,
+            changes=changes,
+            timings_ms=timings,
+            degraded=degraded,
+        )
+
+    def reset(self, user_id: str) -> bool:
+        """Delete the stored state of a user; False for unknown users."""
+        # Replies of earlier requests no longer match the stored state
+        self.recent.forget(user_id)
+        if not self.storage.exists(user_id):
+            return False
+        self.storage.delete(user_id)
+        return True
+
+    async def arun(
+        self,
+        user_id: str,
+        message: str,
+        on_start: Optional[Callable[[float], None]] = None,
+        on_token: Optional[Callable[[str], None]] = None,
+        request_id: Optional[str] = None,
+        cancel: Optional[CancelToken] = None,
+        supersede: bool = False,
+    ) -> TurnResult:
+        """
+        run() for async callers, serialized per user and fairly scheduled.
+
+        The turn is admitted first (per-user rate and queue limits, see
+        utils/scheduler.py), then waits for the user's earlier operations and
+        for a turn slot, shared across users by weighted fair queuing.
+
+        A duplicate (same request id and message) submitted while the original
+        turn is still running waits for it and then gets its reply (or runs
+        itself, if the original failed); only replays of a finished turn are
+        not charged against the user's limits.
+
+        The turn can be cancelled until it is saved: through `cancel`, by
+        cancel_turns() (areset() calls it), by a newer superseding turn, or by
+        cancelling the awaiting task (a disconnected client).
+
+        Args:
+            user_id: User ID
+            message: User message
+            on_start: Called with the queued time (ms) when the turn starts
+            on_token: See run(); called from the worker thread
+            request_id: See run()
+            cancel: Token of the turn (created when not given)
+            supersede: Cancel the user's earlier queued and running turns
+                (except duplicates: same request id and message)
+
+        Returns:
+            TurnResult (with queued_ms set)
+
+        Raises:
+            SlowDown: The user sends turns faster than allowed (nothing queued)
+            TurnCancelled: The turn was cancelled (no reply was saved; see
+                run())
+        """
+        queued_at = time.perf_counter()
+        token = cancel if cancel is not None else CancelToken()
+        submission = (request_id, _digest(message)) if request_id else None
+        with self._active_lock:
+            # Only a finished turn's reply is free to replay: a duplicate of a
+            # turn still running is charged, as that turn may yet fail
+            replay = (
+                submission is not None
+                and self.recent.get(user_id, request_id, message) is not None
+            )
+            # SlowDown propagates before the turn is registered anywhere
+            ticket = None if replay else self.scheduler.admit(user_id)
+            active = self._active.setdefault(user_id, {})
+            older = []
+            if supersede:
+                older = [
+                    t
+                    for t, other in active.items()
+                    if submission is None or other != submission
+                ]
+            active[token] = submission
+        for earlier in older:
+            earlier.cancel(CANCEL_SUPERSEDED)
+        started = False
+
+        async def turn() -> TurnResult:
+            nonlocal started
+            started = True
+            try:
+                if ticket is not None:
+                    await self.scheduler.wait(ticket)
+                queued_ms = (time.perf_counter() - queued_at) * 1000
+                if on_start is not None:
+                    on_start(queued_ms)
+                result = await asyncio.to_thread(
+                    self.run, user_id, message, on_token, request_id, token
+                )
+            finally:
+                if ticket is not None:
+                    self.scheduler.release(ticket)
+            result.queued_ms = queued_ms
+            return result
+
+        try:
+            return await self._per_user.run(user_id, turn)
+        except asyncio.CancelledError:
+            # Nobody awaits the result any more: stop the turn too
+            token.cancel(CANCEL_DISCONNECTED)
+            raise
+        finally:
+            if ticket is not None and not started:
+                self.scheduler.release(ticket)  # left before its turn came
+            with self._active_lock:
+                active = self._active.get(user_id)
+                if active is not None:
+                    active.pop(token, None)
+                    if not active:
+                        del self._active[user_id]
+
+    def cancel_turns(self, user_id: str, reason: str) -> int:
+        """
+        Cancel the user's queued and running turns (arun).
+
+        Returns:
+            Number of turns newly cancelled
+        """
+        with self._active_lock:
+            tokens = list(self._active.get(user_id, {}))
+        return sum(token.cancel(reason) for token in tokens)
+
+    async def areset(self, user_id: str) -> bool:
+        """
+        reset() ordered after the user's pending turns, which are cancelled
+        first: the reset does not wait for replies it would discard.
+        """
+        self.cancel_turns(user_id, CANCEL_RESET)
+        return await self._per_user.run(
+            user_id, lambda: asyncio.to_thread(self.reset, user_id)
+        )
+
+
+@lru_cache()
+def get_pipeline() -> TurnPipeline:
+    """
+    Process-wide pipeline over the configured backend, built on first use.
+
+    app.py, api.py and cli.py all drive turns through it, so tools that never
+    run a turn never construct CoachAgent or open the backend.
+    """
+    return TurnPipeline(CoachAgent(), get_backend())
@@ -5,8 +5,10 @@ from __future__ import annotations
 System Prompter - builds dynamic system prompts using Jinja2 templates.
 """
 
+from typing import Optional
 from jinja2 import Environment, FileSystemLoader
 from config import Config
+from persistence.profile_store import ProfileStore
 
 
 class SystemPrompter:
@@ -16,10 +18,13 @@ class SystemPrompter:
     Supports templates from:
     - templates/ (main templates like main.j2)
     - memory/templates/ (memory layer templates like core.j2, working.j2)
+
+    Semantic profiles (semantic.j2) come from ProfileStore, filled offline
+    by memory/logic/consolidator.py.
     """
 
-    def __init__(self):
-        """Initialize with both template directories."""
+    def __init__(self, profile_store: Optional[ProfileStore] = None):
+        """Initialize with both template directories and the profile store."""
         self.env = Environment(
             loader=FileSystemLoader(
                 [
@@ -28,6 +33,7 @@ class SystemPrompter:
                 ]
             )
         )
+        self.profile_store = profile_store or ProfileStore(Config.PROFILES_DIR)
 
     def build_system_prompt(
         self, core: dict, profile: dict, session: dict, history: list
@@ -37,7 +43,7 @@ class SystemPrompter:
 
         Args:
             core: Coach identity (coach_name, etc.)
-            profile: User profile (user_name, main_goal)
+            profile: User profile (user_id, user_name, main_goal)
             session: Session state (phase, turn_count, emotions, etc.)
             history: Recent conversation history
 
@@ -46,6 +52,13 @@ class SystemPrompter:
         """
         template = self.env.get_template("main.j2")
 
+        user_id = profile.get("user_id")
+        user_profile = self.profile_store.get(user_id) if user_id else None
+
         return template.render(
-            core=core, profile=profile, session=session, history=history
+            core=core,
+            profile=profile,
+            session=session,
+            history=history,
+            user_profile=user_profile,
         )
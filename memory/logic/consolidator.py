@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+Semantic Memory Consolidator - offline job budujący profile użytkowników.
+
+Merges key_facts, key_insights, topics and main_goal of every session into a
+compact UserProfile (memory/schemas/semantic.py) stored in ProfileStore, where
+SystemPrompter reads it during a turn. Nothing here runs on the request path.
+
+Run:
+    python -m memory.logic.consolidator [--full]
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable, Optional
+
+from memory.schemas.semantic import (
+    PROFILE_VERSION,
+    ClosedSessions,
+    SessionContribution,
+    UserProfile,
+)
+
+# SessionState fields the profile is built from (everything else is ignored)
+PROFILE_SOURCE_FIELDS = (
+    "user_id",
+    "user_name",
+    "created_at",
+    "main_goal",
+    "key_facts",
+    "key_insights",
+    "topics",
+)
+
+
+@dataclass
+class ConsolidationReport:
+    """Counters of a single consolidation run."""
+
+    scanned: int = 0
+    consolidated: int = 0
+    unchanged: int = 0
+    failed: int = 0
+    elapsed_s: float = 0.0
+
+
+def project_state(state: dict) -> dict:
+    """Keep only the fields the profile is built from."""
+    return {field: state.get(field) for field in PROFILE_SOURCE_FIELDS}
+
+
+def state_fingerprint(state: dict) -> str:
+    """Stable hash of the profile-relevant part of a state (and profile format)."""
+    payload = json.dumps(
+        [PROFILE_VERSION, project_state(state)],
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _merge_unique(items: Iterable[Optional[str]], limit: int) -> list[str]:
+    """Deduplicate keeping first occurrence, then keep the `limit` most recent."""
+    seen: set[str] = set()
+    merged: list[str] = []
+    for item in items:
+        if item and item not in seen:
+            seen.add(item)
+            merged.append(item)
+    return merged[-limit:]
+
+
+def _fold_session(
+    closed: ClosedSessions, session: SessionContribution, limit: int
+) -> ClosedSessions:
+    """Add a finished session to the closed-sessions aggregate."""
+    folded = closed.model_copy(deep=True)
+    folded.sessions += 1
+    folded.goals = _merge_unique([*folded.goals, session.main_goal], limit)
+    folded.key_facts = _merge_unique([*folded.key_facts, *session.key_facts], limit)
+    folded.key_insights = _merge_unique(
+        [*folded.key_insights, *session.key_insights], limit
+    )
+    for topic in set(session.topics):
+        folded.topic_counts[topic] = folded.topic_counts.get(topic, 0) + 1
+    # Keep the topic table compact: drop the rarest entries
+    if len(folded.topic_counts) > limit * 4:
+        ranked = sorted(folded.topic_counts.items(), key=lambda kv: -kv[1])
+        folded.topic_counts = dict(ranked[: limit * 4])
+    return folded
+
+
+def merge_profile(
+    profile: Optional[dict], state: dict, max_items: int = 10
+) -> dict:
+    """
+    Merge one session state into a profile.
+
+    Pattern: func(profile, state) -> new_profile (the input is never mutated).
+
+    Args:
+        profile: Previously stored profile dict (None for a new user)
+        state: Serialized SessionState (or its projection)
+        max_items: Maximum number of entries kept per profile list
+
+    Returns:
+        New profile dict
+    """
+    user_id = state["user_id"]
+    updated = (
+        UserProfile.model_validate(profile)
+        if profile
+        else UserProfile(user_id=user_id)
+    )
+
+    session = SessionContribution(
+        session_id=state.get("created_at") or "unknown",
+        main_goal=state.get("main_goal"),
+        key_facts=list(state.get("key_facts") or []),
+        key_insights=list(state.get("key_insights") or []),
+        topics=list(state.get("topics") or []),
+    )
+
+    # A different created_at means the previous session was reset/finished
+    previous = updated.current_session
+    if previous is not None and previous.session_id != session.session_id:
+        updated.closed = _fold_session(updated.closed, previous, max_items)
+    updated.current_session = session
+
+    if updated.version < PROFILE_VERSION:
+        # Version 1 stored key insights as strengths and topics as challenges
+        updated.strengths, updated.challenges = [], []
+        updated.version = PROFILE_VERSION
+
+    closed = updated.closed
+    updated.name = state.get("user_name") or updated.name
+    updated.goals = _merge_unique([*closed.goals, session.main_goal], max_items)
+    updated.facts = _merge_unique([*closed.key_facts, *session.key_facts], max_items)
+    updated.insights = _merge_unique(
+        [*closed.key_insights, *session.key_insights], max_items
+    )
+
+    # Recurring topics first; the current session counts as one more occurrence
+    topic_counts = dict(closed.topic_counts)
+    for topic in set(session.topics):
+        topic_counts[topic] = topic_counts.get(topic, 0) + 1
+    ranked = sorted(topic_counts.items(), key=lambda kv: (-kv[1], kv[0]))
+    updated.topics = [topic for topic, _ in ranked[:max_items]]
+
+    updated.source_fingerprint = state_fingerprint(state)
+    updated.updated_at = datetime.now().isoformat()
+    return updated.model_dump()
+
+
+def consolidate_all(
+    backend,
+    store,
+    full: bool = False,
+    max_items: int = 10,
+) -> ConsolidationReport:
+    """
+    Consolidate profiles for every user of a persistence backend.
+
+    Only users whose profile-relevant state changed since the last run are
+    merged (unless `full=True`). States are streamed in batches and merged
+    as they arrive: loading dominates the run and a merge takes microseconds,
+    so worker processes would only add pickling.
+
+    Args:
+        backend: PersistenceBackend with user states
+        store: ProfileStore receiving the profiles
+        full: Rebuild every profile regardless of fingerprints
+        max_items: Maximum number of entries kept per profile list
+
+    Returns:
+        ConsolidationReport
+    """
+    started = time.perf_counter()
+    report = ConsolidationReport()
+
+    def skip(user_id: str, exc: Exception) -> None:
+        report.scanned += 1
+        report.failed += 1
+        print(f"[Consolidator] Skipping {user_id}: {exc}")
+
+    # Projection: profiles never need conversation_history
+    for user_id, state in backend.iter_states(
+        batch_size=500, fields=PROFILE_SOURCE_FIELDS, on_error=skip
+    ):
+        report.scanned += 1
+        try:
+            state = project_state(state)
+            profile = store.get(user_id)
+        except Exception as exc:
+            report.failed += 1
+            print(f"[Consolidator] Skipping {user_id}: {exc}")
+            continue
+
+        if (
+            not full
+            and profile
+            and profile.get("source_fingerprint") == state_fingerprint(state)
+        ):
+            report.unchanged += 1
+            continue
+        try:
+            store.put(user_id, merge_profile(profile, state, max_items))
+            report.consolidated += 1
+        except Exception as exc:
+            report.failed += 1
+            print(f"[Consolidator] Failed to consolidate {user_id}: {exc}")
+
+    report.elapsed_s = time.perf_counter() - started
+    return report
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """CLI entry point."""
+    from config import Config
+    from persistence import get_backend
+    from persistence.profile_store import ProfileStore
+
+    parser = argparse.ArgumentParser(
+        description="Consolidate semantic user profiles from stored sessions."
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Rebuild all profiles, ignoring change detection",
+    )
+    args = parser.parse_args(argv)
+
+    report = consolidate_all(
+        get_backend(),
+        ProfileStore(Config.PROFILES_DIR),
+        full=args.full,
+        max_items=Config.PROFILE_MAX_ITEMS,
+    )
+    print(
+        f"[Consolidator] scanned={report.scanned} "
+        f"consolidated={report.consolidated} unchanged={report.unchanged} "
+        f"failed={report.failed} in {report.elapsed_s:.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Semantic Memory Schema - long-term user profile built across sessions.
+
+Rendered by memory/templates/semantic.j2 (as `user_profile`).
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+# Bumped when the meaning of stored profile fields changes: every profile is
+# rebuilt on the next consolidation run
+PROFILE_VERSION = 2
+
+
+class SessionContribution(BaseModel):
+    """What a single coaching session contributed to the profile."""
+
+    session_id: str = Field(..., description="SessionState.created_at of the session")
+    main_goal: Optional[str] = Field(default=None)
+    key_facts: List[str] = Field(default_factory=list)
+    key_insights: List[str] = Field(default_factory=list)
+    topics: List[str] = Field(default_factory=list)
+
+
+class ClosedSessions(BaseModel):
+    """Aggregate of all sessions that are already finished."""
+
+    sessions: int = Field(default=0, description="Number of sessions folded in")
+    goals: List[str] = Field(default_factory=list)
+    key_facts: List[str] = Field(default_factory=list)
+    key_insights: List[str] = Field(default_factory=list)
+    topic_counts: Dict[str, int] = Field(
+        default_factory=dict, description="Number of sessions per topic"
+    )
+
+
+class UserProfile(BaseModel):
+    """
+    Consolidated long-term knowledge about a user.
+
+    Built offline by memory/logic/consolidator.py, never during a turn.
+    Finished sessions are folded into `closed`; the session still in progress
+    is kept in `current_session`, so consolidating it again replaces its
+    contribution instead of counting it twice.
+    """
+
+    user_id: str = Field(..., description="Unique user identifier")
+
+    # Fields rendered by semantic.j2
+    name: Optional[str] = Field(default=None, description="User name")
+    goals: List[str] = Field(default_factory=list, description="Long-term goals")
+    insights: List[str] = Field(
+        default_factory=list, description="Key insights from sessions"
+    )
+    topics: List[str] = Field(
+        default_factory=list, description="Recurring topics, most frequent first"
+    )
+    facts: List[str] = Field(
+        default_factory=list, description="User-provided facts (LC-007)"
+    )
+    # No SessionState field feeds these yet; the consolidator leaves them empty
+    values: List[str] = Field(default_factory=list, description="User values")
+    strengths: List[str] = Field(
+        default_factory=list, description="Strengths discovered in sessions"
+    )
+    challenges: List[str] = Field(default_factory=list, description="Challenges")
+
+    # Consolidation bookkeeping
+    version: int = Field(default=1, description="PROFILE_VERSION it was built with")
+    closed: ClosedSessions = Field(default_factory=ClosedSessions)
+    current_session: Optional[SessionContribution] = Field(default=None)
+    source_fingerprint: Optional[str] = Field(
+        default=None, description="Fingerprint of the state last consolidated"
+    )
+    updated_at: str = Field(default_factory=lambda: datetime.now().isoformat())
@@ -5,8 +5,8 @@ from __future__ import annotations
 Session State Schema - current coaching session state.
 """
 
-from pydantic import BaseModel, Field
-from typing import Optional, List
+from pydantic import BaseModel, Field, PrivateAttr
+from typing import Any, Callable, Optional, List
 from datetime import datetime
 
 
@@ -82,5 +82,80 @@ class SessionState(BaseModel):
     deepening_questions_count: int = Field(default=0, description="Counter for LC-012")
     celebrations_count: int = Field(default=0, description="Counter for LC-009")
 
+    # Reader of conversation_history for states built by with_lazy_history
+    _history_loader: Optional[Callable[[], List[dict]]] = PrivateAttr(default=None)
+
     class Config:
         arbitrary_types_allowed = True
+
+    # ------------------------------------------------------------------
+    # Lazy conversation_history
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def scalar_fields(cls) -> List[str]:
+        """Every field except conversation_history."""
+        return [name for name in cls.model_fields if name != "conversation_history"]
+
+    @classmethod
+    def with_lazy_history(
+        cls, state: dict, loader: Callable[[], List[dict]]
+    ) -> "SessionState":
+        """
+        Build a state whose conversation_history is read on first access.
+
+        Args:
+            state: Scalar fields (validated now; conversation_history ignored)
+            loader: Returns the history when it is first needed
+
+        Serialization and copies load the history first, so a lazy state can
+        be saved or modified like any other.
+        """
+        model = cls(**{**state, "conversation_history": []})
+        del model.__dict__["conversation_history"]
+        model._history_loader = loader
+        return model
+
+    @property
+    def history_loaded(self) -> bool:
+        return "conversation_history" in self.__dict__
+
+    def _load_history(self) -> None:
+        if "conversation_history" not in self.__dict__:
+            self.__dict__["conversation_history"] = list(self._history_loader())
+            self._history_loader = None
+
+    def __getattr__(self, name: str) -> Any:
+        # Only reached for names missing from __dict__
+        if name == "conversation_history" and self._history_loader is not None:
+            self._load_history()
+            return self.__dict__["conversation_history"]
+        return super().__getattr__(name)
+
+    @staticmethod
+    def _dump_includes_history(kwargs: dict) -> bool:
+        include, exclude = kwargs.get("include"), kwargs.get("exclude")
+        if include is not None and "conversation_history" not in include:
+            return False
+        return not (exclude is not None and "conversation_history" in exclude)
+
+    def model_dump(self, **kwargs: Any) -> dict[str, Any]:
+        if self._dump_includes_history(kwargs):
+            self._load_history()
+        return super().model_dump(**kwargs)
+
+    def model_dump_json(self, **kwargs: Any) -> str:
+        if self._dump_includes_history(kwargs):
+            self._load_history()
+        return super().model_dump_json(**kwargs)
+
+    def model_copy(self, **kwargs: Any) -> "SessionState":
+        if "conversation_history" not in (kwargs.get("update") or {}):
+            self._load_history()
+        return super().model_copy(**kwargs)
+
+    def __eq__(self, other: Any) -> bool:
+        self._load_history()
+        if isinstance(other, SessionState):
+            other._load_history()
+        return super().__eq__(other)
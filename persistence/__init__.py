@@ -10,13 +10,67 @@ from pathlib import Path
 from config import Config
 from .in_memory import InMemoryBackend
 from .file_backend import FileBackend
+from .durability import GroupCommitter
+from .sqlite_backend import SqliteBackend
+from .cached import CachedBackend
+from .codecs import StateCodec
+from . import aio
 
 
 def get_backend():
-    """Return the configured persistence backend instance."""
+    """Return the configured persistence backend, behind the state cache if enabled."""
+    aio.configure(max_workers=Config.PERSISTENCE_THREADS)
+    backend = create_backend()
+    if Config.ARCHIVE_ENABLED:
+        from .archive import ColdArchive
+        from .lifecycle import TieredBackend
+
+        backend = TieredBackend(
+            backend,
+            ColdArchive(Path(Config.ARCHIVE_DIR)),
+            ttl_s=Config.ARCHIVE_TTL_DAYS * 86400,
+            sweep_interval_s=Config.ARCHIVE_SWEEP_INTERVAL_S,
+        )
+        backend.export_metrics()
+    # A per-process cache would hide other workers' writes to a shared store
+    if Config.STATE_CACHE_ENABLED and not backend.shared:
+        cached = CachedBackend(
+            backend,
+            max_entries=Config.CACHE_MAX_ENTRIES,
+            idle_ttl_s=Config.CACHE_IDLE_TTL_S,
+            flush_interval_s=Config.CACHE_FLUSH_INTERVAL_S,
+        )
+        cached.export_metrics()
+        return cached
+    return backend
+
+
+def create_backend():
+    """Return the configured storage backend alone (no cache, no archive)."""
     backend = Config.PERSISTENCE_BACKEND.lower()
     if backend == "in_memory":
-        return InMemoryBackend()
+        store = None
+        if Config.SHARED_STORE_ADDRESS:
+            from .shared_store import connect
+
+            store = connect(Config.SHARED_STORE_ADDRESS, Config.SHARED_STORE_AUTHKEY)
+        return InMemoryBackend(codec=StateCodec.from_config(), store=store)
     if backend == "file":
-        return FileBackend(Path(Config.DATA_DIR))
+        group_commit = (
+            GroupCommitter(Config.FILE_GROUP_COMMIT_MS)
+            if Config.FILE_FSYNC and Config.FILE_GROUP_COMMIT
+            else None
+        )
+        return FileBackend(
+            Path(Config.DATA_DIR),
+            fsync=Config.FILE_FSYNC,
+            group_commit=group_commit,
+            codec=StateCodec.from_config(),
+        )
+    if backend == "sqlite":
+        return SqliteBackend(Path(Config.SQLITE_PATH))
+    if backend == "redis":
+        from .redis_backend import RedisBackend
+
+        return RedisBackend(Config.REDIS_URL, prefix=Config.REDIS_PREFIX)
     raise ValueError(f"Unsupported persistence backend: {Config.PERSISTENCE_BACKEND}")
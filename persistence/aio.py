@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Async support for persistence backends.
+
+- run_blocking: runs a blocking backend call on a bounded, shared thread pool,
+  so async handlers never block the event loop on file or database I/O.
+- UserOrdering: per-user FIFO. Operations on one user run one at a time in
+  call order; a caller cancelled while its save is in flight does not let the
+  next save overtake it (the slot is released only when the work is done).
+
+Size the pool with `configure(max_workers)` (get_backend uses
+Config.PERSISTENCE_THREADS).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+_max_workers = 8
+
+
+def configure(max_workers: int) -> None:
+    """Set the thread pool size (takes effect for a pool not yet started)."""
+    global _max_workers
+    _max_workers = max_workers
+
+
+def executor() -> ThreadPoolExecutor:
+    """The shared persistence thread pool, created on first use."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=_max_workers, thread_name_prefix="persistence"
+                )
+    return _executor
+
+
+async def run_blocking(fn: Callable[..., T], *args: Any) -> T:
+    """Run `fn(*args)` on the persistence thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor(), functools.partial(fn, *args))
+
+
+async def run_inline(fn: Callable[..., T], *args: Any) -> T:
+    """Awaitable wrapper for calls that never block (in-memory work)."""
+    return fn(*args)
+
+
+class UserOrdering:
+    """Per-user FIFO of async operations (per event loop)."""
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        # (loop id, user_id) -> [lock, number of holders + waiters]
+        self._slots: dict[tuple[int, str], list] = {}
+
+    def _release(self, key: tuple[int, str], slot: list) -> None:
+        with self._guard:
+            slot[1] -= 1
+            if slot[1] == 0:
+                self._slots.pop(key, None)
+
+    async def run(self, user_id: str, operation: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run `operation()` once every earlier operation on `user_id` finished.
+
+        asyncio.Lock wakes waiters in FIFO order, so operations run in the
+        order they were called.
+        """
+        key = (id(asyncio.get_running_loop()), user_id)
+        with self._guard:
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = self._slots[key] = [asyncio.Lock(), 0]
+            slot[1] += 1
+        lock: asyncio.Lock = slot[0]
+
+        try:
+            await lock.acquire()
+        except BaseException:
+            self._release(key, slot)
+            raise
+        try:
+            task = asyncio.ensure_future(operation())
+        except BaseException:
+            lock.release()
+            self._release(key, slot)
+            raise
+
+        def done(_: asyncio.Future) -> None:
+            lock.release()
+            self._release(key, slot)
+            if not task.cancelled():
+                task.exception()  # retrieved: the caller may have stopped waiting
+
+        task.add_done_callback(done)
+        # Cancelling the caller does not cancel (or unblock) the work itself
+        return await asyncio.shield(task)
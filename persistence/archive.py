@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Cold archive for inactive users.
+
+Archived states are stored compressed (StateCodec, zstd when available,
+otherwise zlib) in one SQLite file per day of archiving:
+
+    <archive_dir>/archive-2026-10-19.db   states(user_id, archived_at, data)
+    <archive_dir>/catalog.db              location(user_id, day)
+
+The catalog maps a user to the day file holding their state, so a lookup is
+two primary-key reads however many days there are. Day files make retention
+and backups simple: a day that no longer holds anyone is deleted.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Mapping, Optional
+
+from .backend import PersistenceError
+from .codecs import StateCodec
+
+_DAY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS states (
+    user_id TEXT PRIMARY KEY,
+    archived_at REAL NOT NULL,
+    data BLOB NOT NULL
+) WITHOUT ROWID;
+"""
+_CATALOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS location (
+    user_id TEXT PRIMARY KEY,
+    day TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def _default_codec() -> StateCodec:
+    try:
+        return StateCodec("json", "zstd", level=9)
+    except PersistenceError:  # zstandard not installed
+        return StateCodec("json", "zlib", level=9)
+
+
+class ColdArchive:
+    """Compressed per-day SQLite archive of user states."""
+
+    def __init__(self, archive_dir: Path, codec: Optional[StateCodec] = None):
+        """Initialize archive.
+
+        Args:
+            archive_dir: Directory of the day files and the catalog.
+            codec: Encoding of archived states (default: JSON + zstd/zlib).
+        """
+        self.archive_dir = Path(archive_dir)
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        self.codec = codec or _default_codec()
+        # Archive traffic is light (sweeps, rehydrations): one lock is enough
+        self._lock = threading.Lock()
+        self._connections: dict[str, sqlite3.Connection] = {}
+        self._catalog = self._connect(self.archive_dir / "catalog.db", _CATALOG_SCHEMA)
+
+    @staticmethod
+    def _connect(path: Path, schema: str) -> sqlite3.Connection:
+        conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(schema)
+        return conn
+
+    def _day_path(self, day: str) -> Path:
+        return self.archive_dir / f"archive-{day}.db"
+
+    def _day(self, day: str) -> sqlite3.Connection:
+        conn = self._connections.get(day)
+        if conn is None:
+            conn = self._connect(self._day_path(day), _DAY_SCHEMA)
+            self._connections[day] = conn
+        return conn
+
+    def _locate(self, user_id: str) -> Optional[str]:
+        row = self._catalog.execute(
+            "SELECT day FROM location WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def put_many(self, states: Mapping[str, dict]) -> None:
+        """Archive states under today's day file (replacing older copies)."""
+        if not states:
+            return
+        day = datetime.now().strftime("%Y-%m-%d")
+        now = time.time()
+        rows = [(uid, now, self.codec.encode(state)) for uid, state in states.items()]
+        with self._lock:
+            previous = {uid: self._locate(uid) for uid in states}
+            conn = self._day(day)
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT OR REPLACE INTO states (user_id, archived_at, data) "
+                "VALUES (?, ?, ?)",
+                rows,
+            )
+            conn.execute("COMMIT")
+            # Catalog second: until it points here, the old copy is served
+            self._catalog.execute("BEGIN")
+            self._catalog.executemany(
+                "INSERT OR REPLACE INTO location (user_id, day) VALUES (?, ?)",
+                [(uid, day) for uid in states],
+            )
+            self._catalog.execute("COMMIT")
+            for user_id, old_day in previous.items():
+                if old_day is not None and old_day != day:
+                    self._remove_from_day(old_day, user_id)
+
+    def get(self, user_id: str) -> Optional[dict]:
+        """Archived state of a user, or None."""
+        with self._lock:
+            day = self._locate(user_id)
+            if day is None:
+                return None
+            row = self._day(day).execute(
+                "SELECT data FROM states WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return self.codec.decode(row[0]) if row else None
+
+    def contains(self, user_id: str) -> bool:
+        with self._lock:
+            return self._locate(user_id) is not None
+
+    def _remove_from_day(self, day: str, user_id: str) -> None:
+        conn = self._day(day)
+        conn.execute("DELETE FROM states WHERE user_id = ?", (user_id,))
+        if conn.execute("SELECT 1 FROM states LIMIT 1").fetchone() is None:
+            # Nobody left in this day file
+            conn.close()
+            del self._connections[day]
+            for suffix in ("", "-wal", "-shm"):
+                Path(f"{self._day_path(day)}{suffix}").unlink(missing_ok=True)
+
+    def remove(self, user_id: str) -> bool:
+        """Drop a user from the archive. Returns True if they were archived."""
+        with self._lock:
+            day = self._locate(user_id)
+            if day is None:
+                return False
+            self._catalog.execute("DELETE FROM location WHERE user_id = ?", (user_id,))
+            self._remove_from_day(day, user_id)
+            return True
+
+    def users(self) -> list[str]:
+        with self._lock:
+            rows = self._catalog.execute("SELECT user_id FROM location ORDER BY user_id")
+            return [row[0] for row in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._catalog.execute("SELECT COUNT(*) FROM location").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            for conn in self._connections.values():
+                conn.close()
+            self._connections.clear()
+            self._catalog.close()
@@ -1,15 +1,30 @@
-
 """
 Persistence Backend Interface
 
 Abstract interface for pluggable storage backends.
-Implementations: InMemoryBackend (dev), RedisBackend (prod), PostgresBackend (future)
+Implementations: InMemoryBackend (dev), FileBackend (demo), SqliteBackend (single host),
+RedisBackend (prod), PostgresBackend (future)
 
 NOTE: Ten plik jest reu|ywalny - nie wymaga modyfikacji przez studenta.
 """
 
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Iterable,
+    Iterator,
+    Mapping,
+    Optional,
+    Sequence,
+)
+
+from .aio import UserOrdering, run_blocking
+
+if TYPE_CHECKING:
+    from memory.schemas.session_state import SessionState
 
 
 class PersistenceBackend(ABC):
@@ -19,6 +34,10 @@ class PersistenceBackend(ABC):
     All backends must implement these methods to be compatible with CoachAgent.
     """
 
+    # Other processes may write to the same store (see get_backend: such a
+    # backend is never put behind the per-process state cache)
+    shared: bool = False
+
     @abstractmethod
     def save(self, user_id: str, state: dict) -> None:
         """
@@ -34,12 +53,16 @@ class PersistenceBackend(ABC):
         pass
 
     @abstractmethod
-    def load(self, user_id: str) -> Optional[dict]:
+    def load(
+        self, user_id: str, fields: Optional[Sequence[str]] = None
+    ) -> Optional[dict]:
         """
         Load user state.
 
         Args:
             user_id: Unique user identifier
+            fields: Keep only these keys (None = everything). Without
+                conversation_history in it, backends skip reading the history.
 
         Returns:
             State dict if user exists, None if new user
@@ -75,6 +98,31 @@ class PersistenceBackend(ABC):
         """
         pass
 
+    def delete_if_unchanged(self, user_id: str, expected: dict) -> bool:
+        """
+        Delete a user only if the stored state still equals `expected`.
+
+        Used by the lifecycle sweep (persistence/lifecycle.py): a save that
+        lands after the state was archived must not be deleted with it.
+        Backends shared between processes override this to compare and
+        delete atomically; the default is atomic only against callers that
+        serialize their saves with it (TieredBackend's per-user locks).
+
+        Args:
+            user_id: Unique user identifier
+            expected: Full state (with conversation_history) read earlier
+
+        Returns:
+            True if the user was deleted, False if missing or changed
+        """
+        if self.load(user_id) != expected:
+            return False
+        try:
+            self.delete(user_id)
+        except PersistenceError:
+            return False
+        return True
+
     @abstractmethod
     def list_users(self) -> list[str]:
         """
@@ -85,6 +133,211 @@ class PersistenceBackend(ABC):
         """
         pass
 
+    def idle_users(self, before: float) -> list[str]:
+        """
+        Users whose state was last saved before `before` (Unix timestamp).
+
+        Used by the lifecycle sweep (persistence/lifecycle.py) to find users
+        to move to the cold archive. Default: a backend that does not track
+        save times reports nobody idle, so nothing is ever archived from it.
+        """
+        return []
+
+    def load_history(self, user_id: str, limit: Optional[int] = None) -> list[dict]:
+        """
+        Read the last `limit` messages of a user's history (all if None).
+
+        Default: projected load(); backends with a separate history store
+        read only the requested tail.
+        """
+        state = self.load(user_id, fields=["conversation_history"])
+        history = state.get("conversation_history", []) if state else []
+        return history[-limit:] if limit else history
+
+    def load_state(
+        self, user_id: str, lazy_history: bool = False
+    ) -> Optional["SessionState"]:
+        """
+        Load user state as a SessionState model.
+
+        Default: load() + validation. Caching backends override this to hand out hot SessionState objects
+        without re-parsing. States are treated as immutable (MemoryManager
+        always copies before modifying).
+
+        Args:
+            user_id: Unique user identifier
+            lazy_history: Read only the scalar fields now; conversation_history
+                is loaded (via load_history) the first time it is accessed.
+                For viewers and analytics that rarely need the history.
+
+        Returns:
+            SessionState if user exists, None if new user
+        """
+        from memory.schemas.session_state import SessionState
+
+        if lazy_history:
+            state = self.load(user_id, fields=SessionState.scalar_fields())
+            if state is None:
+                return None
+            return SessionState.with_lazy_history(
+                state, lambda: self.load_history(user_id)
+            )
+
+        state = self.load(user_id)
+        return SessionState(**state) if state is not None else None
+
+    def save_state(self, user_id: str, state: "SessionState") -> None:
+        """
+        Save a SessionState model.
+
+        Default: model_dump() + save().
+        """
+        self.save(user_id, state.model_dump())
+
+    # ------------------------------------------------------------------
+    # Bulk & streaming API
+    #
+    # Defaults loop over the single-user methods; backends override them with
+    # batched queries / pipelines. `fields` projects each state to the given
+    # keys, and lets backends skip reading conversation_history entirely when
+    # it is not requested.
+    # ------------------------------------------------------------------
+
+    def load_many(
+        self, user_ids: Iterable[str], fields: Optional[Sequence[str]] = None
+    ) -> dict[str, dict]:
+        """
+        Load several users at once.
+
+        Args:
+            user_ids: Users to load
+            fields: Keep only these keys of every state (None = everything)
+
+        Returns:
+            {user_id: state}; users without saved state are left out
+        """
+        result = {}
+        for user_id in user_ids:
+            state = self.load(user_id, fields)
+            if state is not None:
+                result[user_id] = state
+        return result
+
+    def save_many(self, states: Mapping[str, dict]) -> None:
+        """Save several users ({user_id: state}) at once."""
+        for user_id, state in states.items():
+            self.save(user_id, state)
+
+    def _user_pages(self, batch_size: int) -> Iterator[list[str]]:
+        """User ids in pages (override to page without listing everyone)."""
+        users = self.list_users()
+        for start in range(0, len(users), batch_size):
+            yield users[start : start + batch_size]
+
+    def iter_states(
+        self,
+        batch_size: int = 100,
+        fields: Optional[Sequence[str]] = None,
+        on_error: Optional[Callable[[str, Exception], None]] = None,
+    ) -> Iterator[tuple[str, dict]]:
+        """
+        Stream (user_id, state) pairs of every user, `batch_size` at a time.
+
+        Only one batch of states is held in memory at once.
+
+        Args:
+            batch_size: Users loaded per load_many call
+            fields: Projection (see load_many)
+            on_error: Called with (user_id, exception) for users that fail
+                to load, which are then skipped. Without it the first error
+                ends the iteration.
+        """
+        for page in self._user_pages(batch_size):
+            try:
+                batch = self.load_many(page, fields)
+            except Exception:
+                if on_error is None:
+                    raise
+                # Find the culprit(s), keep everyone else
+                batch = {}
+                for user_id in page:
+                    try:
+                        batch.update(self.load_many([user_id], fields))
+                    except Exception as exc:
+                        on_error(user_id, exc)
+            yield from batch.items()
+
+    # ------------------------------------------------------------------
+    # Async API
+    #
+    # Defaults run the blocking methods on the shared persistence thread pool
+    # (persistence/aio.py). Operations on the same user keep their call order.
+    # Backends with a native async client override the a* methods and route
+    # them through `_ordered` themselves.
+    # ------------------------------------------------------------------
+
+    async def _offload(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run a blocking call off the event loop (override for inline work)."""
+        return await run_blocking(fn, *args)
+
+    def _ordered(
+        self, user_id: str, operation: Callable[[], Awaitable[Any]]
+    ) -> Awaitable[Any]:
+        ordering = self.__dict__.get("_async_ordering")
+        if ordering is None:
+            ordering = self.__dict__.setdefault("_async_ordering", UserOrdering())
+        return ordering.run(user_id, operation)
+
+    async def asave(self, user_id: str, state: dict) -> None:
+        """Async save()."""
+        await self._ordered(user_id, lambda: self._offload(self.save, user_id, state))
+
+    async def aload(
+        self, user_id: str, fields: Optional[Sequence[str]] = None
+    ) -> Optional[dict]:
+        """Async load()."""
+        return await self._ordered(
+            user_id, lambda: self._offload(self.load, user_id, fields)
+        )
+
+    async def aexists(self, user_id: str) -> bool:
+        """Async exists()."""
+        return await self._ordered(
+            user_id, lambda: self._offload(self.exists, user_id)
+        )
+
+    async def adelete(self, user_id: str) -> None:
+        """Async delete()."""
+        await self._ordered(user_id, lambda: self._offload(self.delete, user_id))
+
+    async def alist_users(self) -> list[str]:
+        """Async list_users()."""
+        return await self._offload(self.list_users)
+
+    async def aload_state(self, user_id: str) -> Optional["SessionState"]:
+        """Async load_state()."""
+        return await self._ordered(
+            user_id, lambda: self._offload(self.load_state, user_id)
+        )
+
+    async def asave_state(self, user_id: str, state: "SessionState") -> None:
+        """Async save_state()."""
+        await self._ordered(
+            user_id, lambda: self._offload(self.save_state, user_id, state)
+        )
+
+
+def project(state: dict, fields: Optional[Sequence[str]]) -> dict:
+    """Keep only `fields` of a state dict (all of it when fields is None)."""
+    if fields is None:
+        return state
+    return {field: state[field] for field in fields if field in state}
+
+
+def needs_history(fields: Optional[Sequence[str]]) -> bool:
+    """True if a projection includes conversation_history."""
+    return fields is None or "conversation_history" in fields
+
 
 class PersistenceError(Exception):
     """Raised when persistence operations fail."""
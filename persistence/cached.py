@@ -0,0 +1,491 @@
+# -*- coding: utf-8 -*-
+"""
+Write-behind caching decorator for any PersistenceBackend.
+
+Keeps hot SessionState objects in an LRU so a turn does not pay for
+exists() + load() + parse + validation of the state it saved seconds ago.
+Saves only mark the entry dirty; a background thread flushes dirty entries to
+the wrapped backend every `flush_interval_s`, on eviction and at shutdown.
+
+Consistency: read-your-writes within one process (every read is served from
+the cache first). Other processes see a write after the next flush, and keep
+serving their own cached copy of a user until it is evicted, so several
+workers (or a standalone api.py) over one backend read each other's stale
+states. Durability: a crash loses every save not flushed yet, up to
+`flush_interval_s` of turns.
+
+Hence it is opt-in (Config.STATE_CACHE_ENABLED, off by default), and
+get_backend never puts it in front of a backend marked `shared` (file,
+sqlite, redis, a shared in-memory store), which other processes may write:
+it only serves a process-private store.
+
+Works with every backend through the public PersistenceBackend API only.
+"""
+
+from __future__ import annotations
+
+import atexit
+import copy
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    Mapping,
+    Optional,
+    Sequence,
+    Union,
+)
+
+from utils.metrics import REGISTRY
+
+from .aio import run_inline
+from .backend import PersistenceBackend, PersistenceError, project
+
+if TYPE_CHECKING:
+    from memory.schemas.session_state import SessionState
+
+CACHE_HIT_RATIO = REGISTRY.gauge(
+    "coach_state_cache_hit_ratio", "State cache hits / (hits + misses)"
+)
+CACHE_ENTRIES = REGISTRY.gauge(
+    "coach_state_cache_entries", "Cached states by flush state", ["state"]
+)
+CACHE_EVENTS = REGISTRY.gauge(
+    "coach_state_cache_events",
+    "State cache hits, misses, evictions and flushes since start",
+    ["event"],
+)
+
+
+@dataclass
+class _Entry:
+    value: Union[SessionState, dict]
+    dirty: bool = False
+    version: int = 0
+    last_access: float = 0.0
+
+
+@dataclass
+class CacheStats:
+    """Counters exposed for monitoring."""
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    flushed: int = 0
+    flush_errors: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class CachedBackend(PersistenceBackend):
+    """LRU + write-behind cache wrapping another PersistenceBackend."""
+
+    def __init__(
+        self,
+        backend: PersistenceBackend,
+        max_entries: int = 1024,
+        idle_ttl_s: float = 900.0,
+        flush_interval_s: float = 1.0,
+        start_flusher: bool = True,
+    ):
+        """Initialize cache.
+
+        Args:
+            backend: Backend that receives the flushed writes.
+            max_entries: LRU capacity (least recently used entries go first).
+            idle_ttl_s: Entries not accessed for this long are evicted.
+            flush_interval_s: Period of the write-behind flusher.
+            start_flusher: Start the background thread (False = flush manually).
+        """
+        self.backend = backend
+        self.max_entries = max_entries
+        self.idle_ttl_s = idle_ttl_s
+        self.flush_interval_s = flush_interval_s
+        self.stats = CacheStats()
+
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._lock = threading.RLock()
+        # Serializes writes to the backend (flusher, eviction, delete)
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+
+        if start_flusher:
+            self._flusher = threading.Thread(
+                target=self._flush_loop, name="state-cache-flusher", daemon=True
+            )
+            self._flusher.start()
+        atexit.register(self.close)
+
+    # ------------------------------------------------------------------
+    # Cache internals
+    # ------------------------------------------------------------------
+
+    def _get(self, user_id: str) -> Optional[_Entry]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                self.stats.misses += 1
+                return None
+            self.stats.hits += 1
+            entry.last_access = time.monotonic()
+            self._entries.move_to_end(user_id)
+            return entry
+
+    def _put(self, user_id: str, value: Any, dirty: bool) -> None:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                entry = _Entry(value=value)
+                self._entries[user_id] = entry
+            else:
+                entry.value = value
+                self._entries.move_to_end(user_id)
+            entry.dirty = entry.dirty or dirty
+            entry.version += 1
+            entry.last_access = time.monotonic()
+            excess = len(self._entries) - self.max_entries
+            overflow = list(self._entries)[:excess] if excess > 0 else []
+        for evicted_id in overflow:
+            self._evict(evicted_id)
+
+    @staticmethod
+    def _as_dict(value: Any) -> dict:
+        if isinstance(value, dict):
+            return copy.deepcopy(value)
+        return value.model_dump()
+
+    @staticmethod
+    def _project(value: Any, fields: Optional[Sequence[str]]) -> dict:
+        """Copy of the requested fields of a cached dict or SessionState."""
+        if isinstance(value, dict):
+            return copy.deepcopy(project(value, fields))
+        include = set(fields) if fields is not None else None
+        return value.model_dump(include=include)
+
+    def _write_entry(self, user_id: str) -> Optional[int]:
+        """
+        Flush one entry if dirty; caller holds _flush_lock.
+
+        Returns the version that is now durable, or None if the entry is gone.
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            value, version, dirty = entry.value, entry.version, entry.dirty
+        if dirty:
+            if isinstance(value, dict):
+                self.backend.save(user_id, copy.deepcopy(value))
+            else:
+                self.backend.save_state(user_id, value)
+            self.stats.flushed += 1
+            with self._lock:
+                if entry.version == version:
+                    entry.dirty = False
+        return version
+
+    def _evict(self, user_id: str) -> None:
+        """
+        Remove an entry, writing it first if dirty.
+
+        The entry stays visible until its write has landed, so a concurrent
+        read can never fall through to stale data in the backend.
+        """
+        with self._flush_lock:
+            try:
+                version = self._write_entry(user_id)
+            except Exception as exc:
+                self.stats.flush_errors += 1
+                print(f"[CachedBackend] Eviction flush failed for {user_id}: {exc}")
+                return  # keep it cached; the flusher retries
+            with self._lock:
+                entry = self._entries.get(user_id)
+                if entry is not None and entry.version == version:
+                    del self._entries[user_id]
+                    self.stats.evictions += 1
+
+    def flush(self) -> int:
+        """Write every dirty entry to the backend. Returns entries written."""
+        with self._lock:
+            pending = [u for u, entry in self._entries.items() if entry.dirty]
+        written = 0
+        for user_id in pending:
+            try:
+                with self._flush_lock:
+                    flushed_before = self.stats.flushed
+                    self._write_entry(user_id)
+                    written += self.stats.flushed - flushed_before
+            except Exception as exc:
+                self.stats.flush_errors += 1
+                print(f"[CachedBackend] Flush failed for {user_id}: {exc}")
+        return written
+
+    def evict_idle(self) -> int:
+        """Drop entries idle longer than idle_ttl_s (flushing dirty ones)."""
+        deadline = time.monotonic() - self.idle_ttl_s
+        with self._lock:
+            idle = [u for u, e in self._entries.items() if e.last_access < deadline]
+        for user_id in idle:
+            self._evict(user_id)
+        return len(idle)
+
+    def _flush_loop(self) -> None:
+        while not self._stop.wait(self.flush_interval_s):
+            self.flush()
+            self.evict_idle()
+
+    def close(self) -> None:
+        """Graceful shutdown: stop the flusher and write everything dirty."""
+        self._stop.set()
+        flusher = self._flusher
+        if flusher is not None and flusher is not threading.current_thread():
+            flusher.join(timeout=self.flush_interval_s + 5)
+        self.flush()
+
+    def cache_info(self) -> dict:
+        """Hit-rate metrics and occupancy."""
+        with self._lock:
+            dirty = sum(1 for e in self._entries.values() if e.dirty)
+            size = len(self._entries)
+        return {
+            "hits": self.stats.hits,
+            "misses": self.stats.misses,
+            "hit_rate": round(self.stats.hit_rate, 4),
+            "evictions": self.stats.evictions,
+            "flushed": self.stats.flushed,
+            "flush_errors": self.stats.flush_errors,
+            "size": size,
+            "dirty": dirty,
+        }
+
+    def export_metrics(self) -> None:
+        """Serve cache_info() on /metrics (computed at scrape time)."""
+        CACHE_HIT_RATIO.set_function(lambda: self.stats.hit_rate)
+        CACHE_ENTRIES.set_function(self._entry_counts)
+        CACHE_EVENTS.set_function(
+            lambda: {
+                "hit": self.stats.hits,
+                "miss": self.stats.misses,
+                "eviction": self.stats.evictions,
+                "flush": self.stats.flushed,
+                "flush_error": self.stats.flush_errors,
+            }
+        )
+
+    def _entry_counts(self) -> dict[str, int]:
+        info = self.cache_info()
+        return {"clean": info["size"] - info["dirty"], "dirty": info["dirty"]}
+
+    # ------------------------------------------------------------------
+    # PersistenceBackend API
+    # ------------------------------------------------------------------
+
+    def load_state(
+        self, user_id: str, lazy_history: bool = False
+    ) -> Optional["SessionState"]:
+        """Return the hot SessionState object (hydrated once per miss)."""
+        from memory.schemas.session_state import SessionState
+
+        entry = self._get(user_id)
+        if entry is not None:
+            value = entry.value
+            if not isinstance(value, dict):
+                return value
+            # Stored through the dict API: validate once, keep the object
+            state = SessionState(**value)
+            with self._lock:
+                if entry.value is value:
+                    entry.value = state
+            return state
+
+        if lazy_history:
+            # A viewer's lazy state is not worth a cache slot
+            return PersistenceBackend.load_state(self, user_id, lazy_history=True)
+        state = self.backend.load_state(user_id)
+        if state is not None:
+            self._put(user_id, state, dirty=False)
+        return state
+
+    def save_state(self, user_id: str, state: "SessionState") -> None:
+        """Keep the object; the backend write happens in the background."""
+        self._put(user_id, state, dirty=True)
+
+    def save(self, user_id: str, state: dict) -> None:
+        self._put(user_id, copy.deepcopy(state), dirty=True)
+
+    def load(
+        self, user_id: str, fields: Optional[Sequence[str]] = None
+    ) -> Optional[dict]:
+        entry = self._get(user_id)
+        if entry is not None:
+            return self._project(entry.value, fields)
+        if fields is not None:
+            # Partial states are not cached
+            return self.backend.load(user_id, fields)
+        data = self.backend.load(user_id)
+        if data is not None:
+            self._put(user_id, copy.deepcopy(data), dirty=False)
+        return data
+
+    def load_history(self, user_id: str, limit: Optional[int] = None) -> list[dict]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+        if entry is None:
+            return self.backend.load_history(user_id, limit)
+        history = self._project(entry.value, ["conversation_history"]).get(
+            "conversation_history", []
+        )
+        return history[-limit:] if limit else history
+
+    def load_many(
+        self, user_ids: Iterable[str], fields: Optional[Sequence[str]] = None
+    ) -> dict[str, dict]:
+        """
+        Serve cached users from memory and the rest in one backend batch.
+
+        Bulk reads do not populate the cache: an analytics scan must not evict
+        the users who are chatting right now.
+        """
+        user_ids = list(user_ids)
+        found: dict[str, dict] = {}
+        with self._lock:
+            cached = {
+                u: self._entries[u].value for u in user_ids if u in self._entries
+            }
+        for user_id, value in cached.items():
+            found[user_id] = self._project(value, fields)
+        misses = [u for u in user_ids if u not in found]
+        if misses:
+            found.update(self.backend.load_many(misses, fields))
+        return {u: found[u] for u in user_ids if u in found}
+
+    def save_many(self, states: Mapping[str, dict]) -> None:
+        for user_id, state in states.items():
+            self.save(user_id, state)
+
+    def iter_states(
+        self,
+        batch_size: int = 100,
+        fields: Optional[Sequence[str]] = None,
+        on_error: Optional[Callable[[str, Exception], None]] = None,
+    ) -> Iterator[tuple[str, dict]]:
+        # Let the backend page through everything, including our own saves
+        self.flush()
+        return self.backend.iter_states(batch_size, fields, on_error)
+
+    def idle_users(self, before: float) -> list[str]:
+        # Cached users are in use; the rest is up to the backend's records
+        self.flush()
+        with self._lock:
+            cached = set(self._entries)
+        return [u for u in self.backend.idle_users(before) if u not in cached]
+
+    def exists(self, user_id: str) -> bool:
+        with self._lock:
+            if user_id in self._entries:
+                return True
+        return self.backend.exists(user_id)
+
+    def delete(self, user_id: str) -> None:
+        with self._flush_lock:
+            with self._lock:
+                entry = self._entries.pop(user_id, None)
+            if self.backend.exists(user_id):
+                self.backend.delete(user_id)
+            elif entry is None:
+                raise PersistenceError(f"User {user_id} does not exist")
+
+    def list_users(self, **filters: Any) -> list[str]:
+        if filters:
+            # Pagination/filters (FileBackend) are answered by the backend
+            self.flush()
+            return self.backend.list_users(**filters)
+        with self._lock:
+            unflushed = [u for u, e in self._entries.items() if e.dirty]
+        users = self.backend.list_users()
+        known = set(users)
+        return users + [u for u in unflushed if u not in known]
+
+    def clear_all(self) -> None:
+        with self._flush_lock:
+            with self._lock:
+                self._entries.clear()
+            clear = getattr(self.backend, "clear_all", None)
+            if clear is not None:
+                clear()
+
+    def get_storage_size(self) -> int:
+        return len(self.list_users())
+
+    # ------------------------------------------------------------------
+    # Async API: hits and buffered saves never leave the event loop
+    # ------------------------------------------------------------------
+
+    def _cached(self, user_id: str) -> bool:
+        with self._lock:
+            return user_id in self._entries
+
+    async def _offload_unless(self, inline: bool, fn, *args: Any) -> Any:
+        if inline:
+            return await run_inline(fn, *args)
+        return await self._offload(fn, *args)
+
+    async def aload_state(self, user_id: str) -> Optional["SessionState"]:
+        return await self._ordered(
+            user_id,
+            lambda: self._offload_unless(
+                self._cached(user_id), self.load_state, user_id
+            ),
+        )
+
+    async def aload(
+        self, user_id: str, fields: Optional[Sequence[str]] = None
+    ) -> Optional[dict]:
+        return await self._ordered(
+            user_id,
+            lambda: self._offload_unless(
+                self._cached(user_id), self.load, user_id, fields
+            ),
+        )
+
+    def _save_is_inline(self, user_id: str) -> bool:
+        # A save that makes the cache overflow writes evicted entries through
+        with self._lock:
+            return user_id in self._entries or len(self._entries) < self.max_entries
+
+    async def asave_state(self, user_id: str, state: "SessionState") -> None:
+        await self._ordered(
+            user_id,
+            lambda: self._offload_unless(
+                self._save_is_inline(user_id), self.save_state, user_id, state
+            ),
+        )
+
+    async def asave(self, user_id: str, state: dict) -> None:
+        await self._ordered(
+            user_id,
+            lambda: self._offload_unless(
+                self._save_is_inline(user_id), self.save, user_id, state
+            ),
+        )
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "backend":  # not initialized yet (e.g. during unpickling)
+            raise AttributeError(name)
+        # Backend-specific extras (batch, user_info, ...) pass through,
+        # after pending writes so they observe our own saves.
+        attr = getattr(self.backend, name)
+        if callable(attr):
+            self.flush()
+        return attr
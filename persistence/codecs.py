@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+State serialization codecs for persistence backends.
+
+A codec turns a state dict into bytes and back:
+- format:      "json" (compact; orjson when installed) or "msgpack"
+- compression: None, "zlib" or "zstd", optionally with a shared dictionary
+               trained on our own conversations (small states compress well
+               only with a dictionary)
+
+Every encoded blob except plain JSON starts with one header byte
+(format and compression), so `decode` recognizes any codec regardless of
+how the backend is configured today. Plain JSON is written bare: it starts
+with "{", which also keeps files written before this module readable.
+
+Optional dependencies (orjson, msgpack, zstandard) are imported lazily; asking
+for a codec whose package is missing raises PersistenceError.
+
+Train a dictionary from the stored states:
+    python -m persistence.codecs train [--source data] [--out data/codec.dict]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import threading
+import zlib
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+from .backend import PersistenceError
+
+try:
+    import orjson
+except ImportError:  # optional speed-up
+    orjson = None
+
+# Header byte = format << 4 | compression flags. Format ids 0x8/0x9 put every
+# header in 0x80-0x9F: UTF-8 continuation bytes, which never start JSON text.
+FORMATS = {"json": 0x8, "msgpack": 0x9}
+COMPRESSIONS = {None: 0x0, "zlib": 0x1, "zstd": 0x2}
+_DICT_FLAG = 0x8  # compression used the shared dictionary
+
+# zlib can use at most the last 32 KB of a dictionary
+_ZLIB_DICT_LIMIT = 32 * 1024
+
+
+def _require(module: str):
+    try:
+        return __import__(module)
+    except ImportError as exc:
+        raise PersistenceError(
+            f"Codec requires the '{module}' package (pip install {module})"
+        ) from exc
+
+
+def _json_dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _json_loads(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class StateCodec:
+    """Encode/decode state dicts; decoding auto-detects the writer's codec."""
+
+    def __init__(
+        self,
+        format: str = "json",
+        compression: Optional[str] = None,
+        level: int = 3,
+        dictionary: Optional[bytes] = None,
+    ):
+        """Initialize codec.
+
+        Args:
+            format: "json" or "msgpack".
+            compression: None, "zlib" or "zstd".
+            level: Compression level.
+            dictionary: Shared dictionary (see train_dictionary). Used for
+                encoding when set, and needed to decode blobs written with it.
+        """
+        if format not in FORMATS:
+            raise PersistenceError(f"Unknown codec format: {format}")
+        if compression not in COMPRESSIONS:
+            raise PersistenceError(f"Unknown codec compression: {compression}")
+        if format == "msgpack":
+            _require("msgpack")
+        if compression == "zstd":
+            _require("zstandard")
+        self.format = format
+        self.compression = compression
+        self.level = level
+        self.dictionary = dictionary
+        self._local = threading.local()  # zstd (de)compressors are per thread
+
+        flags = COMPRESSIONS[compression]
+        if compression and dictionary:
+            flags |= _DICT_FLAG
+        self._header = bytes([FORMATS[format] << 4 | flags])
+
+    @classmethod
+    def from_config(cls) -> "StateCodec":
+        """Codec selected by Config.STATE_CODEC / STATE_COMPRESSION."""
+        from config import Config
+
+        dictionary = None
+        dict_path = Config.STATE_CODEC_DICT
+        if Config.STATE_COMPRESSION and dict_path and Path(dict_path).exists():
+            dictionary = Path(dict_path).read_bytes()
+        return cls(
+            Config.STATE_CODEC,
+            Config.STATE_COMPRESSION,
+            level=Config.STATE_COMPRESSION_LEVEL,
+            dictionary=dictionary,
+        )
+
+    @property
+    def name(self) -> str:
+        parts = [self.format]
+        if self.compression:
+            parts.append(self.compression + ("+dict" if self.dictionary else ""))
+        return "/".join(parts)
+
+    # ------------------------------------------------------------------
+    # Serialization
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _serialize(format: str, obj: Any) -> bytes:
+        if format == "msgpack":
+            return _require("msgpack").packb(obj, use_bin_type=True)
+        return _json_dumps(obj)
+
+    @staticmethod
+    def _deserialize(format: str, data: bytes) -> Any:
+        if format == "msgpack":
+            return _require("msgpack").unpackb(data, raw=False)
+        return _json_loads(data)
+
+    # ------------------------------------------------------------------
+    # Compression
+    # ------------------------------------------------------------------
+
+    def _zstd_compressor(self):
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            zstd = _require("zstandard")
+            dict_data = (
+                zstd.ZstdCompressionDict(self.dictionary) if self.dictionary else None
+            )
+            compressor = zstd.ZstdCompressor(level=self.level, dict_data=dict_data)
+            self._local.compressor = compressor
+        return compressor
+
+    def _zstd_decompressor(self, with_dict: bool):
+        attr = "decompressor_dict" if with_dict else "decompressor"
+        decompressor = getattr(self._local, attr, None)
+        if decompressor is None:
+            zstd = _require("zstandard")
+            dict_data = zstd.ZstdCompressionDict(self.dictionary) if with_dict else None
+            decompressor = zstd.ZstdDecompressor(dict_data=dict_data)
+            setattr(self._local, attr, decompressor)
+        return decompressor
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.compression == "zstd":
+            return self._zstd_compressor().compress(data)
+        if self.dictionary:
+            compressor = zlib.compressobj(
+                self.level, zdict=self.dictionary[-_ZLIB_DICT_LIMIT:]
+            )
+            return compressor.compress(data) + compressor.flush()
+        return zlib.compress(data, self.level)
+
+    def _decompress(self, compression: str, with_dict: bool, data: bytes) -> bytes:
+        if with_dict and not self.dictionary:
+            raise PersistenceError(
+                "State was compressed with a shared dictionary; "
+                "configure STATE_CODEC_DICT to read it"
+            )
+        if compression == "zstd":
+            return self._zstd_decompressor(with_dict).decompress(data)
+        if with_dict:
+            decompressor = zlib.decompressobj(zdict=self.dictionary[-_ZLIB_DICT_LIMIT:])
+            return decompressor.decompress(data) + decompressor.flush()
+        return zlib.decompress(data)
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def encode(self, obj: Any) -> bytes:
+        """Serialize (and compress) `obj`, prefixed by the header byte."""
+        payload = self._serialize(self.format, obj)
+        if self.compression is None:
+            if self.format == "json":
+                return payload  # bare JSON, self-describing via "{"
+            return self._header + payload
+        return self._header + self._compress(payload)
+
+    def decode(self, data: bytes) -> Any:
+        """Decode a blob written by any codec (or legacy plain JSON)."""
+        if not data:
+            raise PersistenceError("Cannot decode empty state blob")
+        header = data[0]
+        if header in b"{[ \t\r\n":
+            return _json_loads(data)
+
+        fmt_id, flags = header >> 4, header & 0x0F
+        format = next((f for f, i in FORMATS.items() if i == fmt_id), None)
+        compression = next(
+            (c for c, i in COMPRESSIONS.items() if i == flags & ~_DICT_FLAG), "?"
+        )
+        if format is None or compression == "?":
+            raise PersistenceError(f"Unknown state codec header: 0x{header:02x}")
+
+        payload = data[1:]
+        if compression is not None:
+            payload = self._decompress(compression, bool(flags & _DICT_FLAG), payload)
+        return self._deserialize(format, payload)
+
+
+def train_dictionary(samples: Iterable[bytes], size: int = 16 * 1024) -> bytes:
+    """
+    Train a zstd dictionary on serialized states.
+
+    Train on blobs serialized with the format you will use (the header-less
+    output of StateCodec(format).encode). The result works for both zstd and
+    zlib codecs.
+    """
+    zstd = _require("zstandard")
+    samples = list(samples)
+    if len(samples) < 8:
+        raise PersistenceError(
+            f"Need at least 8 samples to train a dictionary, got {len(samples)}"
+        )
+    return zstd.train_dictionary(size, samples).as_bytes()
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """CLI: train the shared compression dictionary from stored states."""
+    from config import Config
+    from .file_backend import FileBackend
+
+    parser = argparse.ArgumentParser(description="State codec tools.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    train = sub.add_parser("train", help="Train a shared compression dictionary")
+    train.add_argument("--source", type=Path, default=Config.DATA_DIR)
+    train.add_argument("--out", type=Path, default=Config.STATE_CODEC_DICT)
+    train.add_argument("--size", type=int, default=16 * 1024)
+    train.add_argument("--format", choices=sorted(FORMATS), default=Config.STATE_CODEC)
+    args = parser.parse_args(argv)
+
+    source = FileBackend(args.source)
+    plain = StateCodec(args.format)
+    samples = []
+    for user_id in source.list_users():
+        state = source.load(user_id)
+        if state is not None:
+            blob = plain.encode(state)
+            samples.append(blob if args.format == "json" else blob[1:])
+
+    dictionary = train_dictionary(samples, args.size)
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+    args.out.write_bytes(dictionary)
+    print(f"[Codecs] Trained {len(dictionary)} B dictionary on {len(samples)} states -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,81 +2,573 @@
 """
 File-based Persistence Backend
 
-Stores each user's state as a JSON file on disk.
+Stores each user's state on disk as two files in a hash-prefix shard
+directory (<storage_dir>/ab/cd/, from a digest of the user id, so no
+directory grows past a few entries even with millions of users):
+- <user_id>.state.json     compact snapshot of every scalar field
+- <user_id>.history.jsonl  append-only log of conversation_history (1 msg/line)
+
+A turn appends only the new messages to the log and rewrites the small
+snapshot, so the cost of a save does not grow with the length of the
+conversation. The snapshot records how many messages (and bytes) of the log
+are committed; anything past that offset is a leftover of an interrupted save
+and is ignored on load and truncated on the next append. A load that does not
+ask for conversation_history (`fields`) reads the snapshot alone.
+
+The snapshot is encoded with a StateCodec (compact JSON by default, see
+persistence/codecs.py); loads detect the codec from the file itself. The log
+stays plain JSON lines so it can be appended to and tailed.
+
+Files of the older flat layout (<storage_dir>/<user_id>.state.json, and
+legacy <user_id>.json files with the full pretty-printed state) are moved into
+the sharded layout transparently the first time they are loaded.
+
+A manifest (<storage_dir>/manifest.jsonl, see persistence/manifest.py) indexes
+user_id, last activity, size and turn count. Saves and deletes update it
+incrementally; `list_users` and `get_storage_size` are served from it instead
+of walking the directory tree.
+
+Crash safety: the snapshot is replaced atomically (temp file + rename) and,
+with `fsync=True`, the log is synced before the snapshot that commits it.
+Every operation on a user holds an advisory fcntl lock
+(<storage_dir>/.locks/ab/cd/<user_id>.lock), so concurrent saves from several
+threads or worker processes never interleave.
+
 Intended for simple persistence across restarts (dev/demo), not for heavy prod.
 """
 
 from __future__ import annotations
 
+import hashlib
 import json
+import os
+import re
+import shutil
+import time
 from pathlib import Path
-from typing import Optional
-import copy
+from typing import BinaryIO, Iterator, Optional, Sequence
+
+from .backend import PersistenceBackend, PersistenceError, needs_history, project
+from .codecs import StateCodec
+from .durability import GroupCommitter, atomic_write_bytes, user_lock
+from .manifest import ManifestEntry, UserManifest
+
+SNAPSHOT_SUFFIX = ".state.json"
+HISTORY_SUFFIX = ".history.jsonl"
+LEGACY_SUFFIX = ".json"
+MANIFEST_NAME = "manifest.jsonl"
+
+# Shard directory names: two levels of two hex digits
+_SHARD_RE = re.compile(r"^[0-9a-f]{2}$")
+
+# Key under which the snapshot stores the committed extent of the history log
+HISTORY_META_KEY = "__history__"
+
+_READ_BLOCK = 64 * 1024
+
+
+def _dumps(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
 
-from .backend import PersistenceBackend, PersistenceError
+
+def _message_digest(message: dict) -> str:
+    return hashlib.blake2b(_dumps(message).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def shard_of(user_id: str) -> tuple[str, str]:
+    """Shard directory names of a user, e.g. ("ab", "cd")."""
+    digest = hashlib.blake2b(user_id.encode("utf-8"), digest_size=2).hexdigest()
+    return digest[:2], digest[2:]
+
+
+def _count_turns(history: list[dict]) -> int:
+    return sum(1 for msg in history if msg.get("role") == "user")
 
 
 class FileBackend(PersistenceBackend):
-    """Persist user state to disk as JSON files."""
+    """Persist user state to disk as a JSON snapshot plus a JSONL history log."""
+
+    shared = True  # workers and a standalone api.py share the directory (flock)
 
-    def __init__(self, storage_dir: Path):
+    def __init__(
+        self,
+        storage_dir: Path,
+        fsync: bool = False,
+        group_commit: Optional[GroupCommitter] = None,
+        codec: Optional[StateCodec] = None,
+    ):
         """Initialize backend.
 
         Args:
             storage_dir: Directory where user files will be stored.
+            fsync: Sync data to disk before a save returns (durable, slower).
+            group_commit: Optional GroupCommitter batching fsyncs of
+                concurrent saves (only used with fsync=True).
+            codec: Snapshot serialization (default: compact JSON).
         """
         self.storage_dir = Path(storage_dir)
         self.storage_dir.mkdir(parents=True, exist_ok=True)
+        self.locks_dir = self.storage_dir / ".locks"
+        self.locks_dir.mkdir(exist_ok=True)
+        self.fsync = fsync
+        self.group_commit = group_commit
+        self.codec = codec or StateCodec()
+        self._made_dirs: set[Path] = set()
+
+        self.manifest = UserManifest(
+            self.storage_dir / MANIFEST_NAME, self.locks_dir / "manifest.lock"
+        )
+        if not self.manifest.exists():
+            self.rebuild_manifest()
+
+    # ------------------------------------------------------------------
+    # Paths
+    # ------------------------------------------------------------------
+
+    def _ensure_dir(self, directory: Path) -> Path:
+        if directory not in self._made_dirs:
+            directory.mkdir(parents=True, exist_ok=True)
+            self._made_dirs.add(directory)
+        return directory
+
+    def _shard_dir(self, user_id: str) -> Path:
+        return self.storage_dir.joinpath(*shard_of(user_id))
+
+    def _snapshot_path(self, user_id: str) -> Path:
+        return self._shard_dir(user_id) / f"{user_id}{SNAPSHOT_SUFFIX}"
+
+    def _history_path(self, user_id: str) -> Path:
+        return self._shard_dir(user_id) / f"{user_id}{HISTORY_SUFFIX}"
+
+    def _flat_snapshot_path(self, user_id: str) -> Path:
+        return self.storage_dir / f"{user_id}{SNAPSHOT_SUFFIX}"
+
+    def _flat_history_path(self, user_id: str) -> Path:
+        return self.storage_dir / f"{user_id}{HISTORY_SUFFIX}"
+
+    def _legacy_path(self, user_id: str) -> Path:
+        return self.storage_dir / f"{user_id}{LEGACY_SUFFIX}"
+
+    def _lock(self, user_id: str, shared: bool = False):
+        lock_dir = self._ensure_dir(self.locks_dir.joinpath(*shard_of(user_id)))
+        return user_lock(lock_dir / f"{user_id}.lock", shared=shared)
+
+    # ------------------------------------------------------------------
+    # Snapshot / log primitives
+    # ------------------------------------------------------------------
+
+    def _read_snapshot(self, user_id: str) -> Optional[dict]:
+        path = self._snapshot_path(user_id)
+        if not path.exists():
+            return None
+        return self.codec.decode(path.read_bytes())
+
+    def _write_snapshot(
+        self, user_id: str, snapshot: dict, sync_with: tuple[int, ...] = ()
+    ) -> int:
+        """Atomically replace the snapshot; returns its size in bytes."""
+        data = self.codec.encode(snapshot)
+        atomic_write_bytes(
+            self._snapshot_path(user_id),
+            data,
+            fsync=self.fsync,
+            committer=self.group_commit,
+            sync_with=sync_with,
+        )
+        return len(data)
+
+    def _write_history(
+        self, user_id: str, history: list[dict], meta: Optional[dict]
+    ) -> tuple[dict, Optional[BinaryIO]]:
+        """
+        Bring the log in line with `history`.
+
+        Appends only the messages past the committed count when the committed
+        prefix is unchanged (checked via the digest of its last message);
+        otherwise the log is rewritten from scratch (e.g. after a reset).
+
+        Returns:
+            (new history meta, still-open log file that must be synced
+            together with the snapshot, or None)
+        """
+        path = self._history_path(user_id)
+        count = meta["count"] if meta else 0
+        offset = meta["bytes"] if meta else 0
+
+        can_append = (
+            meta is not None
+            and len(history) >= count
+            and (count == 0 or _message_digest(history[count - 1]) == meta["last"])
+            and path.exists()
+        )
+        if not can_append:
+            count, offset = 0, 0
+
+        new_messages = history[count:]
+        payload = "".join(_dumps(msg) + "\n" for msg in new_messages).encode("utf-8")
+        new_meta = {
+            "count": len(history),
+            "bytes": offset + len(payload),
+            "last": _message_digest(history[-1]) if history else None,
+        }
+
+        if not can_append:
+            # Rewrite: the old log stays valid for the old snapshot until the
+            # rename, so a crash here cannot corrupt the committed state
+            atomic_write_bytes(
+                path, payload, fsync=self.fsync, committer=self.group_commit
+            )
+            return new_meta, None
+
+        log = open(path, "r+b")
+        try:
+            # Drop bytes of a save that never committed its snapshot
+            log.seek(offset)
+            log.truncate()
+            log.write(payload)
+            log.flush()
+        except BaseException:
+            log.close()
+            raise
+        return new_meta, log
+
+    def _read_history_tail(
+        self, user_id: str, meta: dict, limit: Optional[int] = None
+    ) -> list[dict]:
+        """Read the committed log, or only its last `limit` messages."""
+        if not meta["count"] or (limit is not None and limit <= 0):
+            return []
+        with open(self._history_path(user_id), "rb") as f:
+            if limit is None or limit >= meta["count"]:
+                data = f.read(meta["bytes"])
+            else:
+                data = b""
+                pos = meta["bytes"]
+                # limit lines need limit + 1 newlines unless we reach the start
+                while pos > 0 and data.count(b"\n") <= limit:
+                    step = min(_READ_BLOCK, pos)
+                    pos -= step
+                    f.seek(pos)
+                    data = f.read(step) + data
+        lines = [line for line in data.splitlines() if line]
+        if limit is not None:
+            lines = lines[-limit:]
+        return [json.loads(line) for line in lines]
+
+    def _save_locked(self, user_id: str, state: dict) -> None:
+        previous = self._read_snapshot(user_id)
+        meta = previous.get(HISTORY_META_KEY) if previous else None
+        if previous is None:
+            self._ensure_dir(self._shard_dir(user_id))
+
+        history = state.get("conversation_history") or []
+        snapshot = {k: v for k, v in state.items() if k != "conversation_history"}
+        # Log first, snapshot second: the snapshot commits the append. With
+        # fsync, the appended log is synced in the same batch as the snapshot
+        # temp file, before the rename makes the new snapshot visible.
+        snapshot[HISTORY_META_KEY], log = self._write_history(user_id, history, meta)
+        try:
+            snapshot_bytes = self._write_snapshot(
+                user_id, snapshot, sync_with=(log.fileno(),) if log else ()
+            )
+        finally:
+            if log is not None:
+                log.close()
+
+        self.manifest.record(
+            ManifestEntry(
+                user_id=user_id,
+                last_active=time.time(),
+                bytes=snapshot_bytes + snapshot[HISTORY_META_KEY]["bytes"],
+                turns=_count_turns(history),
+            )
+        )
+
+    def _migrate_flat(self, user_id: str) -> bool:
+        """
+        Move a user's files from the flat layout into its shard directory.
 
-    def _path_for(self, user_id: str) -> Path:
-        return self.storage_dir / f"{user_id}.json"
+        History first, snapshot last: until the snapshot moves, the user is
+        still read from the flat layout, so a crash in between is harmless.
+        Returns True if anything was moved.
+        """
+        flat_snapshot = self._flat_snapshot_path(user_id)
+        if not flat_snapshot.exists():
+            return False
+        with self._lock(user_id):
+            if not flat_snapshot.exists():  # moved by another worker meanwhile
+                return False
+            self._ensure_dir(self._shard_dir(user_id))
+            flat_history = self._flat_history_path(user_id)
+            if flat_history.exists():
+                os.replace(flat_history, self._history_path(user_id))
+            os.replace(flat_snapshot, self._snapshot_path(user_id))
+        return True
+
+    def _migrate_legacy(self, user_id: str) -> Optional[dict]:
+        """
+        Convert a legacy <user_id>.json file into the snapshot + log layout.
+
+        Returns the migrated state, or None when there is nothing to migrate.
+        """
+        legacy = self._legacy_path(user_id)
+        if not legacy.exists():
+            return None
+        with self._lock(user_id):
+            if not legacy.exists():  # migrated by another worker meanwhile
+                return None
+            with open(legacy, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            self._save_locked(user_id, state)
+            legacy.unlink()
+        return state
+
+    def _load_snapshot_and_history(
+        self, user_id: str, limit: Optional[int] = None
+    ) -> Optional[tuple[dict, list[dict]]]:
+        if not self._snapshot_path(user_id).exists():
+            if not self._migrate_flat(user_id):
+                return None
+        with self._lock(user_id, shared=True):
+            snapshot = self._read_snapshot(user_id)
+            if snapshot is None:
+                return None
+            meta = snapshot.pop(HISTORY_META_KEY)
+            return snapshot, self._read_history_tail(user_id, meta, limit)
+
+    # ------------------------------------------------------------------
+    # PersistenceBackend API
+    # ------------------------------------------------------------------
 
     def save(self, user_id: str, state: dict) -> None:
-        """Save user state to disk as JSON."""
+        """Append new history messages and atomically replace the snapshot."""
         try:
-            path = self._path_for(user_id)
-            with open(path, "w", encoding="utf-8") as f:
-                json.dump(state, f, ensure_ascii=False, indent=5)
+            with self._lock(user_id):
+                self._save_locked(user_id, state)
         except Exception as exc:
             raise PersistenceError(
                 f"Failed to save state for {user_id}: {exc}"
             ) from exc
 
-    def load(self, user_id: str) -> Optional[dict]:
-        """Load user state from disk."""
-        path = self._path_for(user_id)
-        if not path.exists():
-            return None
+    def load(
+        self, user_id: str, fields: Optional[Sequence[str]] = None
+    ) -> Optional[dict]:
+        """
+        Load user state from disk (migrating legacy files on first access).
+
+        Without conversation_history in `fields` only the snapshot is read
+        (no log, no lock: snapshots are replaced atomically).
+        """
+        if not needs_history(fields):
+            return self._load_snapshot_only(user_id, fields)
         try:
-            with open(path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            return copy.deepcopy(data)
+            loaded = self._load_snapshot_and_history(user_id)
+            if loaded is None:
+                migrated = self._migrate_legacy(user_id)
+                if migrated is not None:
+                    return project(migrated, fields)
+                # Lost a race with another worker's migration
+                loaded = self._load_snapshot_and_history(user_id)
+                if loaded is None:
+                    return None
+            snapshot, history = loaded
+            snapshot["conversation_history"] = history
+            return project(snapshot, fields)
+        except Exception as exc:
+            raise PersistenceError(
+                f"Failed to load state for {user_id}: {exc}"
+            ) from exc
+
+    def _load_snapshot_only(
+        self, user_id: str, fields: Sequence[str]
+    ) -> Optional[dict]:
+        try:
+            snapshot = self._read_snapshot(user_id)
         except Exception as exc:
             raise PersistenceError(
                 f"Failed to load state for {user_id}: {exc}"
             ) from exc
+        if snapshot is None:
+            snapshot = self.load(user_id)  # flat/legacy layout, migrates
+            if snapshot is None:
+                return None
+        snapshot.pop(HISTORY_META_KEY, None)
+        return project(snapshot, fields)
+
+    def _user_pages(self, batch_size: int) -> Iterator[list[str]]:
+        # Keyset pages straight from the manifest
+        after = None
+        while True:
+            page = self.list_users(limit=batch_size, after=after)
+            if not page:
+                return
+            yield page
+            after = page[-1]
+
+    def load_history(self, user_id: str, limit: Optional[int] = None) -> list[dict]:
+        """
+        Read the last `limit` messages of a user's history (all if None).
+
+        Reads the log backwards in blocks from the committed end, so the cost
+        depends on `limit`, not on the length of the conversation.
+        """
+        try:
+            loaded = self._load_snapshot_and_history(user_id, limit)
+            if loaded is None:
+                state = self._migrate_legacy(user_id)
+                if state is None:
+                    loaded = self._load_snapshot_and_history(user_id, limit)
+                    return loaded[1] if loaded else []
+                history = state.get("conversation_history", [])
+                return history[-limit:] if limit else history
+            return loaded[1]
+        except Exception as exc:
+            raise PersistenceError(
+                f"Failed to load history for {user_id}: {exc}"
+            ) from exc
 
     def exists(self, user_id: str) -> bool:
-        return self._path_for(user_id).exists()
+        return (
+            self._snapshot_path(user_id).exists()
+            or self._flat_snapshot_path(user_id).exists()
+            or self._legacy_path(user_id).exists()
+        )
 
     def delete(self, user_id: str) -> None:
-        path = self._path_for(user_id)
-        if not path.exists():
+        if not self.exists(user_id):
             raise PersistenceError(f"User {user_id} does not exist")
         try:
-            path.unlink()
+            with self._lock(user_id):
+                # Snapshot first: without it the user no longer exists
+                for path in (
+                    self._snapshot_path(user_id),
+                    self._history_path(user_id),
+                    self._flat_snapshot_path(user_id),
+                    self._flat_history_path(user_id),
+                    self._legacy_path(user_id),
+                ):
+                    path.unlink(missing_ok=True)
+                self.manifest.remove(user_id)
         except Exception as exc:
             raise PersistenceError(
                 f"Failed to delete state for {user_id}: {exc}"
             ) from exc
 
-    def list_users(self) -> list[str]:
-        return [p.stem for p in self.storage_dir.glob("*.json") if p.is_file()]
+    def delete_if_unchanged(self, user_id: str, expected: dict) -> bool:
+        """Compare and delete under the user's exclusive lock (all processes)."""
+        try:
+            with self._lock(user_id):
+                snapshot = self._read_snapshot(user_id)
+                if snapshot is None:
+                    return False
+                meta = snapshot.pop(HISTORY_META_KEY)
+                snapshot["conversation_history"] = self._read_history_tail(
+                    user_id, meta
+                )
+                if snapshot != expected:
+                    return False
+                for path in (
+                    self._snapshot_path(user_id),
+                    self._history_path(user_id),
+                ):
+                    path.unlink(missing_ok=True)
+                self.manifest.remove(user_id)
+                return True
+        except Exception as exc:
+            raise PersistenceError(
+                f"Failed to delete state for {user_id}: {exc}"
+            ) from exc
+
+    def list_users(
+        self,
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
+        active_since: Optional[float] = None,
+    ) -> list[str]:
+        """
+        List user IDs (sorted) from the manifest.
+
+        Args:
+            limit: Page size (None = all users).
+            after: Cursor - the last user_id of the previous page.
+            active_since: Only users saved at or after this Unix timestamp.
+        """
+        return self.manifest.users(limit=limit, after=after, active_since=active_since)
+
+    def idle_users(self, before: float) -> list[str]:
+        return self.manifest.idle(before)
+
+    def user_info(self, user_id: str) -> Optional[ManifestEntry]:
+        """Manifest entry (last_active, bytes, turns) of a user."""
+        return self.manifest.get(user_id)
+
+    def _shard_dirs(self) -> list[Path]:
+        return [
+            p
+            for p in self.storage_dir.iterdir()
+            if p.is_dir() and _SHARD_RE.match(p.name)
+        ]
+
+    def rebuild_manifest(self) -> int:
+        """
+        Recreate the manifest by scanning the user files (sharded, flat and
+        legacy). Runs automatically when the manifest is missing, e.g. the
+        first time an older data directory is opened. Returns the user count.
+        """
+        entries: dict[str, ManifestEntry] = {}
+
+        def add(user_id: str, path: Path, history: list[dict], size: int) -> None:
+            entries[user_id] = ManifestEntry(
+                user_id=user_id,
+                last_active=path.stat().st_mtime,
+                bytes=size,
+                turns=_count_turns(history),
+            )
+
+        snapshots = list(self.storage_dir.glob(f"*{SNAPSHOT_SUFFIX}"))
+        for shard in self._shard_dirs():
+            snapshots.extend(shard.glob(f"*/*{SNAPSHOT_SUFFIX}"))
+        for path in snapshots:
+            user_id = path.name[: -len(SNAPSHOT_SUFFIX)]
+            snapshot = self.codec.decode(path.read_bytes())
+            meta = snapshot[HISTORY_META_KEY]
+            history_path = path.with_name(f"{user_id}{HISTORY_SUFFIX}")
+            history = []
+            if meta["count"]:
+                with open(history_path, "rb") as f:
+                    history = [
+                        json.loads(line)
+                        for line in f.read(meta["bytes"]).splitlines()
+                        if line
+                    ]
+            add(user_id, path, history, path.stat().st_size + meta["bytes"])
+
+        for path in self.storage_dir.glob(f"*{LEGACY_SUFFIX}"):
+            if path.name.endswith(SNAPSHOT_SUFFIX) or not path.is_file():
+                continue
+            user_id = path.name[: -len(LEGACY_SUFFIX)]
+            if user_id in entries:
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            history = state.get("conversation_history", [])
+            add(user_id, path, history, path.stat().st_size)
+
+        self.manifest.replace_all(sorted(entries.values(), key=lambda e: e.user_id))
+        return len(entries)
 
     def clear_all(self) -> None:
-        for p in self.storage_dir.glob("*.json"):
-            if p.is_file():
-                p.unlink()
+        for shard in self._shard_dirs():
+            shutil.rmtree(shard)
+        for pattern in (f"*{LEGACY_SUFFIX}", f"*{HISTORY_SUFFIX}"):
+            for p in self.storage_dir.glob(pattern):
+                if p.is_file() and p.name != MANIFEST_NAME:
+                    p.unlink()
+        self.manifest.close()  # its lock file goes away with .locks
+        shutil.rmtree(self.locks_dir, ignore_errors=True)
+        self.locks_dir.mkdir()
+        self._made_dirs.clear()
+        self.manifest.clear()
 
     def get_storage_size(self) -> int:
-        return len(self.list_users())
+        return len(self.manifest)
@@ -4,12 +4,22 @@ InMemory Persistence Backend
 Simple in-memory storage for development and testing.
 State is lost on app restart - use only for dev/testing.
 
+States are kept encoded (StateCodec bytes): one encode/decode is cheaper than
+two deep copies, the stored value can never be mutated by a caller, and with
+compression enabled many more users fit in RAM.
+
+The states live in a StripedStore (persistence/shared_store.py): thread-safe
+with per-user lock stripes, and optionally served from a separate process so
+several workers on one host share the same states.
+
 NOTE: Ten plik jest reużywalny - nie wymaga modyfikacji przez studenta.
 """
 
-from typing import Optional
-from .backend import PersistenceBackend, PersistenceError
-import copy
+from typing import Any, Callable, Iterable, Mapping, Optional, Sequence
+from .aio import run_inline
+from .backend import PersistenceBackend, PersistenceError, project
+from .codecs import StateCodec
+from .shared_store import StripedStore
 
 
 class InMemoryBackend(PersistenceBackend):
@@ -24,47 +34,92 @@ class InMemoryBackend(PersistenceBackend):
     Disadvantages:
     - State lost on restart
     - Not suitable for production
-    - No multi-process support
+    - Multi-process only through a shared store process
     """
 
-    def __init__(self):
-        """Initialize empty storage."""
-        self._storage: dict[str, dict] = {}
+    def __init__(
+        self, codec: Optional[StateCodec] = None, store: Optional[StripedStore] = None
+    ):
+        """Initialize empty storage.
+
+        Args:
+            codec: Serialization of stored states (default: compact JSON).
+            store: Shared store proxy (shared_store.connect); default: a
+                private store of this process.
+        """
+        self.shared = store is not None
+        self._store = store if store is not None else StripedStore()
+        self.codec = codec or StateCodec()
 
     def save(self, user_id: str, state: dict) -> None:
         """Save user state to memory."""
-        # Deep copy to avoid reference issues
-        self._storage[user_id] = copy.deepcopy(state)
+        # Encoded copy, so later mutations of `state` do not leak in
+        self._store.put(user_id, self.codec.encode(state))
 
-    def load(self, user_id: str) -> Optional[dict]:
+    def load(
+        self, user_id: str, fields: Optional[Sequence[str]] = None
+    ) -> Optional[dict]:
         """Load user state from memory."""
-        state = self._storage.get(user_id)
+        data = self._store.get(user_id)
 
-        if state is None:
+        if data is None:
             return None
 
-        # Return deep copy to avoid mutations affecting stored state
-        return copy.deepcopy(state)
+        # Fresh objects on every load, mutations never affect stored state
+        return project(self.codec.decode(data), fields)
+
+    def load_many(
+        self, user_ids: Iterable[str], fields: Optional[Sequence[str]] = None
+    ) -> dict[str, dict]:
+        """Load several users with one store call."""
+        user_ids = list(user_ids)
+        found = self._store.get_many(user_ids)
+        return {
+            u: project(self.codec.decode(found[u]), fields)
+            for u in user_ids
+            if u in found
+        }
+
+    def save_many(self, states: Mapping[str, dict]) -> None:
+        """Save several users with one store call."""
+        self._store.put_many(
+            {u: self.codec.encode(state) for u, state in states.items()}
+        )
 
     def exists(self, user_id: str) -> bool:
         """Check if user has saved state."""
-        return user_id in self._storage
+        return self._store.contains(user_id)
 
     def delete(self, user_id: str) -> None:
         """Delete user state."""
-        if not self.exists(user_id):
+        if not self._store.delete(user_id):
             raise PersistenceError(f"User {user_id} does not exist")
 
-        del self._storage[user_id]
+    def delete_if_unchanged(self, user_id: str, expected: dict) -> bool:
+        """Compare-and-delete on the stored bytes (atomic in the store)."""
+        data = self._store.get(user_id)
+        if data is None or self.codec.decode(data) != expected:
+            return False
+        return self._store.delete_if(user_id, data)
 
     def list_users(self) -> list[str]:
         """List all user IDs."""
-        return list(self._storage.keys())
+        return self._store.keys()
 
     def clear_all(self) -> None:
         """Clear all stored data (useful for testing)."""
-        self._storage.clear()
+        self._store.clear()
+
+    def idle_users(self, before: float) -> list[str]:
+        """Users not saved since `before` (Unix timestamp)."""
+        return self._store.idle(before)
 
     def get_storage_size(self) -> int:
         """Get number of users in storage."""
-        return len(self._storage)
+        return self._store.size()
+
+    async def _offload(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """No I/O in a private store - async calls run inline instead of on a thread."""
+        if self.shared:
+            return await super()._offload(fn, *args)
+        return await run_inline(fn, *args)
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+User lifecycle: hot backend + cold archive.
+
+TieredBackend wraps the hot backend. A sweep moves users idle for longer than
+`ttl_s` into a ColdArchive (compressed, per-day SQLite files) and removes them
+from the hot backend; the next `load` of such a user brings the state back
+(rehydration) transparently. Sweeps run on a background thread every
+`sweep_interval_s`, or from cron:
+
+    python -m persistence.lifecycle sweep [--ttl-days 30]
+    python -m persistence.lifecycle stats
+
+The sweep archives before it deletes, so a crash in between leaves a user in
+both tiers (the hot copy wins) rather than in neither. The hot copy is then
+removed with delete_if_unchanged, which compares it with the archived copy
+and deletes atomically in the backend (file lock, SQLite write transaction,
+Redis WATCH, store stripe): a user who saved in the meantime, in this process
+or another one, keeps their hot state and the stale archived copy is dropped.
+In this process saves, rehydrations and deletes of a user also take the same
+lock, so a rehydration never races a sweep.
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Iterable, Optional, Sequence
+
+from utils.metrics import REGISTRY
+
+from .archive import ColdArchive
+from .backend import PersistenceBackend, PersistenceError, project
+from .shared_store import DEFAULT_STRIPES
+
+TIER_USERS = REGISTRY.gauge("coach_lifecycle_users", "Users per storage tier", ["tier"])
+LIFECYCLE_EVENTS = REGISTRY.gauge(
+    "coach_lifecycle_events",
+    "Users swept to the archive, sweeps, sweep errors and rehydrations since start",
+    ["event"],
+)
+REHYDRATE_SECONDS = REGISTRY.gauge(
+    "coach_lifecycle_rehydrate_seconds",
+    "Recent rehydration latency (last 1024 rehydrations)",
+    ["quantile"],
+)
+LAST_SWEEP_SECONDS = REGISTRY.gauge(
+    "coach_lifecycle_last_sweep_seconds", "Duration of the last sweep"
+)
+
+
+@dataclass
+class LifecycleMetrics:
+    """Counters of sweeps and rehydrations."""
+
+    swept: int = 0
+    sweeps: int = 0
+    sweep_errors: int = 0
+    rehydrated: int = 0
+    last_sweep_s: float = 0.0
+    # Recent rehydration latencies (seconds)
+    rehydrate_latencies: deque = field(default_factory=lambda: deque(maxlen=1024))
+
+    def latency_ms(self) -> dict:
+        samples = sorted(self.rehydrate_latencies)
+        if not samples:
+            return {"p50": 0.0, "p95": 0.0, "max": 0.0}
+        return {
+            "p50": round(statistics.median(samples) * 1000, 3),
+            "p95": round(samples[int(len(samples) * 0.95) - 1] * 1000, 3)
+            if len(samples) >= 20
+            else round(samples[-1] * 1000, 3),
+            "max": round(samples[-1] * 1000, 3),
+        }
+
+
+class TieredBackend(PersistenceBackend):
+    """Hot backend with TTL eviction into a cold archive."""
+
+    def __init__(
+        self,
+        hot: PersistenceBackend,
+        archive: ColdArchive,
+        ttl_s: float = 30 * 86400,
+        sweep_interval_s: Optional[float] = 3600.0,
+        batch_size: int = 200,
+    ):
+        """Initialize tiers.
+
+        Args:
+            hot: Backend serving active users.
+            archive: Cold storage for idle users.
+            ttl_s: Users idle for longer than this are archived.
+            sweep_interval_s: Period of the background sweep (None = only
+                manual `sweep()` calls, e.g. from cron).
+            batch_size: Users moved per archive transaction.
+        """
+        self.hot = hot
+        self.archive = archive
+        self.ttl_s = ttl_s
+        self.batch_size = batch_size
+        self.metrics = LifecycleMetrics()
+        self._sweep_lock = threading.Lock()
+        # Per-user locks: a save never interleaves with the sweep's re-check
+        # and delete, or with a rehydration
+        self._stripes = [threading.Lock() for _ in range(DEFAULT_STRIPES)]
+        # Users with an archived copy, so save() skips the archive lookup for
+        # everyone else (copies archived by other processes stay behind the
+        # hot state, which always wins)
+        self._archived: set[str] = set(archive.users())
+        self._stop = threading.Event()
+        self._sweeper: Optional[threading.Thread] = None
+
+        if sweep_interval_s:
+            self._sweeper = threading.Thread(
+                target=self._sweep_loop,
+                args=(sweep_interval_s,),
+                name="lifecycle-sweeper",
+                daemon=True,
+            )
+            self._sweeper.start()
+
+    @property
+    def shared(self) -> bool:
+        return self.hot.shared
+
+    def _stripe(self, user_id: str) -> threading.Lock:
+        return self._stripes[hash(user_id) % len(self._stripes)]
+
+    def _forget_archived(self, user_id: str) -> bool:
+        """Drop the archived copy of a user. Returns True if there was one."""
+        self._archived.discard(user_id)
+        return self.archive.remove(user_id)
+
+    # ------------------------------------------------------------------
+    # Sweep
+    # ------------------------------------------------------------------
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Move every user idle past the TTL to the archive. Returns count."""
+        with self._sweep_lock:
+            started = time.perf_counter()
+            cutoff = (now if now is not None else time.time()) - self.ttl_s
+            idle = self.hot.idle_users(cutoff)
+            moved = 0
+            for start in range(0, len(idle), self.batch_size):
+                batch = self.hot.load_many(idle[start : start + self.batch_size])
+                self.archive.put_many(batch)  # committed before the hot delete
+                for user_id, archived in batch.items():
+                    try:
+                        with self._stripe(user_id):
+                            if not self.hot.delete_if_unchanged(user_id, archived):
+                                # Saved (or deleted) since the batch was read
+                                self._forget_archived(user_id)
+                                continue
+                            self._archived.add(user_id)
+                        moved += 1
+                    except PersistenceError as exc:
+                        self.metrics.sweep_errors += 1
+                        print(f"[Lifecycle] Failed to evict {user_id}: {exc}")
+            self.metrics.swept += moved
+            self.metrics.sweeps += 1
+            self.metrics.last_sweep_s = time.perf_counter() - started
+            return moved
+
+    def _sweep_loop(self, interval_s: float) -> None:
+        while not self._stop.wait(interval_s):
+            try:
+                moved = self.sweep()
+                if moved:
+                    print(f"[Lifecycle] Archived {moved} idle users")
+            except Exception as exc:
+                self.metrics.sweep_errors += 1
+                print(f"[Lifecycle] Sweep failed: {exc}")
+
+    def close(self) -> None:
+        self._stop.set()
+        self.archive.close()
+
+    def lifecycle_info(self) -> dict:
+        """Hot/cold counts, sweep and rehydration metrics."""
+        return {
+            "hot_users": self.hot.get_storage_size(),
+            "cold_users": self.archive.count(),
+            "swept": self.metrics.swept,
+            "sweeps": self.metrics.sweeps,
+            "sweep_errors": self.metrics.sweep_errors,
+            "last_sweep_ms": round(self.metrics.last_sweep_s * 1000, 3),
+            "rehydrated": self.metrics.rehydrated,
+            "rehydrate_latency_ms": self.metrics.latency_ms(),
+        }
+
+    def export_metrics(self) -> None:
+        """Serve lifecycle_info() on /metrics (computed at scrape time)."""
+        TIER_USERS.set_function(
+            lambda: {"hot": self.hot.get_storage_size(), "cold": self.archive.count()}
+        )
+        LIFECYCLE_EVENTS.set_function(
+            lambda: {
+                "swept": self.metrics.swept,
+                "sweep": self.metrics.sweeps,
+                "sweep_error": self.metrics.sweep_errors,
+                "rehydrated": self.metrics.rehydrated,
+            }
+        )
+        REHYDRATE_SECONDS.set_function(self._rehydrate_quantiles)
+        LAST_SWEEP_SECONDS.set_function(lambda: self.metrics.last_sweep_s)
+
+    def _rehydrate_quantiles(self) -> dict[str, float]:
+        latency = self.metrics.latency_ms()
+        return {
+            "0.5": latency["p50"] / 1000,
+            "0.95": latency["p95"] / 1000,
+            "1": latency["max"] / 1000,
+        }
+
+    # ------------------------------------------------------------------
+    # PersistenceBackend API
+    # ------------------------------------------------------------------
+
+    def _rehydrate(self, user_id: str) -> Optional[dict]:
+        started = time.perf_counter()
+        with self._stripe(user_id):
+            # A save may have won the race since the hot miss
+            state = self.hot.load(user_id)
+            if state is not None:
+                return state
+            state = self.archive.get(user_id)
+            if state is None:
+                return None
+            self.hot.save(user_id, state)
+            self._forget_archived(user_id)
+        self.metrics.rehydrated += 1
+        self.metrics.rehydrate_latencies.append(time.perf_counter() - started)
+        return state
+
+    def load(
+        self, user_id: str, fields: Optional[Sequence[str]] = None
+    ) -> Optional[dict]:
+        state = self.hot.load(user_id, fields)
+        if state is None:
+            state = self._rehydrate(user_id)
+            if state is not None:
+                state = project(state, fields)
+        return state
+
+    def save(self, user_id: str, state: dict) -> None:
+        with self._stripe(user_id):
+            self.hot.save(user_id, state)
+            # A save without a load must not leave a stale archived copy
+            if user_id in self._archived:
+                self._forget_archived(user_id)
+
+    def exists(self, user_id: str) -> bool:
+        return self.hot.exists(user_id) or self.archive.contains(user_id)
+
+    def delete(self, user_id: str) -> None:
+        with self._stripe(user_id):
+            # Not only self._archived: another process may have archived them
+            archived = self._forget_archived(user_id)
+            if self.hot.exists(user_id):
+                self.hot.delete(user_id)
+            elif not archived:
+                raise PersistenceError(f"User {user_id} does not exist")
+
+    def list_users(self, **filters: Any) -> list[str]:
+        if filters:
+            # Pagination/activity filters concern the hot tier only
+            return self.hot.list_users(**filters)
+        return sorted(set(self.hot.list_users()) | set(self.archive.users()))
+
+    def idle_users(self, before: float) -> list[str]:
+        return self.hot.idle_users(before)
+
+    def load_many(
+        self, user_ids: Iterable[str], fields: Optional[Sequence[str]] = None
+    ) -> dict[str, dict]:
+        """Bulk reads see archived users without rehydrating them."""
+        user_ids = list(user_ids)
+        found = self.hot.load_many(user_ids, fields)
+        for user_id in user_ids:
+            if user_id not in found:
+                state = self.archive.get(user_id)
+                if state is not None:
+                    found[user_id] = project(state, fields)
+        return {u: found[u] for u in user_ids if u in found}
+
+    def load_history(self, user_id: str, limit: Optional[int] = None) -> list[dict]:
+        if not self.hot.exists(user_id):
+            self.load(user_id)  # rehydrate
+        return self.hot.load_history(user_id, limit)
+
+    def get_storage_size(self) -> int:
+        return self.hot.get_storage_size() + self.archive.count()
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "hot":  # not initialized yet
+            raise AttributeError(name)
+        # Backend-specific extras (batch, user_info, ...) of the hot tier
+        return getattr(self.hot, name)
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """CLI: run a sweep or print tier statistics."""
+    from config import Config
+    from persistence import create_backend
+
+    parser = argparse.ArgumentParser(description="Hot/cold user lifecycle tools.")
+    parser.add_argument("command", choices=["sweep", "stats"])
+    parser.add_argument("--ttl-days", type=float, default=Config.ARCHIVE_TTL_DAYS)
+    args = parser.parse_args(argv)
+
+    tiered = TieredBackend(
+        create_backend(),
+        ColdArchive(Config.ARCHIVE_DIR),
+        ttl_s=args.ttl_days * 86400,
+        sweep_interval_s=None,
+    )
+    if args.command == "sweep":
+        moved = tiered.sweep()
+        print(f"[Lifecycle] Archived {moved} users idle > {args.ttl_days} days")
+    print(f"[Lifecycle] {tiered.lifecycle_info()}")
+    tiered.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+User manifest - incremental index of the users stored by FileBackend.
+
+One JSON line per change in <storage_dir>/manifest.jsonl:
+    {"user_id": "...", "last_active": 1730000000.0, "bytes": 5120, "turns": 7}
+    {"user_id": "...", "deleted": true}
+
+Saves and deletes only append a line, so keeping the index current costs one
+small write. Every process keeps the index in memory and reads only the lines
+appended since its last look; a compaction (rewrite with one line per live
+user) happens when the log is mostly superseded lines. Appends hold a shared
+lock and compaction an exclusive one, so no append is lost to a rewrite.
+
+The manifest is derived data: it is not fsynced and can always be rebuilt
+from the user files (FileBackend.rebuild_manifest).
+"""
+
+from __future__ import annotations
+
+import bisect
+import json
+import os
+import threading
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Iterable, Optional
+
+from .durability import atomic_write_bytes, user_lock
+
+try:  # POSIX only; elsewhere appends are not coordinated with compaction
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None  # type: ignore[assignment]
+
+
+@dataclass
+class ManifestEntry:
+    """What the manifest knows about one user."""
+
+    user_id: str
+    last_active: float
+    bytes: int
+    turns: int
+
+
+def _dumps(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+class UserManifest:
+    """Append-only manifest with an in-memory index and compaction."""
+
+    def __init__(
+        self,
+        path: Path,
+        lock_path: Path,
+        compact_min_lines: int = 1000,
+        compact_ratio: float = 2.0,
+    ):
+        """Initialize manifest.
+
+        Args:
+            path: Manifest file (JSON lines).
+            lock_path: Lock file coordinating appends with compaction.
+            compact_min_lines: Never compact logs shorter than this.
+            compact_ratio: Compact when lines > ratio * live users.
+        """
+        self.path = Path(path)
+        self.lock_path = Path(lock_path)
+        self.compact_min_lines = compact_min_lines
+        self.compact_ratio = compact_ratio
+
+        self._lock = threading.Lock()
+        self._index: dict[str, ManifestEntry] = {}
+        self._sorted: Optional[list[str]] = None  # user ids, rebuilt lazily
+        self._offset = 0  # bytes of the file already applied to the index
+        self._inode: Optional[int] = None
+        self._lines = 0
+        self._unread = 0  # own appends not yet read back from the file
+
+        # Appends reuse open descriptors (an open() per save is measurable)
+        self._append_lock = threading.Lock()
+        self._append_fd: Optional[int] = None
+        self._lock_fd: Optional[int] = None
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def _apply(self, record: dict) -> None:
+        user_id = record["user_id"]
+        if record.get("deleted"):
+            if self._index.pop(user_id, None) is not None:
+                self._sorted = None
+            return
+        if user_id not in self._index:
+            self._sorted = None
+        self._index[user_id] = ManifestEntry(
+            user_id=user_id,
+            last_active=record["last_active"],
+            bytes=record["bytes"],
+            turns=record["turns"],
+        )
+
+    def _refresh(self) -> None:
+        """Apply lines appended since the last call (caller holds _lock)."""
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            self._index.clear()
+            self._sorted = None
+            self._offset, self._inode, self._lines = 0, None, 0
+            return
+        if stat.st_ino != self._inode or stat.st_size < self._offset:
+            # Compacted (or replaced) by someone: start over
+            self._index.clear()
+            self._sorted = None
+            self._offset, self._inode, self._lines = 0, stat.st_ino, 0
+        self._unread = 0
+        if stat.st_size == self._offset:
+            return
+
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read()
+        # A line without its newline is still being appended; leave it
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            if line:
+                self._apply(json.loads(line))
+                self._lines += 1
+        self._offset += end
+
+    def get(self, user_id: str) -> Optional[ManifestEntry]:
+        with self._lock:
+            self._refresh()
+            return self._index.get(user_id)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._index)
+
+    def users(
+        self,
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
+        active_since: Optional[float] = None,
+    ) -> list[str]:
+        """
+        User ids in sorted order, one page at a time.
+
+        Args:
+            limit: Page size (None = everything).
+            after: Return ids strictly greater than this (keyset cursor:
+                pass the last id of the previous page).
+            active_since: Only users active at or after this timestamp.
+        """
+        with self._lock:
+            self._refresh()
+            if self._sorted is None:
+                self._sorted = sorted(self._index)
+            ordered = self._sorted
+            start = bisect.bisect_right(ordered, after) if after is not None else 0
+            page: list[str] = []
+            for user_id in ordered[start:]:
+                if limit is not None and len(page) >= limit:
+                    break
+                if (
+                    active_since is not None
+                    and self._index[user_id].last_active < active_since
+                ):
+                    continue
+                page.append(user_id)
+            return page
+
+    def idle(self, before: float) -> list[str]:
+        """Sorted ids of users last active before `before`."""
+        with self._lock:
+            self._refresh()
+            return sorted(
+                u for u, e in self._index.items() if e.last_active < before
+            )
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+
+    def _append(self, record: dict) -> None:
+        line = (_dumps(record) + "\n").encode("utf-8")
+        with self._append_lock:
+            if self._lock_fd is None:
+                self._lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            if fcntl is not None:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_SH)
+            try:
+                # A compaction renamed a new file over ours: reopen
+                if self._append_fd is None or os.fstat(self._append_fd).st_nlink == 0:
+                    self._close_append_fd()
+                    self._append_fd = os.open(
+                        self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644
+                    )
+                # O_APPEND: concurrent single-line writes do not interleave
+                os.write(self._append_fd, line)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+        with self._lock:
+            # Read-your-writes without reading the file back. Lines of other
+            # processes are picked up on the next query; replaying them in file
+            # order later re-applies this record after them.
+            self._apply(record)
+            self._unread += 1
+            threshold = max(
+                self.compact_min_lines, self.compact_ratio * len(self._index)
+            )
+            needs_compaction = False
+            if self._lines + self._unread >= threshold:
+                self._refresh()
+                needs_compaction = self._lines >= threshold
+        if needs_compaction:
+            self.compact()
+
+    def _close_append_fd(self) -> None:
+        if self._append_fd is not None:
+            os.close(self._append_fd)
+            self._append_fd = None
+
+    def close(self) -> None:
+        """Release the open descriptors."""
+        with self._append_lock:
+            self._close_append_fd()
+            if self._lock_fd is not None:
+                os.close(self._lock_fd)
+                self._lock_fd = None
+
+    def record(self, entry: ManifestEntry) -> None:
+        """Store the current figures of a user (after a save)."""
+        self._append(asdict(entry))
+
+    def remove(self, user_id: str) -> None:
+        """Drop a user (after a delete)."""
+        self._append({"user_id": user_id, "deleted": True})
+
+    def _write(self, entries: Iterable[ManifestEntry]) -> None:
+        """Replace the file with one line per entry (caller holds both locks)."""
+        payload = "".join(_dumps(asdict(e)) + "\n" for e in entries)
+        atomic_write_bytes(self.path, payload.encode("utf-8"))
+        self._index.clear()
+        self._sorted = None
+        self._offset, self._inode, self._lines = 0, None, 0
+        self._refresh()
+
+    def compact(self) -> None:
+        """Rewrite the log with one line per live user."""
+        with user_lock(self.lock_path), self._lock:
+            self._refresh()
+            self._write(list(self._index.values()))
+
+    def replace_all(self, entries: Iterable[ManifestEntry]) -> None:
+        """Rebuild the manifest from scratch (see FileBackend.rebuild_manifest)."""
+        with user_lock(self.lock_path), self._lock:
+            self._write(entries)
+
+    def clear(self) -> None:
+        with user_lock(self.lock_path), self._lock:
+            self.path.unlink(missing_ok=True)
+            self._refresh()
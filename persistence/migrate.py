@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Migration tool - copies user states between persistence backends.
+
+Default direction is the JSON directory of FileBackend (both the legacy
+<user_id>.json files and the snapshot + JSONL layout) into SQLite.
+
+Run:
+    python -m persistence.migrate [--source data] [--target data/coach.db]
+                                  [--batch-size 500] [--dry-run]
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from .backend import PersistenceBackend
+
+
+@dataclass
+class MigrationReport:
+    """Counters of a single migration run."""
+
+    migrated: int = 0
+    failed: int = 0
+    elapsed_s: float = 0.0
+
+
+def migrate(
+    source: PersistenceBackend,
+    target: PersistenceBackend,
+    batch_size: int = 500,
+    dry_run: bool = False,
+) -> MigrationReport:
+    """
+    Copy every user from `source` to `target`.
+
+    States are streamed with `iter_states` and written with `save_many`
+    (one transaction per batch on SqliteBackend). A batch that fails to save
+    is retried user by user, so one bad state does not fail its neighbours.
+    """
+    started = time.perf_counter()
+    report = MigrationReport()
+
+    def record_failure(user_id: str, exc: Exception) -> None:
+        report.failed += 1
+        print(f"[Migrate] Failed for {user_id}: {exc}")
+
+    def write(batch: dict[str, dict]) -> None:
+        if dry_run:
+            report.migrated += len(batch)
+            return
+        try:
+            target.save_many(batch)
+            report.migrated += len(batch)
+            return
+        except Exception:
+            pass
+        for user_id, state in batch.items():
+            try:
+                target.save(user_id, state)
+                report.migrated += 1
+            except Exception as exc:
+                record_failure(user_id, exc)
+
+    batch: dict[str, dict] = {}
+    for user_id, state in source.iter_states(batch_size, on_error=record_failure):
+        batch[user_id] = state
+        if len(batch) >= batch_size:
+            write(batch)
+            batch = {}
+            print(f"[Migrate] {report.migrated + report.failed} users")
+    if batch:
+        write(batch)
+
+    report.elapsed_s = time.perf_counter() - started
+    return report
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """CLI entry point (JSON directory -> SQLite)."""
+    from config import Config
+    from .file_backend import FileBackend
+    from .sqlite_backend import SqliteBackend
+
+    parser = argparse.ArgumentParser(
+        description="Migrate user states from the JSON directory to SQLite."
+    )
+    parser.add_argument("--source", type=Path, default=Config.DATA_DIR)
+    parser.add_argument("--target", type=Path, default=Config.SQLITE_PATH)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Read everything, write nothing"
+    )
+    args = parser.parse_args(argv)
+
+    target = SqliteBackend(args.target)
+    report = migrate(
+        FileBackend(args.source),
+        target,
+        batch_size=args.batch_size,
+        dry_run=args.dry_run,
+    )
+    target.close()
+    print(
+        f"[Migrate] migrated={report.migrated} failed={report.failed} "
+        f"in {report.elapsed_s:.2f}s -> {args.target}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Profile Store - side store for consolidated semantic profiles.
+
+One small JSON file per user (<profiles_dir>/<user_id>.json), written by the
+offline consolidation job and read by SystemPrompter on every turn.
+A read is a single stat + open of a known path, independent of the number
+of users; unchanged files are served from an in-process cache.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import Optional
+
+from .backend import PersistenceError
+
+
+class ProfileStore:
+    """Key-value store of semantic profiles (user_id -> profile dict)."""
+
+    def __init__(self, storage_dir: Path):
+        """Initialize store.
+
+        Args:
+            storage_dir: Directory where profile files are kept.
+        """
+        self.storage_dir = Path(storage_dir)
+        # user_id -> (mtime_ns, profile)
+        self._cache: dict[str, tuple[int, dict]] = {}
+
+    def _path_for(self, user_id: str) -> Path:
+        return self.storage_dir / f"{user_id}.json"
+
+    def get(self, user_id: str) -> Optional[dict]:
+        """Return the profile for a user, or None if not consolidated yet."""
+        path = self._path_for(user_id)
+        try:
+            mtime_ns = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            self._cache.pop(user_id, None)
+            return None
+
+        cached = self._cache.get(user_id)
+        if cached and cached[0] == mtime_ns:
+            return cached[1]
+
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                profile = json.load(f)
+        except Exception as exc:
+            raise PersistenceError(
+                f"Failed to load profile for {user_id}: {exc}"
+            ) from exc
+        self._cache[user_id] = (mtime_ns, profile)
+        return profile
+
+    def put(self, user_id: str, profile: dict) -> None:
+        """Write a profile (temp file + rename, so readers never see half)."""
+        self.storage_dir.mkdir(parents=True, exist_ok=True)
+        path = self._path_for(user_id)
+        tmp_path = path.with_suffix(".json.tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(profile, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, path)
+        except Exception as exc:
+            raise PersistenceError(
+                f"Failed to save profile for {user_id}: {exc}"
+            ) from exc
+        self._cache.pop(user_id, None)
+
+    def delete(self, user_id: str) -> None:
+        self._cache.pop(user_id, None)
+        self._path_for(user_id).unlink(missing_ok=True)
+
+    def list_users(self) -> list[str]:
+        if not self.storage_dir.exists():
+            return []
+        return [p.stem for p in self.storage_dir.glob("*.json") if p.is_file()]
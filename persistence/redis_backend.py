@@ -0,0 +1,472 @@
+# -*- coding: utf-8 -*-
+"""
+Redis Persistence Backend
+
+Shared state for multi-node deployments (no shared filesystem needed).
+
+Keys per user (prefix configurable):
+- <prefix>:state:<user_id>    hash, one field per scalar SessionState field
+                              (values JSON-encoded to keep their types)
+- <prefix>:history:<user_id>  list, one JSON message per element
+
+A save appends only the new messages with RPUSH and replaces the hash, all in
+one MULTI/EXEC guarded by WATCH on the state hash; a concurrent writer makes
+the transaction fail and it is retried on fresh data. Loads read hash and list
+in one pipelined round trip. `list_users` walks the keyspace with SCAN.
+Bulk loads pipeline a whole batch into one round trip; a projection without
+conversation_history reads only the requested hash fields (HMGET).
+
+The async API (aload/asave/...) uses redis.asyncio natively instead of the
+thread pool, with the same per-user ordering as every backend.
+
+Requires the `redis` package (or any client with the same API, e.g.
+fakeredis for tests). Select with Config.PERSISTENCE_BACKEND = "redis".
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import time
+from typing import TYPE_CHECKING, Any, Iterable, Iterator, Optional, Sequence
+
+from .backend import PersistenceBackend, PersistenceError, needs_history, project
+
+if TYPE_CHECKING:
+    from memory.schemas.session_state import SessionState
+
+# Bookkeeping fields inside the state hash (never part of SessionState)
+_COUNT_FIELD = "__history_count__"
+_LAST_FIELD = "__history_last__"
+_UPDATED_FIELD = "__updated_at__"
+_META_FIELDS = (_COUNT_FIELD, _LAST_FIELD, _UPDATED_FIELD)
+
+
+def _dumps(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def _text(value: Any) -> Any:
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+def _message_digest(message: dict) -> str:
+    return hashlib.blake2b(_dumps(message).encode("utf-8"), digest_size=8).hexdigest()
+
+
+class RedisBackend(PersistenceBackend):
+    """Persist user state in Redis (hash per user + history list)."""
+
+    shared = True  # every node of a deployment talks to the same Redis
+
+    def __init__(
+        self,
+        url: str = "redis://localhost:6379/0",
+        prefix: str = "coach",
+        client: Any = None,
+        max_retries: int = 10,
+        async_client: Any = None,
+    ):
+        """Initialize backend.
+
+        Args:
+            url: Redis URL (ignored when `client` is given).
+            prefix: Key namespace, lets several apps share one Redis.
+            client: Ready client instance (e.g. fakeredis.FakeRedis()).
+            max_retries: WATCH conflicts tolerated per save.
+            async_client: Ready redis.asyncio client. Created from `url` on
+                first async use when neither client is given; without one
+                the async API falls back to the thread pool.
+        """
+        self._async_url = url if client is None else None
+        if client is None:
+            try:
+                import redis
+            except ImportError as exc:
+                raise PersistenceError(
+                    "RedisBackend requires the 'redis' package (pip install redis)"
+                ) from exc
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+        self.max_retries = max_retries
+        self.async_client = async_client
+
+    def _state_key(self, user_id: str) -> str:
+        return f"{self.prefix}:state:{user_id}"
+
+    def _history_key(self, user_id: str) -> str:
+        return f"{self.prefix}:history:{user_id}"
+
+    @staticmethod
+    def _prepare(state: dict) -> tuple[list, dict]:
+        """History list and the hash mapping to store for `state`."""
+        history = state.get("conversation_history") or []
+        mapping = {
+            field: _dumps(value)
+            for field, value in state.items()
+            if field != "conversation_history"
+        }
+        mapping[_COUNT_FIELD] = str(len(history))
+        mapping[_LAST_FIELD] = _message_digest(history[-1]) if history else ""
+        mapping[_UPDATED_FIELD] = repr(time.time())
+        return history, mapping
+
+    @staticmethod
+    def _committed(count: Any, last: Any) -> tuple[int, Any]:
+        return int(_text(count) or 0), _text(last)
+
+    @staticmethod
+    def _can_append(history: list, count: int, last: Any, stored: int) -> bool:
+        """True if the stored list is a prefix of `history` (append only)."""
+        return (
+            count <= len(history)
+            and stored >= count
+            and (count == 0 or _message_digest(history[count - 1]) == last)
+        )
+
+    def _queue_write(
+        self,
+        pipe: Any,
+        user_id: str,
+        history: list,
+        mapping: dict,
+        count: int,
+        can_append: bool,
+    ) -> None:
+        """Queue the MULTI body of a save (same for sync and async clients)."""
+        history_key = self._history_key(user_id)
+        state_key = self._state_key(user_id)
+        pipe.multi()
+        if not can_append:
+            pipe.delete(history_key)
+            count = 0
+        new_messages = [_dumps(m) for m in history[count:]]
+        if new_messages:
+            pipe.rpush(history_key, *new_messages)
+        # Keep the list exactly as long as the committed count
+        pipe.ltrim(history_key, 0, len(history) - 1)
+        pipe.delete(state_key)
+        pipe.hset(state_key, mapping=mapping)
+
+    def save(self, user_id: str, state: dict) -> None:
+        """Append new history with RPUSH and replace the state hash atomically."""
+        from redis.exceptions import WatchError
+
+        state_key = self._state_key(user_id)
+        history, mapping = self._prepare(state)
+        try:
+            for _ in range(self.max_retries):
+                with self.client.pipeline() as pipe:
+                    try:
+                        pipe.watch(state_key)
+                        count, last = self._committed(
+                            *pipe.hmget(state_key, _COUNT_FIELD, _LAST_FIELD)
+                        )
+                        can_append = self._can_append(
+                            history, count, last, pipe.llen(self._history_key(user_id))
+                        )
+                        self._queue_write(
+                            pipe, user_id, history, mapping, count, can_append
+                        )
+                        pipe.execute()
+                        return
+                    except WatchError:
+                        continue
+            raise PersistenceError(
+                f"Too many concurrent updates while saving {user_id}"
+            )
+        except PersistenceError:
+            raise
+        except Exception as exc:
+            raise PersistenceError(
+                f"Failed to save state for {user_id}: {exc}"
+            ) from exc
+
+    def load(
+        self, user_id: str, fields: Optional[Sequence[str]] = None
+    ) -> Optional[dict]:
+        """Load hash and history in a single pipelined round trip."""
+        if fields is not None:
+            # HMGET of the requested fields, LRANGE only if history is wanted
+            return self.load_many([user_id], fields).get(user_id)
+        try:
+            with self.client.pipeline(transaction=True) as pipe:
+                pipe.hgetall(self._state_key(user_id))
+                pipe.lrange(self._history_key(user_id), 0, -1)
+                raw_state, raw_history = pipe.execute()
+        except Exception as exc:
+            raise PersistenceError(
+                f"Failed to load state for {user_id}: {exc}"
+            ) from exc
+        if not raw_state:
+            return None
+        return self._decode(raw_state, raw_history)
+
+    @staticmethod
+    def _decode(raw_state: dict, raw_history: list) -> dict:
+        state: dict = {}
+        for field, value in raw_state.items():
+            field = _text(field)
+            if field not in _META_FIELDS:
+                state[field] = json.loads(value)
+        state["conversation_history"] = [json.loads(m) for m in raw_history]
+        return state
+
+    def load_history(self, user_id: str, limit: Optional[int] = None) -> list[dict]:
+        """Read the last `limit` messages (all if None) with a single LRANGE."""
+        if limit is not None and limit <= 0:
+            return []
+        start = 0 if limit is None else -limit
+        try:
+            raw = self.client.lrange(self._history_key(user_id), start, -1)
+        except Exception as exc:
+            raise PersistenceError(
+                f"Failed to load history for {user_id}: {exc}"
+            ) from exc
+        return [json.loads(m) for m in raw]
+
+    def exists(self, user_id: str) -> bool:
+        return bool(self.client.exists(self._state_key(user_id)))
+
+    def delete(self, user_id: str) -> None:
+        try:
+            deleted = self.client.delete(
+                self._state_key(user_id), self._history_key(user_id)
+            )
+        except Exception as exc:
+            raise PersistenceError(
+                f"Failed to delete state for {user_id}: {exc}"
+            ) from exc
+        if not deleted:
+            raise PersistenceError(f"User {user_id} does not exist")
+
+    def delete_if_unchanged(self, user_id: str, expected: dict) -> bool:
+        """Compare and delete under WATCH: any save in between aborts it."""
+        from redis.exceptions import WatchError
+
+        state_key = self._state_key(user_id)
+        try:
+            with self.client.pipeline() as pipe:
+                try:
+                    # Every save rewrites the state hash, so watching it is enough
+                    pipe.watch(state_key)
+                    raw_state = pipe.hgetall(state_key)
+                    if not raw_state:
+                        return False
+                    raw_history = pipe.lrange(self._history_key(user_id), 0, -1)
+                    if self._decode(raw_state, raw_history) != expected:
+                        return False
+                    pipe.multi()
+                    pipe.delete(state_key, self._history_key(user_id))
+                    pipe.execute()
+                    return True
+                except WatchError:
+                    return False
+        except Exception as exc:
+            raise PersistenceError(
+                f"Failed to delete state for {user_id}: {exc}"
+            ) from exc
+
+    def load_many(
+        self, user_ids: Iterable[str], fields: Optional[Sequence[str]] = None
+    ) -> dict[str, dict]:
+        """Load a batch of users in one pipelined round trip."""
+        user_ids = list(user_ids)
+        with_history = needs_history(fields)
+        # HMGET always asks for the count field too: it marks a stored user
+        scalar_fields = None
+        if fields is not None:
+            scalar_fields = [f for f in fields if f != "conversation_history"]
+        try:
+            with self.client.pipeline(transaction=True) as pipe:
+                for user_id in user_ids:
+                    if scalar_fields is None:
+                        pipe.hgetall(self._state_key(user_id))
+                    else:
+                        pipe.hmget(
+                            self._state_key(user_id), _COUNT_FIELD, *scalar_fields
+                        )
+                    if with_history:
+                        pipe.lrange(self._history_key(user_id), 0, -1)
+                replies = iter(pipe.execute())
+        except Exception as exc:
+            raise PersistenceError(f"Failed to load users: {exc}") from exc
+
+        result = {}
+        for user_id in user_ids:
+            raw_state = next(replies)
+            raw_history = next(replies) if with_history else []
+            if scalar_fields is None:
+                if raw_state:
+                    state = self._decode(raw_state, raw_history)
+                    result[user_id] = project(state, fields)
+                continue
+            count, *values = raw_state
+            if count is None:
+                continue
+            state = {
+                field: json.loads(value)
+                for field, value in zip(scalar_fields, values)
+                if value is not None
+            }
+            if with_history:
+                state["conversation_history"] = [json.loads(m) for m in raw_history]
+            result[user_id] = state
+        return result
+
+    def _user_pages(self, batch_size: int) -> Iterator[list[str]]:
+        # SCAN may return a key twice; ids are small, so remember them
+        seen: set[str] = set()
+        page: list[str] = []
+        prefix = f"{self.prefix}:state:"
+        for key in self.client.scan_iter(match=f"{prefix}*", count=batch_size):
+            user_id = _text(key)[len(prefix) :]
+            if user_id in seen:
+                continue
+            seen.add(user_id)
+            page.append(user_id)
+            if len(page) >= batch_size:
+                yield page
+                page = []
+        if page:
+            yield page
+
+    def list_users(self) -> list[str]:
+        # SCAN may return a key twice (rehashing during the scan): dedupe
+        prefix = f"{self.prefix}:state:"
+        return sorted(
+            {
+                _text(key)[len(prefix) :]
+                for key in self.client.scan_iter(match=f"{prefix}*", count=1000)
+            }
+        )
+
+    def idle_users(self, before: float) -> list[str]:
+        idle = []
+        for page in self._user_pages(1000):
+            with self.client.pipeline(transaction=False) as pipe:
+                for user_id in page:
+                    pipe.hget(self._state_key(user_id), _UPDATED_FIELD)
+                updated = pipe.execute()
+            idle.extend(
+                user_id
+                for user_id, value in zip(page, updated)
+                if value is not None and float(_text(value)) < before
+            )
+        return sorted(idle)
+
+    def clear_all(self) -> None:
+        keys = list(self.client.scan_iter(match=f"{self.prefix}:*", count=1000))
+        for start in range(0, len(keys), 1000):
+            self.client.delete(*keys[start : start + 1000])
+
+    def get_storage_size(self) -> int:
+        return len(self.list_users())
+
+    # ------------------------------------------------------------------
+    # Native async API (redis.asyncio)
+    # ------------------------------------------------------------------
+
+    def _aclient(self) -> Any:
+        if self.async_client is None and self._async_url is not None:
+            import redis.asyncio
+
+            self.async_client = redis.asyncio.Redis.from_url(self._async_url)
+        return self.async_client
+
+    async def _asave_native(self, user_id: str, state: dict) -> None:
+        from redis.exceptions import WatchError
+
+        state_key = self._state_key(user_id)
+        history, mapping = self._prepare(state)
+        try:
+            for _ in range(self.max_retries):
+                async with self._aclient().pipeline() as pipe:
+                    try:
+                        await pipe.watch(state_key)
+                        count, last = self._committed(
+                            *await pipe.hmget(state_key, _COUNT_FIELD, _LAST_FIELD)
+                        )
+                        stored = await pipe.llen(self._history_key(user_id))
+                        can_append = self._can_append(history, count, last, stored)
+                        self._queue_write(
+                            pipe, user_id, history, mapping, count, can_append
+                        )
+                        await pipe.execute()
+                        return
+                    except WatchError:
+                        continue
+            raise PersistenceError(
+                f"Too many concurrent updates while saving {user_id}"
+            )
+        except PersistenceError:
+            raise
+        except Exception as exc:
+            raise PersistenceError(
+                f"Failed to save state for {user_id}: {exc}"
+            ) from exc
+
+    async def _aload_native(self, user_id: str) -> Optional[dict]:
+        try:
+            async with self._aclient().pipeline(transaction=True) as pipe:
+                pipe.hgetall(self._state_key(user_id))
+                pipe.lrange(self._history_key(user_id), 0, -1)
+                raw_state, raw_history = await pipe.execute()
+        except Exception as exc:
+            raise PersistenceError(
+                f"Failed to load state for {user_id}: {exc}"
+            ) from exc
+        if not raw_state:
+            return None
+        return self._decode(raw_state, raw_history)
+
+    async def _aexists_native(self, user_id: str) -> bool:
+        return bool(await self._aclient().exists(self._state_key(user_id)))
+
+    async def _adelete_native(self, user_id: str) -> None:
+        try:
+            deleted = await self._aclient().delete(
+                self._state_key(user_id), self._history_key(user_id)
+            )
+        except Exception as exc:
+            raise PersistenceError(
+                f"Failed to delete state for {user_id}: {exc}"
+            ) from exc
+        if not deleted:
+            raise PersistenceError(f"User {user_id} does not exist")
+
+    async def asave(self, user_id: str, state: dict) -> None:
+        if self._aclient() is None:
+            return await super().asave(user_id, state)
+        await self._ordered(user_id, lambda: self._asave_native(user_id, state))
+
+    async def aload(
+        self, user_id: str, fields: Optional[Sequence[str]] = None
+    ) -> Optional[dict]:
+        if self._aclient() is None or fields is not None:
+            return await super().aload(user_id, fields)
+        return await self._ordered(user_id, lambda: self._aload_native(user_id))
+
+    async def aexists(self, user_id: str) -> bool:
+        if self._aclient() is None:
+            return await super().aexists(user_id)
+        return await self._ordered(user_id, lambda: self._aexists_native(user_id))
+
+    async def adelete(self, user_id: str) -> None:
+        if self._aclient() is None:
+            return await super().adelete(user_id)
+        await self._ordered(user_id, lambda: self._adelete_native(user_id))
+
+    async def aload_state(self, user_id: str) -> Optional["SessionState"]:
+        if self._aclient() is None:
+            return await super().aload_state(user_id)
+        from memory.schemas.session_state import SessionState
+
+        state = await self.aload(user_id)
+        return SessionState(**state) if state is not None else None
+
+    async def asave_state(self, user_id: str, state: "SessionState") -> None:
+        if self._aclient() is None:
+            return await super().asave_state(user_id, state)
+        await self.asave(user_id, state.model_dump())
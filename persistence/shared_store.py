@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+State store of InMemoryBackend, optionally shared between processes.
+
+StripedStore keeps encoded states (immutable bytes, see persistence/codecs.py)
+in a dict guarded by lock stripes picked by user id: writes of one user are
+serialized, writes of different users almost never wait for each other, and a
+read is a single dict lookup that hands out the stored bytes without copying.
+
+The same class can be served by a multiprocessing manager, so several worker
+processes on one host share the states without disk I/O:
+
+    SHARED_STORE_AUTHKEY=... python -m persistence.shared_store serve \
+        --address 127.0.0.1:50055
+
+and, in every worker, PERSISTENCE_BACKEND = "in_memory" with
+SHARED_STORE_ADDRESS / SHARED_STORE_AUTHKEY set. Each call is one local round
+trip to the store process; states live in its RAM only and are gone when it
+exits. The manager protocol is pickle-based: keep it on localhost and always
+set an authkey.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import threading
+import time
+from multiprocessing.managers import BaseManager
+from typing import Iterable, Mapping, Optional
+
+from .backend import PersistenceError
+
+DEFAULT_STRIPES = 64
+
+
+class StripedStore:
+    """Encoded user states behind striped locks."""
+
+    def __init__(self, stripes: int = DEFAULT_STRIPES):
+        """Initialize an empty store.
+
+        Args:
+            stripes: Number of locks writers are spread over.
+        """
+        self._data: dict[str, bytes] = {}
+        self._saved_at: dict[str, float] = {}
+        self._stripes = [threading.Lock() for _ in range(stripes)]
+
+    def _stripe(self, user_id: str) -> threading.Lock:
+        return self._stripes[hash(user_id) % len(self._stripes)]
+
+    # Reads: single dict operations, atomic under the GIL; values are bytes,
+    # so nothing a caller does can change the stored snapshot
+
+    def get(self, user_id: str) -> Optional[bytes]:
+        return self._data.get(user_id)
+
+    def get_many(self, user_ids: Iterable[str]) -> dict[str, bytes]:
+        data = self._data
+        return {u: data[u] for u in user_ids if u in data}
+
+    def contains(self, user_id: str) -> bool:
+        return user_id in self._data
+
+    def keys(self) -> list[str]:
+        return list(self._data)
+
+    def size(self) -> int:
+        return len(self._data)
+
+    def idle(self, before: float) -> list[str]:
+        """Sorted ids of users not saved since `before`."""
+        return sorted(u for u, t in list(self._saved_at.items()) if t < before)
+
+    # Writes: both dicts change together under the user's stripe
+
+    def put(self, user_id: str, data: bytes) -> None:
+        with self._stripe(user_id):
+            self._data[user_id] = data
+            self._saved_at[user_id] = time.time()
+
+    def put_many(self, items: Mapping[str, bytes]) -> None:
+        for user_id, data in items.items():
+            self.put(user_id, data)
+
+    def delete(self, user_id: str) -> bool:
+        """Remove a user; False if there was nothing to remove."""
+        with self._stripe(user_id):
+            self._saved_at.pop(user_id, None)
+            return self._data.pop(user_id, None) is not None
+
+    def delete_if(self, user_id: str, data: bytes) -> bool:
+        """Remove a user only if their stored bytes are still `data`."""
+        with self._stripe(user_id):
+            if self._data.get(user_id) != data:
+                return False
+            self._saved_at.pop(user_id, None)
+            del self._data[user_id]
+            return True
+
+    def clear(self) -> None:
+        for lock in self._stripes:
+            lock.acquire()
+        try:
+            self._data.clear()
+            self._saved_at.clear()
+        finally:
+            for lock in self._stripes:
+                lock.release()
+
+
+# ----------------------------------------------------------------------
+# Cross-process sharing
+# ----------------------------------------------------------------------
+
+_served: Optional[StripedStore] = None
+_served_lock = threading.Lock()
+
+
+def _served_store() -> StripedStore:
+    """The one store of the server process (created on first request)."""
+    global _served
+    with _served_lock:
+        if _served is None:
+            _served = StripedStore()
+        return _served
+
+
+class StoreManager(BaseManager):
+    """Serves a single StripedStore to every connected process."""
+
+
+StoreManager.register("store", callable=_served_store)
+
+
+def parse_address(address: str) -> tuple[str, int]:
+    """'host:port' -> (host, port)."""
+    host, _, port = address.rpartition(":")
+    if not host or not port.isdigit():
+        raise PersistenceError(f"Invalid shared store address: {address!r}")
+    return host, int(port)
+
+
+def _authkey(authkey: str) -> bytes:
+    if not authkey:
+        raise PersistenceError("The shared store requires SHARED_STORE_AUTHKEY")
+    return authkey.encode("utf-8")
+
+
+def connect(address: str, authkey: str) -> StripedStore:
+    """Proxy of the store served at `address` (same methods as StripedStore)."""
+    manager = StoreManager(address=parse_address(address), authkey=_authkey(authkey))
+    try:
+        manager.connect()
+    except OSError as exc:
+        raise PersistenceError(
+            f"Failed to connect to the shared store at {address}: {exc}"
+        ) from exc
+    return manager.store()
+
+
+def start_server(address: str, authkey: str) -> StoreManager:
+    """
+    Serve the store from a child process of the caller (e.g. a launcher that
+    then forks the workers). Stops when the caller exits or calls shutdown().
+    """
+    manager = StoreManager(address=parse_address(address), authkey=_authkey(authkey))
+    manager.start()
+    return manager
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """CLI: run the shared store in the foreground."""
+    parser = argparse.ArgumentParser(description="Shared in-memory state store.")
+    parser.add_argument("command", choices=["serve"])
+    parser.add_argument("--address", default="127.0.0.1:50055")
+    args = parser.parse_args(argv)
+
+    manager = StoreManager(
+        address=parse_address(args.address),
+        authkey=_authkey(os.getenv("SHARED_STORE_AUTHKEY", "")),
+    )
+    print(f"[SharedStore] Serving on {args.address}")
+    manager.get_server().serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,494 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite Persistence Backend
+
+Stores user state in a single SQLite database:
+- `users`    one row per user, scalar SessionState fields as columns
+             (list fields as JSON text, unknown keys in `extra`)
+- `history`  conversation_history, one row per message, keyed (user_id, seq)
+
+The database runs in WAL mode, so readers never block the writer. Each thread
+gets its own connection (thread-local pool) with sqlite3's statement cache, so
+the fixed SQL below is prepared once per connection. A save appends only the
+new history rows. Bulk writers can group many saves into one transaction with
+`batch()`. `list_users` is an index scan of the primary key. Bulk loads
+(load_many / iter_states) fetch a whole batch with two IN queries, and skip
+the history table when the projection does not need it.
+
+Select with Config.PERSISTENCE_BACKEND = "sqlite".
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Iterator, Mapping, Optional, Sequence
+
+from .backend import PersistenceBackend, PersistenceError, needs_history, project
+
+# SessionState scalar fields stored as dedicated columns
+TEXT_COLUMNS = (
+    "user_name",
+    "created_at",
+    "detected_language",
+    "current_phase",
+    "main_goal",
+    "action_plan",
+    "session_summary",
+)
+BOOL_COLUMNS = ("coach_introduced", "context_gathered")
+INT_COLUMNS = (
+    "paraphrases_count",
+    "open_questions_count",
+    "deepening_questions_count",
+    "celebrations_count",
+)
+JSON_COLUMNS = (
+    "detected_emotions",
+    "key_insights",
+    "topics",
+    "key_facts",
+    "action_steps",
+)
+STATE_COLUMNS = TEXT_COLUMNS + BOOL_COLUMNS + INT_COLUMNS + JSON_COLUMNS
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    {", ".join(f"{c} TEXT" for c in TEXT_COLUMNS)},
+    {", ".join(f"{c} INTEGER" for c in BOOL_COLUMNS + INT_COLUMNS)},
+    {", ".join(f"{c} TEXT" for c in JSON_COLUMNS)},
+    extra TEXT,
+    history_count INTEGER NOT NULL DEFAULT 0,
+    history_last TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS history (
+    user_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    extra TEXT,
+    PRIMARY KEY (user_id, seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_users_updated_at ON users (updated_at);
+"""
+
+_UPSERT_USER = (
+    f"INSERT INTO users (user_id, {', '.join(STATE_COLUMNS)}, extra, "
+    f"history_count, history_last, updated_at) "
+    f"VALUES ({', '.join('?' * (len(STATE_COLUMNS) + 5))}) "
+    f"ON CONFLICT(user_id) DO UPDATE SET "
+    + ", ".join(
+        f"{c} = excluded.{c}"
+        for c in (*STATE_COLUMNS, "extra", "history_count", "history_last", "updated_at")
+    )
+)
+_SELECT_USER = (
+    f"SELECT {', '.join(STATE_COLUMNS)}, extra, history_count, history_last "
+    f"FROM users WHERE user_id = ?"
+)
+_SELECT_META = "SELECT history_count, history_last FROM users WHERE user_id = ?"
+_INSERT_MESSAGE = (
+    "INSERT INTO history (user_id, seq, role, content, extra) VALUES (?, ?, ?, ?, ?)"
+)
+_DELETE_HISTORY = "DELETE FROM history WHERE user_id = ?"
+_SELECT_HISTORY = (
+    "SELECT role, content, extra FROM history WHERE user_id = ? ORDER BY seq"
+)
+_SELECT_USERS_IN = (
+    f"SELECT user_id, {', '.join(STATE_COLUMNS)}, extra, history_count, history_last "
+    f"FROM users WHERE user_id IN ({{marks}})"
+)
+_SELECT_HISTORY_IN = (
+    "SELECT user_id, role, content, extra FROM history "
+    "WHERE user_id IN ({marks}) ORDER BY user_id, seq"
+)
+_SELECT_USER_PAGE = (
+    "SELECT user_id FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?"
+)
+# Stay below SQLite's bound-parameter limit in IN (...) lists
+_IN_CHUNK = 500
+_SELECT_HISTORY_TAIL = (
+    "SELECT role, content, extra FROM history WHERE user_id = ? "
+    "ORDER BY seq DESC LIMIT ?"
+)
+
+
+def _dumps(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def _message_digest(message: dict) -> str:
+    return hashlib.blake2b(_dumps(message).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _message_row(user_id: str, seq: int, message: dict) -> tuple:
+    extra = {k: v for k, v in message.items() if k not in ("role", "content")}
+    return (
+        user_id,
+        seq,
+        message.get("role", "user"),
+        message.get("content", ""),
+        _dumps(extra) if extra else None,
+    )
+
+
+def _message_from_row(row: tuple) -> dict:
+    role, content, extra = row
+    message = {"role": role, "content": content}
+    if extra:
+        message.update(json.loads(extra))
+    return message
+
+
+class SqliteBackend(PersistenceBackend):
+    """Persist user state in SQLite (WAL, thread-local connections)."""
+
+    shared = True  # workers and a standalone api.py open the same file
+
+    def __init__(self, db_path: Path, busy_timeout_ms: int = 5000):
+        """Initialize backend and create the schema if needed.
+
+        Args:
+            db_path: Path of the SQLite database file.
+            busy_timeout_ms: How long a writer waits for the write lock.
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._conn().executescript(_SCHEMA)
+
+    # ------------------------------------------------------------------
+    # Connections & transactions
+    # ------------------------------------------------------------------
+
+    def _conn(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.db_path,
+                timeout=self.busy_timeout_ms / 1000,
+                isolation_level=None,  # explicit BEGIN/COMMIT below
+                cached_statements=256,
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=OFF")
+            self._local.conn = conn
+            self._local.batch_depth = 0
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Write transaction; joins the enclosing batch() if there is one."""
+        conn = self._conn()
+        if self._local.batch_depth:
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """
+        Group all writes of this thread into a single transaction.
+
+        Used by bulk tools (migration, imports): one commit, and one WAL sync,
+        for the whole batch instead of one per save.
+        """
+        conn = self._conn()
+        outermost = self._local.batch_depth == 0
+        if outermost:
+            conn.execute("BEGIN IMMEDIATE")
+        self._local.batch_depth += 1
+        try:
+            yield
+        except BaseException:
+            self._local.batch_depth -= 1
+            if outermost:
+                conn.execute("ROLLBACK")
+            raise
+        self._local.batch_depth -= 1
+        if outermost:
+            conn.execute("COMMIT")
+
+    @contextmanager
+    def _read(self) -> Iterator[sqlite3.Connection]:
+        """Read transaction: several queries see one consistent snapshot."""
+        conn = self._conn()
+        if self._local.batch_depth:
+            yield conn
+            return
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.execute("COMMIT")
+
+    def close(self) -> None:
+        """Close every pooled connection."""
+        with self._connections_lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except sqlite3.ProgrammingError:
+                    pass  # owned by another (finished) thread
+            self._connections.clear()
+        self._local = threading.local()
+
+    # ------------------------------------------------------------------
+    # Row mapping
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _state_params(state: dict) -> list:
+        params = []
+        for column in TEXT_COLUMNS:
+            params.append(state.get(column))
+        for column in BOOL_COLUMNS + INT_COLUMNS:
+            value = state.get(column)
+            params.append(int(value) if value is not None else None)
+        for column in JSON_COLUMNS:
+            value = state.get(column)
+            params.append(_dumps(value) if value is not None else None)
+        known = set(STATE_COLUMNS) | {"user_id", "conversation_history"}
+        extra = {k: v for k, v in state.items() if k not in known}
+        params.append(_dumps(extra) if extra else None)
+        return params
+
+    @staticmethod
+    def _state_from_row(user_id: str, row: tuple) -> dict:
+        state: dict = {"user_id": user_id}
+        values = dict(zip(STATE_COLUMNS, row))
+        for column in TEXT_COLUMNS:  # all Optional[str] in SessionState
+            state[column] = values[column]
+        for column in INT_COLUMNS:
+            if values[column] is not None:
+                state[column] = values[column]
+        for column in BOOL_COLUMNS:
+            if values[column] is not None:
+                state[column] = bool(values[column])
+        for column in JSON_COLUMNS:
+            if values[column] is not None:
+                state[column] = json.loads(values[column])
+        extra = row[len(STATE_COLUMNS)]
+        if extra:
+            state.update(json.loads(extra))
+        return state
+
+    # ------------------------------------------------------------------
+    # PersistenceBackend API
+    # ------------------------------------------------------------------
+
+    def save(self, user_id: str, state: dict) -> None:
+        """Upsert the user row and append new history rows."""
+        history = state.get("conversation_history") or []
+        try:
+            with self._transaction() as conn:
+                meta = conn.execute(_SELECT_META, (user_id,)).fetchone()
+                count, last = meta if meta else (0, None)
+
+                can_append = (
+                    meta is not None
+                    and len(history) >= count
+                    and (count == 0 or _message_digest(history[count - 1]) == last)
+                )
+                if not can_append:
+                    conn.execute(_DELETE_HISTORY, (user_id,))
+                    count = 0
+
+                conn.executemany(
+                    _INSERT_MESSAGE,
+                    (
+                        _message_row(user_id, seq, message)
+                        for seq, message in enumerate(history[count:], start=count)
+                    ),
+                )
+                conn.execute(
+                    _UPSERT_USER,
+                    (
+                        user_id,
+                        *self._state_params(state),
+                        len(history),
+                        _message_digest(history[-1]) if history else None,
+                        time.time(),
+                    ),
+                )
+        except Exception as exc:
+            raise PersistenceError(
+                f"Failed to save state for {user_id}: {exc}"
+            ) from exc
+
+    def load(
+        self, user_id: str, fields: Optional[Sequence[str]] = None
+    ) -> Optional[dict]:
+        """Load user state (row + ordered history; the row alone if `fields`
+        does not include conversation_history).
+
+        Row and history are read in one transaction, so a concurrent save
+        never mixes the scalars of one version with the history of another.
+        """
+        try:
+            if not needs_history(fields):
+                # A single statement is consistent on its own
+                row = self._conn().execute(_SELECT_USER, (user_id,)).fetchone()
+                if row is None:
+                    return None
+                return project(self._state_from_row(user_id, row), fields)
+            with self._read() as conn:
+                state = self._load_with(conn, user_id)
+            return project(state, fields) if state is not None else None
+        except Exception as exc:
+            raise PersistenceError(
+                f"Failed to load state for {user_id}: {exc}"
+            ) from exc
+
+    def _load_with(self, conn: sqlite3.Connection, user_id: str) -> Optional[dict]:
+        """Full state (row + history) read inside the caller's transaction."""
+        row = conn.execute(_SELECT_USER, (user_id,)).fetchone()
+        if row is None:
+            return None
+        state = self._state_from_row(user_id, row)
+        state["conversation_history"] = [
+            _message_from_row(r) for r in conn.execute(_SELECT_HISTORY, (user_id,))
+        ]
+        return state
+
+    def load_history(self, user_id: str, limit: Optional[int] = None) -> list[dict]:
+        """Read the last `limit` messages of a user's history (all if None)."""
+        try:
+            conn = self._conn()
+            if limit is None:
+                rows = conn.execute(_SELECT_HISTORY, (user_id,)).fetchall()
+            else:
+                rows = conn.execute(_SELECT_HISTORY_TAIL, (user_id, limit)).fetchall()
+                rows.reverse()
+            return [_message_from_row(r) for r in rows]
+        except Exception as exc:
+            raise PersistenceError(
+                f"Failed to load history for {user_id}: {exc}"
+            ) from exc
+
+    def load_many(
+        self, user_ids: Iterable[str], fields: Optional[Sequence[str]] = None
+    ) -> dict[str, dict]:
+        """Load a batch of users with one users query and one history query."""
+        user_ids = list(user_ids)
+        with_history = needs_history(fields)
+        states: dict[str, dict] = {}
+        try:
+            with self._read() as conn:
+                for start in range(0, len(user_ids), _IN_CHUNK):
+                    chunk = user_ids[start : start + _IN_CHUNK]
+                    marks = ", ".join("?" * len(chunk))
+                    rows = conn.execute(_SELECT_USERS_IN.format(marks=marks), chunk)
+                    for row in rows:
+                        states[row[0]] = self._state_from_row(row[0], row[1:])
+                    if not with_history:
+                        continue
+                    for user_id in chunk:
+                        if user_id in states:
+                            states[user_id]["conversation_history"] = []
+                    for row in conn.execute(
+                        _SELECT_HISTORY_IN.format(marks=marks), chunk
+                    ):
+                        states[row[0]]["conversation_history"].append(
+                            _message_from_row(row[1:])
+                        )
+        except Exception as exc:
+            raise PersistenceError(f"Failed to load users: {exc}") from exc
+        return {
+            user_id: project(states[user_id], fields)
+            for user_id in user_ids
+            if user_id in states
+        }
+
+    def save_many(self, states: Mapping[str, dict]) -> None:
+        """Save a batch of users in a single transaction."""
+        with self.batch():
+            for user_id, state in states.items():
+                self.save(user_id, state)
+
+    def _user_pages(self, batch_size: int) -> Iterator[list[str]]:
+        conn = self._conn()
+        after = ""
+        while True:
+            page = [
+                row[0]
+                for row in conn.execute(_SELECT_USER_PAGE, (after, batch_size))
+            ]
+            if not page:
+                return
+            yield page
+            after = page[-1]
+
+    def exists(self, user_id: str) -> bool:
+        row = self._conn().execute(
+            "SELECT 1 FROM users WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return row is not None
+
+    def delete(self, user_id: str) -> None:
+        try:
+            with self._transaction() as conn:
+                deleted = conn.execute(
+                    "DELETE FROM users WHERE user_id = ?", (user_id,)
+                ).rowcount
+                conn.execute(_DELETE_HISTORY, (user_id,))
+        except Exception as exc:
+            raise PersistenceError(
+                f"Failed to delete state for {user_id}: {exc}"
+            ) from exc
+        if not deleted:
+            raise PersistenceError(f"User {user_id} does not exist")
+
+    def delete_if_unchanged(self, user_id: str, expected: dict) -> bool:
+        """Compare and delete in one write transaction (all processes)."""
+        try:
+            with self._transaction() as conn:
+                if self._load_with(conn, user_id) != expected:
+                    return False
+                conn.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
+                conn.execute(_DELETE_HISTORY, (user_id,))
+                return True
+        except Exception as exc:
+            raise PersistenceError(
+                f"Failed to delete state for {user_id}: {exc}"
+            ) from exc
+
+    def list_users(self) -> list[str]:
+        rows = self._conn().execute("SELECT user_id FROM users ORDER BY user_id")
+        return [row[0] for row in rows]
+
+    def idle_users(self, before: float) -> list[str]:
+        # Range scan of idx_users_updated_at
+        rows = self._conn().execute(
+            "SELECT user_id FROM users WHERE updated_at < ? ORDER BY user_id",
+            (before,),
+        )
+        return [row[0] for row in rows]
+
+    def clear_all(self) -> None:
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM history")
+            conn.execute("DELETE FROM users")
+
+    def get_storage_size(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM users").fetchone()[0]
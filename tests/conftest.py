@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Shared fixtures: the repository root on sys.path, a quiet Config, and a
+TurnPipeline whose coach answers without an LLM (StubCoach).
+"""
+
+from __future__ import annotations
+
+import sys
+import threading
+from pathlib import Path
+from typing import Callable, Optional
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import Config  # noqa: E402
+from engine.cancellation import CancelToken  # noqa: E402
+from engine.coach import CoachAgent  # noqa: E402
+from engine.pipeline import TurnPipeline  # noqa: E402
+from memory.schemas.coach_types import (  # noqa: E402
+    CoachingPhase,
+    CoachResponseAnalysis,
+    QuestionType,
+)
+from persistence.in_memory import InMemoryBackend  # noqa: E402
+from utils.scheduler import FairScheduler  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def _quiet_config(monkeypatch, tmp_path):
+    """No debug prints, and nothing written under the real data/ directory."""
+    monkeypatch.setattr(Config, "DEBUG", False)
+    monkeypatch.setattr(Config, "DATA_DIR", tmp_path / "data")
+    monkeypatch.setattr(Config, "PROFILES_DIR", tmp_path / "data" / "profiles")
+    monkeypatch.setattr(Config, "SQLITE_PATH", tmp_path / "data" / "coach.db")
+    monkeypatch.setattr(Config, "ARCHIVE_DIR", tmp_path / "data" / "archive")
+
+
+class StubCoach(CoachAgent):
+    """
+    CoachAgent with generate() replaced: replies "Echo: <last message>",
+    streamed word by word, without calling the LLM.
+
+    Set `hold` to make turns wait for it (checking their cancel token) before
+    replying, and `fail` to make them raise instead.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.calls: list[str] = []
+        self.hold: Optional[threading.Event] = None
+        self.started = threading.Event()
+        self.fail: Optional[Exception] = None
+
+    def generate(
+        self,
+        messages: list[dict],
+        on_token: Optional[Callable[[str], None]] = None,
+        cancel: Optional[CancelToken] = None,
+    ) -> CoachResponseAnalysis:
+        message = messages[-1]["content"]
+        self.calls.append(message)
+        self.started.set()
+        if self.hold is not None:
+            while not self.hold.wait(0.01):
+                if cancel is not None:
+                    cancel.check()
+        if self.fail is not None:
+            raise self.fail
+
+        reply = f"Echo: {message}"
+        if on_token is not None:
+            words = reply.split(" ")
+            for i, word in enumerate(words):
+                on_token(word if i == 0 else " " + word)
+        return CoachResponseAnalysis(
+            analysis_summary="stub",
+            coaching_phase=CoachingPhase.INTRODUCTION,
+            question_type=QuestionType.OPEN,
+            ai_response=reply,
+        )
+
+
+@pytest.fixture
+def coach() -> StubCoach:
+    return StubCoach()
+
+
+@pytest.fixture
+def pipeline(coach) -> TurnPipeline:
+    """In-memory pipeline with generous admission limits (tests set their own)."""
+    scheduler = FairScheduler(slots=4, rate_per_s=100.0, burst=100, max_queued=10)
+    return TurnPipeline(coach, InMemoryBackend(), scheduler=scheduler)
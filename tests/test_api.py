@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+api.py driven in-process with starlette's TestClient over a stubbed pipeline
+(tests/conftest.py): turns, state projections, deletion and the stream.
+"""
+
+from __future__ import annotations
+
+import threading
+
+import pytest
+from starlette.testclient import TestClient
+
+from api import create_app
+from utils.scheduler import FairScheduler
+
+
+@pytest.fixture
+def client(pipeline):
+    with TestClient(create_app(pipeline)) as client:
+        yield client
+
+
+def test_post_turn(client, coach):
+    response = client.post("/users/u1/turns", json={"message": "Czesc"})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["reply"] == "Echo: Czesc"
+    assert body["replayed"] is False
+    assert [m["content"] for m in body["new_messages"]] == ["Czesc", "Echo: Czesc"]
+    assert coach.calls == ["Czesc"]
+
+
+@pytest.mark.parametrize("body", [b"not json", b'{"message": "  "}', b"[]"])
+def test_post_turn_rejects_bad_body(client, body):
+    response = client.post("/users/u1/turns", content=body)
+
+    assert response.status_code == 400
+
+
+def test_post_turn_replays_request_id(client, coach):
+    first = client.post("/users/u1/turns", json={"message": "Hej", "request_id": "r1"})
+    again = client.post(
+        "/users/u1/turns", json={"message": "Hej"}, headers={"Idempotency-Key": "r1"}
+    )
+
+    assert again.json()["replayed"] is True
+    assert again.json()["reply"] == first.json()["reply"]
+    assert coach.calls == ["Hej"]
+
+
+def test_post_turn_rate_limited(pipeline, coach):
+    pipeline.scheduler = FairScheduler(rate_per_s=0.001, burst=1)
+    with TestClient(create_app(pipeline)) as client:
+        assert client.post("/users/u1/turns", json={"message": "a"}).status_code == 200
+        response = client.post("/users/u1/turns", json={"message": "b"})
+
+    assert response.status_code == 429
+    assert response.json()["reason"] == "rate"
+    assert int(response.headers["Retry-After"]) >= 1
+    assert coach.calls == ["a"]
+
+
+def test_post_turn_llm_error(client, coach):
+    coach.fail = RuntimeError("boom")
+
+    response = client.post("/users/u1/turns", json={"message": "a"})
+
+    assert response.status_code == 502
+    assert client.get("/users/u1/state").status_code == 404
+
+
+def test_get_state_projection(client):
+    client.post("/users/u1/turns", json={"message": "Czesc"})
+
+    full = client.get("/users/u1/state").json()
+    projected = client.get("/users/u1/state", params={"fields": "user_id,current_phase"})
+
+    assert len(full["conversation_history"]) == 2
+    assert projected.status_code == 200
+    assert projected.json() == {"user_id": "u1", "current_phase": full["current_phase"]}
+
+
+def test_get_state_errors(client):
+    assert client.get("/users/nobody/state").status_code == 404
+    client.post("/users/u1/turns", json={"message": "Czesc"})
+    assert client.get("/users/u1/state", params={"fields": "nope"}).status_code == 400
+
+
+def test_delete_user(client):
+    client.post("/users/u1/turns", json={"message": "Czesc"})
+
+    assert client.delete("/users/u1").status_code == 204
+    assert client.get("/users/u1/state").status_code == 404
+    assert client.delete("/users/u1").status_code == 404
+
+
+def test_stream_turn(client):
+    with client.websocket_connect("/users/u1/stream") as ws:
+        ws.send_json({"message": "Jak sie masz"})
+        frames = []
+        while not frames or frames[-1]["type"] == "token":
+            frames.append(ws.receive_json())
+
+    tokens = "".join(f["text"] for f in frames if f["type"] == "token")
+    assert tokens == "Echo: Jak sie masz"
+    assert frames[-1]["type"] == "turn"
+    assert frames[-1]["reply"] == "Echo: Jak sie masz"
+
+
+def test_stream_rejects_bad_message(client):
+    with client.websocket_connect("/users/u1/stream") as ws:
+        ws.send_text("not json")
+        assert ws.receive_json()["type"] == "error"
+
+
+def test_stream_supersedes_running_turn(client, coach):
+    coach.hold = threading.Event()
+    with client.websocket_connect("/users/u1/stream") as ws:
+        ws.send_json({"message": "pierwsza"})
+        assert coach.started.wait(5)
+        ws.send_json({"message": "druga"})
+        first = ws.receive_json()
+        coach.hold.set()
+        frames = [ws.receive_json()]
+        while frames[-1]["type"] == "token":
+            frames.append(ws.receive_json())
+
+    assert first == {"type": "cancelled", "reason": "superseded"}
+    assert frames[-1]["reply"] == "Echo: druga"
+    history = client.get("/users/u1/state").json()["conversation_history"]
+    assert [m["content"] for m in history] == ["pierwsza", "druga", "Echo: druga"]
+
+
+def test_stream_invalid_frame_does_not_supersede(client, coach):
+    coach.hold = threading.Event()
+    with client.websocket_connect("/users/u1/stream") as ws:
+        ws.send_json({"message": "hello"})
+        assert coach.started.wait(5)
+        ws.send_text("not json")
+        error = ws.receive_json()
+        coach.hold.set()
+        frames = [ws.receive_json()]
+        while frames[-1]["type"] == "token":
+            frames.append(ws.receive_json())
+
+    assert error["type"] == "error"
+    assert frames[-1]["type"] == "turn"
+    assert frames[-1]["reply"] == "Echo: hello"
+    history = client.get("/users/u1/state").json()["conversation_history"]
+    assert [m["content"] for m in history] == ["hello", "Echo: hello"]
+
+
+def test_stream_disconnect_cancels_turn(client, coach, pipeline):
+    coach.hold = threading.Event()
+    with client.websocket_connect("/users/u1/stream") as ws:
+        ws.send_json({"message": "hello"})
+        assert coach.started.wait(5)
+
+    assert not pipeline.storage.exists("u1")
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Round-trips through every persistence backend: save/load, projections,
+history tails, listing and deletion.
+"""
+
+from __future__ import annotations
+
+import pytest
+
+from memory.schemas.session_state import SessionState
+from persistence.backend import PersistenceError
+from persistence.file_backend import FileBackend
+from persistence.in_memory import InMemoryBackend
+from persistence.redis_backend import RedisBackend
+from persistence.sqlite_backend import SqliteBackend
+
+
+@pytest.fixture(params=["in_memory", "file", "sqlite", "redis"])
+def backend(request, tmp_path):
+    if request.param == "in_memory":
+        return InMemoryBackend()
+    if request.param == "file":
+        return FileBackend(tmp_path / "users")
+    if request.param == "sqlite":
+        return SqliteBackend(tmp_path / "coach.db")
+    fakeredis = pytest.importorskip("fakeredis")
+    return RedisBackend(prefix="test", client=fakeredis.FakeRedis())
+
+
+def make_state(user_id: str, turns: int = 3) -> SessionState:
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"pytanie {i}"})
+        history.append({"role": "assistant", "content": f"odpowiedz {i}"})
+    return SessionState(
+        user_id=user_id,
+        user_name="Ala",
+        conversation_history=history,
+        current_phase="EXPLORATION",
+    )
+
+
+def test_missing_user(backend):
+    assert backend.load("nobody") is None
+    assert backend.load_state("nobody") is None
+    assert not backend.exists("nobody")
+
+
+def test_state_round_trip(backend):
+    state = make_state("u1")
+    backend.save_state("u1", state)
+
+    assert backend.exists("u1")
+    assert backend.load_state("u1") == state
+    assert backend.load("u1") == state.model_dump()
+
+
+def test_save_overwrites(backend):
+    backend.save_state("u1", make_state("u1", turns=1))
+    backend.save_state("u1", make_state("u1", turns=4))
+
+    assert len(backend.load_state("u1").conversation_history) == 8
+
+
+def test_projection_without_history(backend):
+    backend.save_state("u1", make_state("u1"))
+
+    state = backend.load("u1", fields=["user_name", "current_phase"])
+
+    assert state == {"user_name": "Ala", "current_phase": "EXPLORATION"}
+
+
+def test_history_tail(backend):
+    state = make_state("u1")
+    backend.save_state("u1", state)
+
+    assert backend.load_history("u1") == state.conversation_history
+    assert backend.load_history("u1", limit=2) == state.conversation_history[-2:]
+
+
+def test_lazy_history(backend):
+    state = make_state("u1")
+    backend.save_state("u1", state)
+
+    lazy = backend.load_state("u1", lazy_history=True)
+
+    assert lazy.user_name == "Ala"
+    assert lazy.conversation_history == state.conversation_history
+
+
+def test_list_and_delete(backend):
+    for user_id in ("a", "b", "c"):
+        backend.save_state(user_id, make_state(user_id, turns=1))
+
+    assert sorted(backend.list_users()) == ["a", "b", "c"]
+
+    backend.delete("b")
+    assert sorted(backend.list_users()) == ["a", "c"]
+    assert backend.load("b") is None
+    with pytest.raises(PersistenceError):
+        backend.delete("b")
+
+
+def test_bulk_api(backend):
+    states = {u: make_state(u, turns=1).model_dump() for u in ("a", "b")}
+    backend.save_many(states)
+
+    assert backend.load_many(["a", "b", "missing"]) == states
+    assert dict(backend.iter_states(batch_size=1)) == states
+
+
+@pytest.mark.parametrize(
+    "name, cached", [("in_memory", True), ("file", False), ("sqlite", False)]
+)
+def test_state_cache_only_over_private_backends(monkeypatch, name, cached):
+    from config import Config
+    from persistence import get_backend
+    from persistence.cached import CachedBackend
+
+    monkeypatch.setattr(Config, "PERSISTENCE_BACKEND", name)
+    monkeypatch.setattr(Config, "STATE_CACHE_ENABLED", True)
+    backend = get_backend()
+    assert isinstance(backend, CachedBackend) is cached
+    getattr(backend, "close", lambda: None)()
+
+
+def test_redis_is_shared():
+    assert RedisBackend.shared
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Write-behind state cache (persistence/cached.py) over an in-memory backend.
+"""
+
+from __future__ import annotations
+
+from typing import Callable, Optional
+
+import pytest
+
+from persistence.cached import CachedBackend
+from persistence.in_memory import InMemoryBackend
+
+
+class RecordingBackend(InMemoryBackend):
+    """InMemoryBackend that counts calls and can run a hook inside save()."""
+
+    def __init__(self):
+        super().__init__()
+        self.saves = 0
+        self.loads = 0
+        self.on_save: Optional[Callable[[str, dict], None]] = None
+
+    def save(self, user_id: str, state: dict) -> None:
+        if self.on_save is not None:
+            self.on_save(user_id, state)
+        self.saves += 1
+        super().save(user_id, state)
+
+    def load(self, user_id, fields=None):
+        self.loads += 1
+        return super().load(user_id, fields)
+
+
+@pytest.fixture
+def backend():
+    return RecordingBackend()
+
+
+@pytest.fixture
+def cache(backend):
+    cache = CachedBackend(backend, max_entries=8, start_flusher=False)
+    yield cache
+    cache.close()
+
+
+def state(user_id: str, name: str) -> dict:
+    return {"user_id": user_id, "user_name": name, "conversation_history": []}
+
+
+def test_metrics_exported(cache):
+    from utils.metrics import REGISTRY
+
+    cache.export_metrics()
+    cache.save("u1", state("u1", "Ala"))
+    cache.load("u1")
+    cache.load("nobody")
+
+    text = REGISTRY.render()
+    assert "coach_state_cache_hit_ratio 0.5" in text
+    assert 'coach_state_cache_entries{state="dirty"} 1' in text
+    assert 'coach_state_cache_events{event="miss"} 1' in text
+
+
+def test_save_is_written_behind(cache, backend):
+    cache.save("u1", state("u1", "Ala"))
+
+    assert backend.load("u1") is None
+    assert cache.load("u1") == state("u1", "Ala")
+    assert cache.flush() == 1
+    assert backend.load("u1") == state("u1", "Ala")
+    assert cache.flush() == 0  # clean now
+
+
+def test_save_racing_flush_stays_dirty(cache, backend):
+    cache.save("u1", state("u1", "stara"))
+
+    def save_during_flush(user_id, _):
+        backend.on_save = None
+        cache.save(user_id, state(user_id, "nowa"))  # lands mid-write
+
+    backend.on_save = save_during_flush
+    cache.flush()
+
+    assert backend.load("u1") == state("u1", "stara")
+    assert cache.cache_info()["dirty"] == 1
+    cache.flush()
+    assert backend.load("u1") == state("u1", "nowa")
+    assert cache.cache_info()["dirty"] == 0
+
+
+def test_eviction_flush_failure_keeps_entry(backend):
+    cache = CachedBackend(backend, max_entries=1, start_flusher=False)
+
+    def fail(user_id, _):
+        raise OSError("disk full")
+
+    backend.on_save = fail
+    cache.save("u1", state("u1", "Ala"))
+    cache.save("u2", state("u2", "Ola"))  # evicts u1, whose write fails
+
+    assert cache.cache_info()["size"] == 2
+    assert cache.stats.flush_errors == 1
+    assert cache.load("u1") == state("u1", "Ala")
+
+    backend.on_save = None
+    cache.save("u3", state("u3", "Ela"))  # the retry succeeds this time
+    assert backend.load("u1") == state("u1", "Ala")
+    cache.close()
+    assert sorted(backend.list_users()) == ["u1", "u2", "u3"]
+
+
+def test_eviction_writes_before_removing(backend):
+    cache = CachedBackend(backend, max_entries=2, start_flusher=False)
+    for user_id in ("u1", "u2", "u3"):
+        cache.save(user_id, state(user_id, user_id))
+
+    assert cache.stats.evictions == 1
+    assert backend.load("u1") == state("u1", "u1")
+    assert cache.load("u1") == state("u1", "u1")  # from the backend again
+    cache.close()
+
+
+def test_load_fields_on_hit(cache, backend):
+    cache.save("u1", state("u1", "Ala"))
+    hits = cache.stats.hits
+
+    projected = cache.load("u1", fields=["user_name"])
+    projected["user_name"] = "zmienione"
+
+    assert projected == {"user_name": "zmienione"}
+    assert cache.stats.hits == hits + 1
+    assert backend.loads == 0
+    assert cache.load("u1", fields=["user_name"]) == {"user_name": "Ala"}
+
+
+def test_load_fields_on_miss_is_not_cached(cache, backend):
+    backend.save("u1", state("u1", "Ala"))
+
+    assert cache.load("u1", fields=["user_name"]) == {"user_name": "Ala"}
+    assert cache.cache_info()["size"] == 0
+
+
+def test_close_writes_everything(backend):
+    cache = CachedBackend(backend, flush_interval_s=60.0)  # flusher never fires
+    for user_id in ("u1", "u2", "u3"):
+        cache.save(user_id, state(user_id, user_id))
+
+    cache.close()
+
+    assert sorted(backend.list_users()) == ["u1", "u2", "u3"]
+    assert cache.cache_info()["dirty"] == 0
+
+
+def test_delete_drops_entry_and_backend_copy(cache, backend):
+    cache.save("u1", state("u1", "Ala"))
+    cache.flush()
+
+    cache.delete("u1")
+
+    assert not cache.exists("u1")
+    assert backend.load("u1") is None
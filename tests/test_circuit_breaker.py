@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+CircuitBreaker (utils/circuit_breaker.py) on a fake clock: state transitions,
+slow calls, half-open probing, ignored exceptions and streamed calls.
+"""
+
+from __future__ import annotations
+
+import pytest
+
+from utils import circuit_breaker
+from utils.circuit_breaker import BreakerState, CircuitBreaker, CircuitOpen
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+class Ignored(Exception):
+    pass
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker(
+        "test",
+        window=4,
+        min_calls=2,
+        failure_rate=0.5,
+        slow_call_s=10.0,
+        open_s=30.0,
+        probes=1,
+        ignore=(Ignored,),
+    )
+
+
+def succeed(breaker, clock=None, took_s=0.0):
+    with breaker.call():
+        if clock is not None:
+            clock.now += took_s
+
+
+def fail(breaker, exc=RuntimeError("down")):
+    with pytest.raises(type(exc)):
+        with breaker.call():
+            raise exc
+
+
+def open_circuit(breaker):
+    fail(breaker)
+    fail(breaker)
+    assert breaker.state is BreakerState.OPEN
+
+
+def test_opens_on_failure_rate(breaker):
+    fail(breaker)
+    assert breaker.state is BreakerState.CLOSED  # below min_calls
+    succeed(breaker)
+    assert breaker.state is BreakerState.OPEN  # 1 of 2 failed
+
+
+def test_open_rejects_at_once(breaker, clock):
+    open_circuit(breaker)
+    clock.now += 5
+
+    with pytest.raises(CircuitOpen) as exc:
+        succeed(breaker)
+
+    assert exc.value.retry_after_s == pytest.approx(25.0)
+
+
+def test_slow_call_counts_as_failure(breaker, clock):
+    succeed(breaker, clock, took_s=10.0)
+    succeed(breaker, clock, took_s=1.0)
+
+    assert breaker.state is BreakerState.OPEN
+
+
+def test_half_open_probe_closes(breaker, clock):
+    open_circuit(breaker)
+    clock.now += 30
+
+    assert breaker.state is BreakerState.HALF_OPEN
+    succeed(breaker)
+    assert breaker.state is BreakerState.CLOSED
+    assert breaker.snapshot()["calls"] == 0  # a fresh window
+
+
+def test_failed_probe_reopens(breaker, clock):
+    open_circuit(breaker)
+    clock.now += 30
+
+    fail(breaker)
+
+    assert breaker.state is BreakerState.OPEN
+    with pytest.raises(CircuitOpen):
+        succeed(breaker)
+
+
+def test_half_open_limits_probes(breaker, clock):
+    open_circuit(breaker)
+    clock.now += 30
+
+    with breaker.call():  # the one probe in flight
+        with pytest.raises(CircuitOpen):
+            succeed(breaker)
+    assert breaker.state is BreakerState.CLOSED
+
+
+def test_ignored_exception_is_not_counted(breaker):
+    for _ in range(4):
+        fail(breaker, Ignored())
+
+    assert breaker.state is BreakerState.CLOSED
+    assert breaker.snapshot()["calls"] == 0
+
+
+def test_ignored_exception_releases_probe(breaker, clock):
+    open_circuit(breaker)
+    clock.now += 30
+
+    fail(breaker, Ignored())
+
+    assert breaker.state is BreakerState.HALF_OPEN
+    succeed(breaker)  # the probe slot is free again
+    assert breaker.state is BreakerState.CLOSED
+
+
+def chunks(clock, first_after_s, then_s, count=3, fail_at=None):
+    clock.now += first_after_s
+    for i in range(count):
+        if i == fail_at:
+            raise RuntimeError("stream broke")
+        yield i
+        clock.now += then_s
+
+
+def test_stream_times_first_chunk_only(breaker, clock):
+    for _ in range(2):
+        # Long generation after a fast first chunk: a healthy call
+        got = list(breaker.stream(lambda: chunks(clock, 1.0, 60.0)))
+        assert got == [0, 1, 2]
+
+    assert breaker.state is BreakerState.CLOSED
+    assert breaker.snapshot()["failure_rate"] == 0.0
+
+
+def test_stream_slow_first_chunk_is_slow(breaker, clock):
+    for _ in range(2):
+        list(breaker.stream(lambda: chunks(clock, 12.0, 0.0)))
+
+    assert breaker.state is BreakerState.OPEN
+
+
+def test_stream_failure_midway_counts(breaker, clock):
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            list(breaker.stream(lambda: chunks(clock, 0.0, 0.0, fail_at=1)))
+
+    assert breaker.state is BreakerState.OPEN
+
+
+def test_abandoned_stream_releases_probe(breaker, clock):
+    open_circuit(breaker)
+    clock.now += 30
+
+    stream = breaker.stream(lambda: chunks(clock, 0.0, 0.0))
+    next(stream)
+    stream.close()  # the consumer gave up: no outcome
+
+    assert breaker.state is BreakerState.HALF_OPEN
+    list(breaker.stream(lambda: chunks(clock, 0.0, 0.0)))
+    assert breaker.state is BreakerState.CLOSED
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Config: a malformed numeric env value never breaks the import; validate()
+reports it at launch.
+"""
+
+from __future__ import annotations
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import config
+from config import Config, _env_number
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture
+def invalid_env(monkeypatch):
+    invalid: dict[str, str] = {}
+    monkeypatch.setattr(config, "_INVALID_ENV", invalid)
+    monkeypatch.setattr(Config, "OPENAI_API_KEY", "sk-test")
+    return invalid
+
+
+@pytest.mark.parametrize(
+    "raw, cast, minimum, expected",
+    [
+        ("12", int, 1, 12),
+        (" 7 ", int, 1, 7),
+        ("0.5", float, 0.001, 0.5),
+        ("0", int, 0, 0),
+    ],
+)
+def test_env_number_parses(monkeypatch, invalid_env, raw, cast, minimum, expected):
+    monkeypatch.setenv("COACH_TEST_NUMBER", raw)
+
+    assert _env_number("COACH_TEST_NUMBER", 3, cast, minimum) == expected
+    assert invalid_env == {}
+
+
+@pytest.mark.parametrize(
+    "raw, cast",
+    [("abc", int), ("8.5", int), ("0", int), ("-1", int), ("inf", float), ("nan", float)],
+)
+def test_env_number_falls_back(monkeypatch, invalid_env, raw, cast):
+    monkeypatch.setenv("COACH_TEST_NUMBER", raw)
+
+    assert _env_number("COACH_TEST_NUMBER", 3, cast) == 3
+    assert invalid_env == {"COACH_TEST_NUMBER": raw}
+
+
+def test_env_number_default_when_unset(monkeypatch, invalid_env):
+    monkeypatch.delenv("COACH_TEST_NUMBER", raising=False)
+
+    assert _env_number("COACH_TEST_NUMBER", 3) == 3
+    assert invalid_env == {}
+
+
+def test_validate_reports_invalid_env(monkeypatch, invalid_env):
+    Config.validate()
+
+    invalid_env["TURN_SLOTS"] = "abc"
+    with pytest.raises(ValueError, match="TURN_SLOTS='abc'"):
+        Config.validate()
+
+
+def test_malformed_env_does_not_break_import(tmp_path):
+    env = {**os.environ, "TURN_SLOTS": "eight", "API_PORT": "", "QUEUE_MAX_SIZE": "-5"}
+    probe = (
+        "from config import Config, _INVALID_ENV; "
+        "print(Config.TURN_SLOTS, Config.API_PORT, Config.QUEUE_MAX_SIZE, sorted(_INVALID_ENV))"
+    )
+
+    out = subprocess.run(
+        [sys.executable, "-c", probe],
+        cwd=tmp_path,  # no .env here
+        env={**env, "PYTHONPATH": str(ROOT)},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    assert out.stdout.split("[")[0].split() == ["8", "8081", "256"]
+    assert "'QUEUE_MAX_SIZE', 'TURN_SLOTS'" in out.stdout
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+FallbackResponder (engine/fallback.py): template replies without the LLM.
+"""
+
+from __future__ import annotations
+
+import pytest
+
+from config import Config
+from engine.fallback import BANKS, MAX_QUOTE_CHARS, FallbackResponder
+from memory.schemas.coach_types import CoachingPhase, QuestionType
+from memory.schemas.session_state import SessionState
+
+
+def session(message="Czuje sie zagubiony w pracy", **fields) -> SessionState:
+    history = [
+        {"role": "user", "content": "Czesc"},
+        {"role": "assistant", "content": "Witaj"},
+        {"role": "user", "content": message},
+    ]
+    fields.setdefault("coach_introduced", True)
+    return SessionState(user_id="u1", conversation_history=history, **fields)
+
+
+@pytest.fixture
+def responder():
+    return FallbackResponder()
+
+
+def test_introduction_before_coach_introduced(responder):
+    response = responder.respond(session(coach_introduced=False))
+
+    assert response.ai_response in {
+        t.format(name=Config.COACH_NAME) for t in BANKS["pl"]["introduction"]
+    }
+    assert response.question_type is QuestionType.OPEN
+
+
+def test_paraphrase_quotes_last_user_message(responder):
+    response = responder.respond(session(current_phase="CONTEXT_GATHERING"))
+
+    assert "„Czuje sie zagubiony w pracy”" in response.ai_response
+    assert response.question_type is QuestionType.DEEPENING
+    assert response.coaching_phase is CoachingPhase.CONTEXT_GATHERING
+
+
+def test_long_message_is_shortened(responder):
+    response = responder.respond(session("slowo " * 100, current_phase="EXPLORATION"))
+
+    quote = response.ai_response.split("„")[1].split("”")[0]
+    assert len(quote) <= MAX_QUOTE_CHARS + 3
+    assert quote.endswith("...")
+
+
+def test_emotion_naming_in_exploration(responder):
+    response = responder.respond(
+        session(current_phase="EXPLORATION", detected_emotions=["smutek"])
+    )
+
+    assert "smutek" in response.ai_response
+    assert "„" not in response.ai_response
+
+
+def test_action_question_in_action_phases(responder):
+    response = responder.respond(session(current_phase="ACTION_PLANNING"))
+
+    assert any(q in response.ai_response for q in BANKS["pl"]["action"])
+    assert response.question_type is QuestionType.OPEN
+
+
+def test_english_session(responder):
+    response = responder.respond(
+        session("I feel stuck", detected_language="en", current_phase="EXPLORATION")
+    )
+
+    assert '"I feel stuck"' in response.ai_response
+    assert response.response_language == "en"
+
+
+def test_unknown_phase_falls_back_to_exploration(responder):
+    response = responder.respond(session(current_phase="SOMETHING_ELSE"))
+
+    assert response.coaching_phase is CoachingPhase.EXPLORATION
+
+
+def test_deterministic_and_rotating(responder):
+    state = session(current_phase="EXPLORATION")
+    later = state.model_copy(
+        update={"conversation_history": state.conversation_history * 2}
+    )
+
+    assert responder.respond(state) == responder.respond(state)
+    assert responder.respond(state).ai_response != responder.respond(later).ai_response
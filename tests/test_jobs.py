@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+JobQueue (utils/jobs.py): ordering, coalescing, result caching, cancellation,
+timeouts, deferral and status transitions.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+
+import pytest
+
+from utils.jobs import (
+    PRIORITY_HIGH,
+    PRIORITY_LOW,
+    PRIORITY_NORMAL,
+    JobCancelled,
+    JobQueue,
+    JobStatus,
+)
+
+
+def wait_for(predicate, timeout_s: float = 2.0) -> None:
+    deadline = time.monotonic() + timeout_s
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not reached in time"
+        time.sleep(0.005)
+
+
+def finished(queue, job):
+    return lambda: queue.get(job.id).status.finished
+
+
+@pytest.fixture
+def queue():
+    queue = JobQueue("test", workers=1)
+    yield queue
+    queue.shutdown(wait=False)
+
+
+def blocker(started: threading.Event, release: threading.Event):
+    """A job that holds its worker until `release` is set."""
+
+    def fn(job):
+        started.set()
+        release.wait(2)
+        return "blocked"
+
+    return fn
+
+
+def test_runs_and_returns_result(queue):
+    job = queue.submit(lambda job: 42)
+
+    wait_for(finished(queue, job))
+
+    assert job.status is JobStatus.DONE
+    assert job.result == 42
+    assert job.snapshot()["status"] == "done"
+
+
+def test_failure_is_recorded(queue):
+    def fn(job):
+        raise ValueError("bad input")
+
+    job = queue.submit(fn)
+    wait_for(finished(queue, job))
+
+    assert job.status is JobStatus.FAILED
+    assert job.error == "bad input"
+
+
+def test_lowest_priority_value_first(queue):
+    started, release = threading.Event(), threading.Event()
+    queue.submit(blocker(started, release))
+    assert started.wait(2)
+
+    order = []
+    jobs = [
+        queue.submit(lambda job, p=p: order.append(p), priority=p)
+        for p in (PRIORITY_LOW, PRIORITY_NORMAL, PRIORITY_HIGH, PRIORITY_NORMAL)
+    ]
+    assert queue.position(jobs[2].id) == 0
+    assert queue.position(jobs[0].id) == 3
+    release.set()
+    for job in jobs:
+        wait_for(finished(queue, job))
+
+    assert order == [PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_NORMAL, PRIORITY_LOW]
+
+
+def test_same_key_is_coalesced_while_pending(queue):
+    started, release = threading.Event(), threading.Event()
+    first = queue.submit(blocker(started, release), key="k")
+    assert started.wait(2)
+
+    second = queue.submit(lambda job: "other", key="k")
+
+    assert second is first
+    release.set()
+    wait_for(finished(queue, first))
+    assert first.result == "blocked"
+
+
+def test_result_is_cached_per_key(queue):
+    calls = []
+    job = queue.submit(lambda job: calls.append(1) or "r", key="k")
+    wait_for(finished(queue, job))
+
+    again = queue.submit(lambda job: calls.append(1) or "r", key="k")
+
+    assert again is job
+    assert calls == [1]
+    assert queue.stats()["cached"] == 1
+
+
+def test_failed_result_is_not_cached(queue):
+    def fn(job):
+        raise RuntimeError("boom")
+
+    job = queue.submit(fn, key="k")
+    wait_for(finished(queue, job))
+
+    retry = queue.submit(lambda job: "ok", key="k")
+
+    assert retry is not job
+    wait_for(finished(queue, retry))
+    assert retry.status is JobStatus.DONE
+
+
+def test_cache_is_bounded():
+    queue = JobQueue("test", workers=1, cache_size=2)
+    try:
+        jobs = [queue.submit(lambda job, i=i: i, key=i) for i in range(3)]
+        for job in jobs:
+            wait_for(finished(queue, job))
+
+        assert queue.stats()["cached"] == 2
+        assert queue.submit(lambda job: "new", key=0) is not jobs[0]
+    finally:
+        queue.shutdown(wait=False)
+
+
+def test_cancel_queued_job_never_runs(queue):
+    started, release = threading.Event(), threading.Event()
+    queue.submit(blocker(started, release))
+    assert started.wait(2)
+    ran = []
+    job = queue.submit(lambda job: ran.append(1), key="k")
+
+    assert queue.cancel(job.id)
+    assert job.status is JobStatus.CANCELLED
+    assert queue.submit(lambda job: None, key="k") is not job  # key released
+    release.set()
+    time.sleep(0.05)
+
+    assert ran == []
+    assert not queue.cancel(job.id)  # already finished
+
+
+def test_cancel_running_job_stops_at_checkpoint(queue):
+    reached = threading.Event()
+
+    def fn(job):
+        reached.set()
+        while True:
+            job.report(0.5, "working")
+            time.sleep(0.005)
+
+    job = queue.submit(fn)
+    assert reached.wait(2)
+
+    assert queue.cancel(job.id)
+    assert job.status is JobStatus.CANCELLED
+
+    # The worker is free again
+    after = queue.submit(lambda job: "next")
+    wait_for(finished(queue, after))
+    assert job.status is JobStatus.CANCELLED
+    assert after.status is JobStatus.DONE
+
+
+def test_cancelled_blocked_job_discards_result(queue):
+    started, release = threading.Event(), threading.Event()
+    job = queue.submit(blocker(started, release), key="k")
+    assert started.wait(2)
+
+    queue.cancel(job.id)
+    release.set()
+    after = queue.submit(lambda job: "next")
+    wait_for(finished(queue, after))
+
+    assert job.status is JobStatus.CANCELLED
+    assert job.result is None
+    assert queue.stats()["cached"] == 0
+
+
+def test_get_marks_overdue_job_timed_out(queue):
+    started, release = threading.Event(), threading.Event()
+    job = queue.submit(blocker(started, release), timeout_s=0.05)
+    assert started.wait(2)
+    time.sleep(0.1)
+
+    assert queue.get(job.id).status is JobStatus.TIMED_OUT
+    assert job.remaining_s() == 0.0
+
+    release.set()
+    after = queue.submit(lambda job: "next")
+    wait_for(finished(queue, after))
+    assert job.status is JobStatus.TIMED_OUT
+    assert job.result is None
+
+
+def test_overdue_checkpoint_times_out(queue):
+    def fn(job):
+        while True:
+            job.report(0.1)
+            time.sleep(0.005)
+
+    job = queue.submit(fn, timeout_s=0.05)
+    wait_for(lambda: job.status.finished)
+
+    assert job.status is JobStatus.TIMED_OUT
+    assert job.error == "Timed out"
+
+
+def test_check_raises_after_cancel(queue):
+    started, release = threading.Event(), threading.Event()
+    job = queue.submit(blocker(started, release))
+    assert started.wait(2)
+
+    queue.cancel(job.id)
+    release.set()
+
+    with pytest.raises(JobCancelled):
+        job.check()
+
+
+def test_defer_while_holds_new_jobs():
+    busy = threading.Event()
+    busy.set()
+    queue = JobQueue("test", workers=1, defer_while=busy.is_set)
+    try:
+        job = queue.submit(lambda job: "ran")
+        time.sleep(0.15)
+        assert job.status is JobStatus.QUEUED
+
+        busy.clear()
+        wait_for(finished(queue, job))
+        assert job.result == "ran"
+    finally:
+        queue.shutdown(wait=False)
+
+
+def test_status_transitions_and_stats(queue):
+    started, release = threading.Event(), threading.Event()
+    running = queue.submit(blocker(started, release))
+    assert started.wait(2)
+    queued = queue.submit(lambda job: None)
+
+    assert running.status is JobStatus.RUNNING
+    assert running.started_at is not None
+    assert queued.status is JobStatus.QUEUED
+    assert queue.stats()["jobs"] == {"running": 1, "queued": 1}
+
+    release.set()
+    wait_for(finished(queue, queued))
+    assert queue.stats()["jobs"] == {"done": 2}
+    assert running.finished_at >= running.started_at
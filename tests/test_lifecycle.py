@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Hot/cold lifecycle (persistence/lifecycle.py): sweeps, rehydration, and the
+sweep racing a save from another process.
+
+Two backend instances over the same storage stand in for two processes.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+
+import pytest
+
+from memory.schemas.session_state import SessionState
+from persistence.archive import ColdArchive
+from persistence.file_backend import FileBackend
+from persistence.in_memory import InMemoryBackend
+from persistence.lifecycle import TieredBackend
+from persistence.redis_backend import RedisBackend
+from persistence.shared_store import StripedStore
+from persistence.sqlite_backend import SqliteBackend
+
+TTL_S = 3600.0
+
+
+@pytest.fixture(params=["in_memory", "file", "sqlite", "redis"])
+def backends(request, tmp_path):
+    """Two backends sharing one store: (this process, another process)."""
+    if request.param == "in_memory":
+        store = StripedStore()
+        return InMemoryBackend(store=store), InMemoryBackend(store=store)
+    if request.param == "file":
+        return FileBackend(tmp_path / "users"), FileBackend(tmp_path / "users")
+    if request.param == "sqlite":
+        return SqliteBackend(tmp_path / "coach.db"), SqliteBackend(tmp_path / "coach.db")
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    return (
+        RedisBackend(prefix="test", client=fakeredis.FakeRedis(server=server)),
+        RedisBackend(prefix="test", client=fakeredis.FakeRedis(server=server)),
+    )
+
+
+@pytest.fixture
+def archive(tmp_path):
+    archive = ColdArchive(tmp_path / "archive")
+    yield archive
+    archive.close()
+
+
+def state(user_id: str, text: str) -> dict:
+    return SessionState(
+        user_id=user_id,
+        conversation_history=[{"role": "user", "content": text}],
+        created_at="2026-01-01T00:00:00",
+    ).model_dump()
+
+
+def later() -> float:
+    """A sweep time at which every saved user is idle."""
+    return time.time() + 2 * TTL_S
+
+
+def test_delete_if_unchanged(backends):
+    hot, other = backends
+    hot.save("u1", state("u1", "pierwsza"))
+    expected = hot.load("u1")
+
+    other.save("u1", state("u1", "druga"))
+    assert not hot.delete_if_unchanged("u1", expected)
+    assert hot.load("u1")["conversation_history"][0]["content"] == "druga"
+
+    assert hot.delete_if_unchanged("u1", hot.load("u1"))
+    assert not hot.exists("u1")
+    assert not hot.delete_if_unchanged("u1", expected)
+
+
+def test_sweep_and_rehydrate(backends, archive):
+    hot, _ = backends
+    tiered = TieredBackend(hot, archive, ttl_s=TTL_S, sweep_interval_s=None)
+    tiered.save("u1", state("u1", "czesc"))
+
+    assert tiered.sweep(now=later()) == 1
+    assert not hot.exists("u1")
+    assert archive.contains("u1")
+    assert tiered.exists("u1")
+
+    assert tiered.load("u1") == state("u1", "czesc")
+    assert hot.exists("u1")
+    assert not archive.contains("u1")
+    assert tiered.metrics.rehydrated == 1
+
+
+def test_sweep_keeps_user_saved_by_another_process(backends, archive):
+    hot, other = backends
+    tiered = TieredBackend(hot, archive, ttl_s=TTL_S, sweep_interval_s=None)
+    tiered.save("u1", state("u1", "stara"))
+
+    put_many = archive.put_many
+
+    def put_many_then_save(states):
+        put_many(states)
+        # Another process saves between the archive write and the hot delete
+        other.save("u1", state("u1", "nowa"))
+
+    archive.put_many = put_many_then_save
+
+    assert tiered.sweep(now=later()) == 0
+    assert hot.load("u1") == state("u1", "nowa")
+    assert not archive.contains("u1")
+
+
+def test_delete_if_unchanged_is_atomic(backends):
+    hot, other = backends
+    hot.save("u1", state("u1", "stara"))
+    saver = threading.Thread(target=lambda: other.save("u1", state("u1", "nowa")))
+
+    class Racing(dict):
+        """Starts another process's save during the compare-and-delete."""
+
+        def __eq__(self, stored):
+            if not saver.is_alive() and saver.ident is None:
+                saver.start()
+                saver.join(0.2)  # lands now, unless the backend holds it off
+            return dict.__eq__(self, stored)
+
+        def __ne__(self, stored):
+            return not self.__eq__(stored)
+
+    hot.delete_if_unchanged("u1", Racing(hot.load("u1")))
+    saver.join()
+
+    # Either the delete saw the save and backed off, or the save came after
+    assert other.load("u1") == state("u1", "nowa")
+
+
+def test_save_drops_archived_copy(backends, archive):
+    hot, _ = backends
+    tiered = TieredBackend(hot, archive, ttl_s=TTL_S, sweep_interval_s=None)
+    tiered.save("u1", state("u1", "stara"))
+    tiered.sweep(now=later())
+
+    tiered.save("u1", state("u1", "nowa"))
+
+    assert not archive.contains("u1")
+    assert tiered.load("u1") == state("u1", "nowa")
+
+
+def test_delete_removes_both_tiers(backends, archive):
+    hot, _ = backends
+    tiered = TieredBackend(hot, archive, ttl_s=TTL_S, sweep_interval_s=None)
+    tiered.save("u1", state("u1", "a"))
+    tiered.save("u2", state("u2", "b"))
+    tiered.sweep(now=later())
+    tiered.load("u2")  # back in the hot tier
+
+    tiered.delete("u1")
+    tiered.delete("u2")
+
+    assert tiered.list_users() == []
+
+
+def test_metrics_exported(backends, archive):
+    from utils.metrics import REGISTRY
+
+    hot, _ = backends
+    tiered = TieredBackend(hot, archive, ttl_s=TTL_S, sweep_interval_s=None)
+    tiered.export_metrics()
+    tiered.save("u1", state("u1", "a"))
+    tiered.save("u2", state("u2", "b"))
+    tiered.sweep(now=later())
+    tiered.load("u1")
+
+    text = REGISTRY.render()
+    assert 'coach_lifecycle_users{tier="hot"} 1' in text
+    assert 'coach_lifecycle_users{tier="cold"} 1' in text
+    assert 'coach_lifecycle_events{event="rehydrated"} 1' in text
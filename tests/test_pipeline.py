@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+TurnPipeline behaviour with a stubbed coach (tests/conftest.py): idempotent
+request ids, cancellation and supersession, and admission control.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+
+import pytest
+
+from engine.cancellation import (
+    CANCEL_RESET,
+    CANCEL_SUPERSEDED,
+    CancelToken,
+    TurnCancelled,
+)
+from utils.scheduler import FairScheduler, SlowDown
+
+
+def history(pipeline, user_id="u1"):
+    state = pipeline.storage.load_state(user_id)
+    return [m["content"] for m in state.conversation_history]
+
+
+async def started(coach):
+    assert await asyncio.to_thread(coach.started.wait, 5)
+
+
+# ---------------------------------------------------------------------------
+# Deduplication
+# ---------------------------------------------------------------------------
+
+
+def test_repeated_request_id_replays(pipeline, coach):
+    first = pipeline.run("u1", "Czesc", request_id="r1")
+    again = pipeline.run("u1", "Czesc", request_id="r1")
+
+    assert again.replayed and not first.replayed
+    assert again.reply == first.reply
+    assert coach.calls == ["Czesc"]
+    assert history(pipeline) == ["Czesc", "Echo: Czesc"]
+
+
+def test_request_id_with_other_message_runs(pipeline, coach):
+    pipeline.run("u1", "Czesc", request_id="r1")
+    other = pipeline.run("u1", "Cos innego", request_id="r1")
+
+    assert not other.replayed
+    assert other.reply == "Echo: Cos innego"
+    assert coach.calls == ["Czesc", "Cos innego"]
+
+
+def test_concurrent_duplicate_gets_first_reply(pipeline, coach):
+    coach.hold = threading.Event()
+
+    async def main():
+        first = asyncio.ensure_future(pipeline.arun("u1", "Czesc", request_id="r1"))
+        await started(coach)
+        again = asyncio.ensure_future(pipeline.arun("u1", "Czesc", request_id="r1"))
+        coach.hold.set()
+        return await asyncio.gather(first, again)
+
+    first, again = asyncio.run(main())
+
+    assert again.replayed and again.reply == first.reply
+    assert coach.calls == ["Czesc"]
+
+
+def test_duplicate_of_failed_turn_runs_and_is_charged(pipeline, coach):
+    pipeline.scheduler = FairScheduler(rate_per_s=0.001, burst=2)
+    coach.hold = threading.Event()
+    coach.fail = RuntimeError("boom")
+
+    async def main():
+        first = asyncio.ensure_future(pipeline.arun("u1", "Czesc", request_id="r1"))
+        await started(coach)
+        again = asyncio.ensure_future(pipeline.arun("u1", "Czesc", request_id="r1"))
+        await asyncio.sleep(0)
+        with pytest.raises(SlowDown):
+            await pipeline.arun("u1", "Trzecia")
+        coach.hold.set()
+        return await asyncio.gather(first, again, return_exceptions=True)
+
+    results = asyncio.run(main())
+
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert coach.calls == ["Czesc", "Czesc"]
+
+
+# ---------------------------------------------------------------------------
+# Cancellation
+# ---------------------------------------------------------------------------
+
+
+def test_cancelled_token_saves_nothing(pipeline, coach):
+    cancel = CancelToken()
+    cancel.cancel(CANCEL_RESET)
+
+    with pytest.raises(TurnCancelled):
+        pipeline.run("u1", "Czesc", cancel=cancel)
+
+    assert not pipeline.storage.exists("u1")
+    assert coach.calls == []
+
+
+def test_reset_cancels_running_turn(pipeline, coach):
+    pipeline.run("u1", "Czesc")
+    coach.hold = threading.Event()
+
+    async def main():
+        turn = asyncio.ensure_future(pipeline.arun("u1", "Druga"))
+        await started(coach)
+        assert await pipeline.areset("u1")
+        return await asyncio.gather(turn, return_exceptions=True)
+
+    (result,) = asyncio.run(main())
+
+    assert isinstance(result, TurnCancelled)
+    assert result.reason == CANCEL_RESET
+    assert not pipeline.storage.exists("u1")
+
+
+def test_superseded_turn_keeps_user_message(pipeline, coach):
+    coach.hold = threading.Event()
+
+    async def main():
+        first = asyncio.ensure_future(pipeline.arun("u1", "Pierwsza", supersede=True))
+        await started(coach)
+        second = asyncio.ensure_future(pipeline.arun("u1", "Druga", supersede=True))
+        first_result = await asyncio.gather(first, return_exceptions=True)
+        coach.hold.set()
+        return first_result[0], await second
+
+    first, second = asyncio.run(main())
+
+    assert isinstance(first, TurnCancelled)
+    assert first.reason == CANCEL_SUPERSEDED
+    assert second.reply == "Echo: Druga"
+    assert history(pipeline) == ["Pierwsza", "Druga", "Echo: Druga"]
+
+
+def test_supersede_spares_duplicates(pipeline, coach):
+    coach.hold = threading.Event()
+
+    async def main():
+        first = asyncio.ensure_future(
+            pipeline.arun("u1", "Czesc", request_id="r1", supersede=True)
+        )
+        await started(coach)
+        again = asyncio.ensure_future(
+            pipeline.arun("u1", "Czesc", request_id="r1", supersede=True)
+        )
+        await asyncio.sleep(0)
+        coach.hold.set()
+        return await asyncio.gather(first, again)
+
+    first, again = asyncio.run(main())
+
+    assert not first.replayed and again.replayed
+    assert history(pipeline) == ["Czesc", "Echo: Czesc"]
+
+
+# ---------------------------------------------------------------------------
+# Admission
+# ---------------------------------------------------------------------------
+
+
+def test_rate_limit_rejects_with_retry_hint(pipeline, coach):
+    pipeline.scheduler = FairScheduler(rate_per_s=0.5, burst=1)
+
+    async def main():
+        await pipeline.arun("u1", "a")
+        with pytest.raises(SlowDown) as exc:
+            await pipeline.arun("u1", "b")
+        await pipeline.arun("u2", "c")  # other users keep their own bucket
+        return exc.value
+
+    exc = asyncio.run(main())
+
+    assert exc.reason == "rate"
+    assert 0 < exc.retry_after_s <= 2
+    assert coach.calls == ["a", "c"]
+
+
+def test_queue_limit_rejects(pipeline, coach):
+    pipeline.scheduler = FairScheduler(rate_per_s=100.0, burst=100, max_queued=1)
+    coach.hold = threading.Event()
+
+    async def main():
+        running = asyncio.ensure_future(pipeline.arun("u1", "a"))
+        await started(coach)
+        queued = asyncio.ensure_future(pipeline.arun("u1", "b"))
+        await asyncio.sleep(0)
+        with pytest.raises(SlowDown) as exc:
+            await pipeline.arun("u1", "c")
+        coach.hold.set()
+        await asyncio.gather(running, queued)
+        return exc.value
+
+    exc = asyncio.run(main())
+
+    assert exc.reason == "queue"
+    assert exc.retry_after_s is None
+    assert coach.calls == ["a", "b"]
+
+
+def test_replay_is_not_charged(pipeline, coach):
+    pipeline.scheduler = FairScheduler(rate_per_s=0.001, burst=1)
+
+    async def main():
+        first = await pipeline.arun("u1", "Czesc", request_id="r1")
+        return first, await pipeline.arun("u1", "Czesc", request_id="r1")
+
+    first, again = asyncio.run(main())
+
+    assert again.replayed and again.reply == first.reply
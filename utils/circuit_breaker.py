@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+Circuit breaker: stop calling a dependency that is failing or too slow.
+
+    breaker = CircuitBreaker("llm", failure_rate=0.5, slow_call_s=30, open_s=30)
+    with breaker.call():        # CircuitOpen at once while the circuit is open
+        response = client.chat.completions.create(...)
+
+    for chunk in breaker.stream(lambda: client.chat.completions.create(stream=True)):
+        ...                         # streamed call: see stream()
+
+CLOSED: calls go through; the outcome of the last `window` calls is kept. A
+call that raised, or that took `slow_call_s` or longer, is a failure. Once at
+least `min_calls` are known and the share of failures reaches `failure_rate`,
+the circuit opens.
+
+OPEN: calls are rejected without waiting (CircuitOpen), so callers can
+answer another way in milliseconds. After `open_s` the circuit half-opens.
+
+HALF_OPEN: up to `probes` calls at once go through as probes, the rest are
+rejected. `probes` successful probes in a row close the circuit again; a
+failed probe opens it for another `open_s`.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from enum import Enum
+from typing import Any, Callable, Iterable, Iterator, TypeVar
+
+from .metrics import REGISTRY
+
+BREAKER_STATE = REGISTRY.gauge(
+    "coach_circuit_state", "Circuit state: 0 closed, 1 half-open, 2 open", ["breaker"]
+)
+BREAKER_TRANSITIONS = REGISTRY.counter(
+    "coach_circuit_transitions_total", "Circuit state changes", ["breaker", "to"]
+)
+BREAKER_REJECTED = REGISTRY.counter(
+    "coach_circuit_rejected_total", "Calls rejected by an open circuit", ["breaker"]
+)
+
+
+T = TypeVar("T")
+
+
+class BreakerState(str, Enum):
+    CLOSED = "closed"
+    HALF_OPEN = "half_open"
+    OPEN = "open"
+
+
+_GAUGE_VALUE = {BreakerState.CLOSED: 0, BreakerState.HALF_OPEN: 1, BreakerState.OPEN: 2}
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a dependency whose circuit is open."""
+
+    def __init__(self, name: str, retry_after_s: float):
+        super().__init__(f"Circuit {name} is open (retry in {retry_after_s:.0f}s)")
+        self.name = name
+        self.retry_after_s = retry_after_s
+
+
+class CircuitBreaker:
+    """Error-rate and latency driven breaker with half-open probing."""
+
+    def __init__(
+        self,
+        name: str,
+        window: int = 20,
+        min_calls: int = 5,
+        failure_rate: float = 0.5,
+        slow_call_s: float = 30.0,
+        open_s: float = 30.0,
+        probes: int = 1,
+        ignore: tuple[type[BaseException], ...] = (),
+    ):
+        """
+        Args:
+            name: Breaker name (metrics label, messages)
+            window: Recent calls whose outcome is kept (closed state)
+            min_calls: Calls needed in the window before it can open
+            failure_rate: Share of failed or slow calls that opens it
+            slow_call_s: Duration from which a successful call counts as failed
+            open_s: Time spent open before probing
+            probes: Successful probes in a row that close it again
+            ignore: Exceptions that say nothing about the dependency (e.g. a
+                cancelled caller): the call is not counted
+        """
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_s = slow_call_s
+        self.open_s = open_s
+        self.probes = probes
+        self.ignore = ignore
+
+        self._lock = threading.Lock()
+        self._state = BreakerState.CLOSED
+        self._outcomes: deque[bool] = deque(maxlen=window)  # True: failed
+        self._opened_at = 0.0
+        self._probing = 0  # probes in flight
+        self._probe_successes = 0
+        BREAKER_STATE.labels(name).set(0)
+
+    @property
+    def state(self) -> BreakerState:
+        with self._lock:
+            self._expire_open()
+            return self._state
+
+    def allow(self) -> bool:
+        """
+        Admit a call (a probe when half-open).
+
+        Returns:
+            True for a probe: its outcome decides the circuit
+
+        Raises:
+            CircuitOpen: The circuit is open, or half-open with all probes taken
+        """
+        with self._lock:
+            self._expire_open()
+            if self._state is BreakerState.CLOSED:
+                return False
+            if self._state is BreakerState.HALF_OPEN and self._probing < self.probes:
+                self._probing += 1
+                return True
+            retry_after = max(0.0, self._opened_at + self.open_s - time.monotonic())
+        BREAKER_REJECTED.labels(self.name).inc()
+        raise CircuitOpen(self.name, retry_after)
+
+    def record(self, probe: bool, failed: bool, elapsed_s: float) -> None:
+        """Outcome of an admitted call (see allow())."""
+        failed = failed or elapsed_s >= self.slow_call_s
+        with self._lock:
+            if probe:
+                self._probing -= 1
+                if self._state is not BreakerState.HALF_OPEN:
+                    return
+                if failed:
+                    self._transition(BreakerState.OPEN)
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.probes:
+                    self._transition(BreakerState.CLOSED)
+                return
+
+            if self._state is not BreakerState.CLOSED:
+                return  # a call admitted before the circuit opened
+            self._outcomes.append(failed)
+            if (
+                len(self._outcomes) >= self.min_calls
+                and sum(self._outcomes) / len(self._outcomes) >= self.failure_rate
+            ):
+                self._transition(BreakerState.OPEN)
+
+    def release(self, probe: bool) -> None:
+        """An admitted call ended without an outcome (ignored exception)."""
+        if probe:
+            with self._lock:
+                self._probing -= 1
+
+    @contextmanager
+    def call(self) -> Iterator[None]:
+        """Guard a call: admit it (or raise CircuitOpen) and record its outcome."""
+        probe = self.allow()
+        started = time.monotonic()
+        try:
+            yield
+        except self.ignore:
+            self.release(probe)
+            raise
+        except Exception:
+            self.record(probe, True, time.monotonic() - started)
+            raise
+        except BaseException:  # e.g. an abandoned generator: no outcome
+            self.release(probe)
+            raise
+        self.record(probe, False, time.monotonic() - started)
+
+    def stream(self, open_stream: Callable[[], Iterable[T]]) -> Iterator[T]:
+        """
+        Guard a streamed call and pass its chunks through.
+
+        Only the wait for the first chunk is timed against slow_call_s: a
+        long, healthy generation (and the time the consumer spends on each
+        chunk) is not a slow call. The outcome is recorded when the stream
+        ends: failed if it raised at any point. A stream abandoned by its
+        consumer (closed generator) records no outcome.
+        """
+        probe = self.allow()
+        started = time.monotonic()
+        first_chunk_s = None
+        try:
+            for chunk in open_stream():
+                if first_chunk_s is None:
+                    first_chunk_s = time.monotonic() - started
+                yield chunk
+        except self.ignore:
+            self.release(probe)
+            raise
+        except Exception:
+            self.record(probe, True, time.monotonic() - started)
+            raise
+        except BaseException:
+            self.release(probe)
+            raise
+        if first_chunk_s is None:  # empty stream
+            first_chunk_s = time.monotonic() - started
+        self.record(probe, False, first_chunk_s)
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            self._expire_open()
+            failures = sum(self._outcomes)
+            return {
+                "state": self._state.value,
+                "calls": len(self._outcomes),
+                "failure_rate": round(failures / len(self._outcomes), 3)
+                if self._outcomes
+                else 0.0,
+            }
+
+    # ------------------------------------------------------------------
+    # Internals (called with self._lock held)
+    # ------------------------------------------------------------------
+
+    def _expire_open(self) -> None:
+        if (
+            self._state is BreakerState.OPEN
+            and time.monotonic() - self._opened_at >= self.open_s
+        ):
+            self._transition(BreakerState.HALF_OPEN)
+
+    def _transition(self, state: BreakerState) -> None:
+        self._state = state
+        if state is BreakerState.OPEN:
+            self._opened_at = time.monotonic()
+        elif state is BreakerState.HALF_OPEN:
+            self._probe_successes = 0
+        else:
+            self._outcomes.clear()
+        BREAKER_STATE.labels(self.name).set(_GAUGE_VALUE[state])
+        BREAKER_TRANSITIONS.labels(self.name, state.value).inc()
+        print(f"[CircuitBreaker] {self.name}: {state.value}")
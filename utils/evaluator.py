@@ -5,12 +5,26 @@ LLM-as-Judge Evaluator - dynamic model creation and evaluation.
 Based on lesson 5.3 methodology using pydantic.create_model.
 """
 
+import hashlib
+import json
+import time
 from pydantic import BaseModel, Field, create_model
-from typing import List, Type, Any, Dict
+from typing import List, Optional, Type, Any, Dict
 from .leaderboard_parser import CheckDefinition
+from .metrics import REGISTRY
 from engine.client import get_llm_client
 from config import Config
 
+EVALUATIONS = REGISTRY.counter(
+    "coach_evaluations_total", "LLM-as-Judge evaluation runs", ["outcome"]
+)
+EVALUATION_SECONDS = REGISTRY.histogram(
+    "coach_evaluation_seconds", "Duration of the LLM-as-Judge call"
+)
+EVALUATION_CHECKS = REGISTRY.counter(
+    "coach_evaluation_checks_total", "Evaluated checks by verdict", ["result"]
+)
+
 
 def create_evaluation_model(checks: List[CheckDefinition]) -> Type[BaseModel]:
     """
@@ -68,8 +82,16 @@ def create_evaluation_model(checks: List[CheckDefinition]) -> Type[BaseModel]:
     return create_model("DynamicEvaluationResult", **fields)
 
 
+def conversation_hash(conversation_history: List[Dict[str, Any]]) -> str:
+    """Stable hash of a conversation (key of cached evaluation results)."""
+    data = json.dumps(conversation_history, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()[:16]
+
+
 def evaluate_conversation(
-    session_state: Dict[str, Any], checks: List[CheckDefinition]
+    session_state: Dict[str, Any],
+    checks: List[CheckDefinition],
+    timeout_s: Optional[float] = None,
 ) -> Dict[str, Any]:
     """
     Evaluate a full session state using LLM-as-Judge with structured output.
@@ -77,6 +99,7 @@ def evaluate_conversation(
     Args:
         session_state: Serialized SessionState dict containing conversation_history
         checks: List of criteria to evaluate (already filtered by priority)
+        timeout_s: Time limit of the LLM request (None: client default)
 
     Returns:
         Dict with:
@@ -145,6 +168,7 @@ Oceń powyższy dialog według wszystkich {len(checks)} kryteriów."""
     # Call LLM with structured output
     client = get_llm_client()
 
+    started = time.perf_counter()
     try:
         result = client.chat.completions.create(
             model=Config.MODEL_NAME,
@@ -154,14 +178,19 @@ Oceń powyższy dialog według wszystkich {len(checks)} kryteriów."""
             ],
             response_model=EvaluationModel,
             temperature=0.0,  # Deterministic evaluation
+            **({"timeout": timeout_s} if timeout_s is not None else {}),
         )
     except Exception as e:
+        EVALUATIONS.labels(outcome="error").inc()
         return {
             "error": f"LLM evaluation failed: {str(e)}",
             "results": [],
             "summary": {},
         }
 
+    EVALUATION_SECONDS.observe(time.perf_counter() - started)
+    EVALUATIONS.labels(outcome="ok").inc()
+
     # Parse results
     results = []
     passed_count = 0
@@ -185,6 +214,8 @@ Oceń powyższy dialog według wszystkich {len(checks)} kryteriów."""
         )
 
     failed_count = len(checks) - passed_count
+    EVALUATION_CHECKS.labels(result="passed").inc(passed_count)
+    EVALUATION_CHECKS.labels(result="failed").inc(failed_count)
     score_pct = (passed_count / len(checks) * 100) if checks else 0
 
     # Determine priority group
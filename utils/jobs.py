@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""
+Background jobs: long work (LLM-as-Judge evaluation) off the request path.
+
+    jobs = JobQueue("eval", workers=2, timeout_s=120)
+    job = jobs.submit(fn, key=("user", conversation_hash), priority=PRIORITY_NORMAL)
+    job.id                  # returned to the UI at once
+    jobs.get(job.id)        # poll: status, progress, result / error
+    jobs.cancel(job.id)
+
+`fn(job)` runs on one of `workers` threads, lowest priority value first, and
+reports progress with `job.report(fraction, desc)`. Every report is also a
+checkpoint: a cancelled or overdue job stops there (JobCancelled). A job that
+is blocked in a call (the LLM) when it is cancelled or times out is marked so
+at once and its result is discarded when the call returns; callers pass
+`job.remaining_s()` as the call's own timeout to free the worker too.
+
+Jobs sharing a key are coalesced while one of them is pending, and the result
+of a finished job is kept per key (LRU) and handed out to later submissions.
+With `defer_while`, workers do not start new jobs while it returns True (e.g.
+while interactive chat is saturated), which keeps jobs below chat priority.
+"""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Callable, Hashable, Optional
+
+from .metrics import REGISTRY
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 5
+PRIORITY_LOW = 10
+
+JOBS = REGISTRY.counter("coach_jobs_total", "Finished jobs by status", ["queue", "status"])
+JOBS_PENDING = REGISTRY.gauge(
+    "coach_jobs_pending", "Jobs queued or running", ["queue", "status"]
+)
+JOB_SECONDS = REGISTRY.histogram(
+    "coach_job_seconds", "Job run time (without queueing)", ["queue"]
+)
+
+
+class JobCancelled(Exception):
+    """Raised at a checkpoint of a cancelled or overdue job."""
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+    TIMED_OUT = "timed_out"
+
+    @property
+    def finished(self) -> bool:
+        return self not in (JobStatus.QUEUED, JobStatus.RUNNING)
+
+
+@dataclass
+class Job:
+    """One submitted unit of work and its observable state."""
+
+    id: str
+    key: Optional[Hashable]
+    priority: int
+    timeout_s: Optional[float]
+    status: JobStatus = JobStatus.QUEUED
+    progress: float = 0.0
+    desc: str = ""
+    result: Any = None
+    error: Optional[str] = None
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    _cancel: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    def remaining_s(self) -> Optional[float]:
+        """Seconds until the deadline (None: no timeout or not started)."""
+        if self.timeout_s is None or self.started_at is None:
+            return None
+        return max(0.0, self.started_at + self.timeout_s - time.time())
+
+    def overdue(self) -> bool:
+        remaining = self.remaining_s()
+        return remaining is not None and remaining <= 0
+
+    def check(self) -> None:
+        """Checkpoint: stop here if the job was cancelled or is overdue."""
+        if self._cancel.is_set() or self.overdue():
+            raise JobCancelled(self.id)
+
+    def report(self, fraction: float, desc: str = "") -> None:
+        """Report progress (0.0-1.0); also a checkpoint (see check())."""
+        self.check()
+        self.progress = max(0.0, min(1.0, fraction))
+        self.desc = desc
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "id": self.id,
+            "status": self.status.value,
+            "progress": round(self.progress, 3),
+            "desc": self.desc,
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    """Bounded worker pool over a priority queue of jobs."""
+
+    def __init__(
+        self,
+        name: str,
+        workers: int = 2,
+        timeout_s: Optional[float] = None,
+        cache_size: int = 256,
+        max_jobs: int = 1000,
+        defer_while: Optional[Callable[[], bool]] = None,
+    ):
+        """
+        Args:
+            name: Queue name (metrics label, worker thread names)
+            workers: Jobs running at once
+            timeout_s: Default run time limit of a job (None: unlimited)
+            cache_size: Finished results kept per key
+            max_jobs: Finished jobs kept for polling
+            defer_while: Workers wait while it returns True
+        """
+        self.name = name
+        self.workers = workers
+        self.timeout_s = timeout_s
+        self.cache_size = cache_size
+        self.max_jobs = max_jobs
+        self.defer_while = defer_while
+
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._heap: list[tuple[int, int, Job, Callable[[Job], Any]]] = []
+        self._seq = itertools.count()
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._pending: dict[Hashable, Job] = {}
+        self._results: "OrderedDict[Hashable, Job]" = OrderedDict()
+        self._threads: list[threading.Thread] = []
+        self._stopped = False
+
+    # ------------------------------------------------------------------
+    # Client side
+    # ------------------------------------------------------------------
+
+    def submit(
+        self,
+        fn: Callable[[Job], Any],
+        key: Optional[Hashable] = None,
+        priority: int = PRIORITY_NORMAL,
+        timeout_s: Optional[float] = None,
+    ) -> Job:
+        """
+        Queue `fn(job)`; returns at once.
+
+        With a key: returns the finished job cached under it, or the pending
+        job with the same key, instead of queueing new work.
+        """
+        with self._lock:
+            if key is not None:
+                cached = self._results.get(key)
+                if cached is not None:
+                    self._results.move_to_end(key)
+                    return cached
+                pending = self._pending.get(key)
+                if pending is not None:
+                    return pending
+
+            job = Job(
+                id=uuid.uuid4().hex,
+                key=key,
+                priority=priority,
+                timeout_s=timeout_s if timeout_s is not None else self.timeout_s,
+            )
+            self._jobs[job.id] = job
+            if key is not None:
+                self._pending[key] = job
+            heapq.heappush(self._heap, (priority, next(self._seq), job, fn))
+            self._prune()
+            self._start_workers()
+            self._ready.notify()
+        JOBS_PENDING.labels(self.name, "queued").inc()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """The job (None if unknown or pruned); marks overdue running jobs."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.status is JobStatus.RUNNING and job.overdue():
+                self._finish(job, JobStatus.TIMED_OUT, error="Timed out")
+            return job
+
+    def position(self, job_id: str) -> int:
+        """Queued jobs that will start before this one (0 if not queued)."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status is not JobStatus.QUEUED:
+                return 0
+            entry = next((e for e in self._heap if e[2] is job), None)
+            if entry is None:
+                return 0
+            return sum(
+                1
+                for e in self._heap
+                if (e[0], e[1]) < (entry[0], entry[1])
+                and e[2].status is JobStatus.QUEUED
+            )
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job; False if it already finished."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status.finished:
+                return False
+            job._cancel.set()
+            self._finish(job, JobStatus.CANCELLED, error="Cancelled")
+            return True
+
+    def stats(self) -> dict[str, Any]:
+        """Job counts by status and cached results."""
+        with self._lock:
+            counts: dict[str, int] = {}
+            for job in self._jobs.values():
+                counts[job.status.value] = counts.get(job.status.value, 0) + 1
+            return {"workers": self.workers, "jobs": counts, "cached": len(self._results)}
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop the workers after their current job; queued jobs are dropped."""
+        with self._lock:
+            self._stopped = True
+            self._ready.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    # ------------------------------------------------------------------
+    # Internals (called with self._lock held unless noted)
+    # ------------------------------------------------------------------
+
+    def _start_workers(self) -> None:
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(
+                target=self._work,
+                name=f"{self.name}-job-{len(self._threads)}",
+                daemon=True,
+            )
+            self._threads.append(thread)
+            thread.start()
+
+    def _finish(
+        self,
+        job: Job,
+        status: JobStatus,
+        result: Any = None,
+        error: Optional[str] = None,
+    ) -> None:
+        previous = job.status
+        job.status = status
+        job.result = result
+        job.error = error
+        job.finished_at = time.time()
+        if job.key is not None and self._pending.get(job.key) is job:
+            del self._pending[job.key]
+        if status is JobStatus.DONE and job.key is not None:
+            self._results[job.key] = job
+            self._results.move_to_end(job.key)
+            while len(self._results) > self.cache_size:
+                self._results.popitem(last=False)
+        JOBS_PENDING.labels(self.name, previous.value).dec()
+        JOBS.labels(self.name, status.value).inc()
+        if job.started_at is not None:
+            JOB_SECONDS.labels(self.name).observe(job.finished_at - job.started_at)
+
+    def _prune(self) -> None:
+        """Forget the oldest finished jobs beyond max_jobs."""
+        excess = len(self._jobs) - self.max_jobs
+        for job_id in [j for j, job in self._jobs.items() if job.status.finished]:
+            if excess <= 0:
+                break
+            del self._jobs[job_id]
+            excess -= 1
+
+    def _next(self) -> Optional[tuple[Job, Callable[[Job], Any]]]:
+        """Block until a job can start (outside the lock)."""
+        with self._lock:
+            while True:
+                while not self._stopped and not self._heap:
+                    self._ready.wait()
+                if self._stopped:
+                    return None
+                if self.defer_while is not None and self.defer_while():
+                    self._ready.wait(timeout=0.1)
+                    continue
+                _, _, job, fn = heapq.heappop(self._heap)
+                if job.status is not JobStatus.QUEUED:  # cancelled while queued
+                    continue
+                job.status = JobStatus.RUNNING
+                job.started_at = time.time()
+                JOBS_PENDING.labels(self.name, "queued").dec()
+                JOBS_PENDING.labels(self.name, "running").inc()
+                return job, fn
+
+    def _work(self) -> None:
+        while True:
+            picked = self._next()
+            if picked is None:
+                return
+            job, fn = picked
+            try:
+                job.check()
+                result = fn(job)
+                outcome, error = JobStatus.DONE, None
+                if job.overdue():
+                    outcome, error, result = JobStatus.TIMED_OUT, "Timed out", None
+            except JobCancelled:
+                outcome, error, result = (
+                    (JobStatus.TIMED_OUT, "Timed out", None)
+                    if job.overdue() and not job._cancel.is_set()
+                    else (JobStatus.CANCELLED, "Cancelled", None)
+                )
+            except Exception as exc:
+                print(f"[Jobs] {self.name} job {job.id} failed: {exc}")
+                outcome, error, result = JobStatus.FAILED, str(exc), None
+            with self._lock:
+                # Already finished if cancelled or timed out while running
+                if not job.status.finished:
+                    self._finish(job, outcome, result=result, error=error)
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""
+In-process metrics registry with Prometheus text exposition.
+
+Modules declare their metrics once, at import, and record on hot paths:
+
+    TURNS = REGISTRY.counter("coach_turns_total", "Turns run", ["outcome"])
+    TURNS.labels(outcome="ok").inc()
+
+Recording costs a dict lookup and one uncontended lock (about 1 us), nothing
+next to any turn stage. Gauges can also be computed at scrape time
+(set_function), e.g. queue depths read from Gradio. `REGISTRY.render()`
+returns the text served on /metrics (app.py, api.py).
+
+Standard library only: importing this module costs nothing noticeable.
+"""
+
+from __future__ import annotations
+
+import bisect
+import math
+import threading
+from typing import Any, Callable, Iterable, Mapping, Optional, Sequence, Union
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds: from a cached load to a long LLM call
+DEFAULT_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _label_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+# ----------------------------------------------------------------------
+# Values of one label combination
+# ----------------------------------------------------------------------
+
+
+class _CounterValue:
+    __slots__ = ("_lock", "value")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        if amount < 0:
+            raise ValueError("Counters only go up")
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeValue:
+    __slots__ = ("_lock", "value")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.inc(-amount)
+
+
+class _HistogramValue:
+    __slots__ = ("_lock", "_bounds", "counts", "sum")
+
+    def __init__(self, bounds: tuple[float, ...]):
+        self._lock = threading.Lock()
+        self._bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last: above every bound
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self._bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+# ----------------------------------------------------------------------
+# Metrics
+# ----------------------------------------------------------------------
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _new_value(self) -> Any:
+        raise NotImplementedError
+
+    def labels(self, *values: str, **by_name: str) -> Any:
+        """The value of one label combination (created on first use)."""
+        if by_name:
+            values = tuple([by_name[n] for n in self.labelnames])
+        # Hot path: a single dict lookup of string label values
+        value = self._values.get(values)
+        if value is None:
+            value = self._create(values)
+        return value
+
+    def _create(self, values: tuple) -> Any:
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        values = tuple(str(v) for v in values)
+        with self._lock:
+            return self._values.setdefault(values, self._new_value())
+
+    def _samples(self) -> Iterable[tuple[str, tuple[str, ...], str, float]]:
+        """(suffix, label values, extra label, value) for exposition."""
+        for labels, value in sorted(self._values.items()):
+            yield "", labels, "", value.value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, extra, value in self._samples():
+            label_text = _label_text(self.labelnames, labels, extra)
+            lines.append(f"{self.name}{suffix}{label_text} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonic count (events, tokens)."""
+
+    kind = "counter"
+
+    def _new_value(self) -> _CounterValue:
+        return _CounterValue()
+
+    def inc(self, amount: float = 1.0) -> None:
+        """Increment the unlabelled counter."""
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    """Value that goes up and down (in flight, queue depth)."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._function: Optional[Callable[[], Any]] = None
+
+    def _new_value(self) -> _GaugeValue:
+        return _GaugeValue()
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.labels().dec(amount)
+
+    def set_function(
+        self, fn: Callable[[], Union[float, Mapping[Any, float]]]
+    ) -> None:
+        """
+        Compute the gauge at scrape time.
+
+        `fn` returns a number (unlabelled gauge) or {label value(s): number};
+        with one label name the key may be a plain string.
+        """
+        self._function = fn
+
+    def _samples(self) -> Iterable[tuple[str, tuple[str, ...], str, float]]:
+        if self._function is None:
+            yield from super()._samples()
+            return
+        try:
+            result = self._function()
+        except Exception:  # a failing callback must not break the scrape
+            return
+        if not isinstance(result, Mapping):
+            yield "", (), "", float(result)
+            return
+        for key, value in sorted(result.items(), key=lambda kv: str(kv[0])):
+            labels = key if isinstance(key, tuple) else (key,)
+            yield "", tuple(str(v) for v in labels), "", float(value)
+
+
+class Histogram(_Metric):
+    """Distribution of observations (latencies in seconds)."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_value(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        """Record into the unlabelled histogram."""
+        self.labels().observe(value)
+
+    def _samples(self) -> Iterable[tuple[str, tuple[str, ...], str, float]]:
+        for labels, value in sorted(self._values.items()):
+            with value._lock:
+                counts, total = list(value.counts), value.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield "_bucket", labels, f'le="{_format_value(bound)}"', cumulative
+            yield "_sum", labels, "", total
+            yield "_count", labels, "", cumulative
+
+
+class MetricsRegistry:
+    """Named metrics of the process; declaring a name twice returns the same one."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: dict[str, _Metric] = {}
+
+    def _get_or_create(self, cls: type, name: str, *args: Any, **kwargs: Any) -> Any:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} already registered as {metric.kind}")
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, help, labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._get_or_create(Histogram, name, help, labelnames, buckets)
+
+    def render(self) -> str:
+        """All metrics in Prometheus text exposition format."""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines: list[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# The process-wide registry every module records into
+REGISTRY = MetricsRegistry()
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Queue metrics of the app's concurrency groups (chat, export).
+
+Every handler runs inside `track(group)` and counts as in flight meanwhile.
+Ordered handlers report how long they waited for their turn (e.g. behind an
+earlier message of the same user); the rest of their time is run time. Events
+still waiting in Gradio's own queue are read from it (`gradio_queue_depths`).
+
+Everything is also recorded in the metrics registry (utils/metrics.py) as
+coach_queue_* metrics labelled by group.
+"""
+
+from __future__ import annotations
+
+import functools
+import inspect
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, TypeVar
+
+from .metrics import REGISTRY
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+QUEUE_IN_FLIGHT = REGISTRY.gauge(
+    "coach_queue_in_flight", "Handler calls running or waiting for their turn", ["group"]
+)
+QUEUE_WAITING = REGISTRY.gauge(
+    "coach_queue_waiting", "Ordered handler calls waiting for their turn", ["group"]
+)
+QUEUE_EVENTS = REGISTRY.counter(
+    "coach_queue_events_total", "Finished handler calls", ["group", "outcome"]
+)
+QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    "coach_queue_wait_seconds", "Time waiting behind the same user's events", ["group"]
+)
+QUEUE_RUN_SECONDS = REGISTRY.histogram(
+    "coach_queue_run_seconds", "Handler run time", ["group"]
+)
+
+
+def _percentiles(samples: deque) -> dict[str, float]:
+    ordered = sorted(samples)
+    if not ordered:
+        return {"p50": 0.0, "p95": 0.0, "max": 0.0}
+    return {
+        "p50": round(ordered[len(ordered) // 2], 1),
+        "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1),
+        "max": round(ordered[-1], 1),
+    }
+
+
+@dataclass
+class _Group:
+    in_flight: int = 0
+    waiting: int = 0
+    completed: int = 0
+    failed: int = 0
+    wait_ms: deque = field(default_factory=lambda: deque(maxlen=1000))
+    run_ms: deque = field(default_factory=lambda: deque(maxlen=1000))
+
+
+class Tracked:
+    """Handle of one tracked handler call."""
+
+    def __init__(self, metrics: "QueueMetrics", group: str):
+        self._metrics = metrics
+        self._group = group
+        self.entered = time.perf_counter()
+        self.wait_ms = 0.0
+        self._started = False
+
+    def started(self, wait_ms: float) -> None:
+        """The handler got its turn after waiting `wait_ms`."""
+        if not self._started:
+            self._started = True
+            self.wait_ms = wait_ms
+            self._metrics._started(self._group)
+
+
+class QueueMetrics:
+    """In-flight counts and wait/run time percentiles per group."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._groups: dict[str, _Group] = {}
+
+    def _group(self, name: str) -> _Group:
+        group = self._groups.get(name)
+        if group is None:
+            group = self._groups[name] = _Group()
+        return group
+
+    def _started(self, name: str) -> None:
+        with self._lock:
+            self._group(name).waiting -= 1
+        QUEUE_WAITING.labels(name).dec()
+
+    @contextmanager
+    def track(self, name: str, ordered: bool = False) -> Iterator[Tracked]:
+        """
+        Count a handler call of group `name`.
+
+        With `ordered`, the call counts as waiting until it calls
+        `started(wait_ms)`; otherwise it is running from the start.
+        """
+        tracked = Tracked(self, name)
+        with self._lock:
+            group = self._group(name)
+            group.in_flight += 1
+            group.waiting += 1
+        QUEUE_IN_FLIGHT.labels(name).inc()
+        QUEUE_WAITING.labels(name).inc()
+        if not ordered:
+            tracked.started(0.0)
+        ok = False
+        try:
+            yield tracked
+            ok = True
+        finally:
+            total_ms = (time.perf_counter() - tracked.entered) * 1000
+            with self._lock:
+                group.in_flight -= 1
+                if not tracked._started:
+                    group.waiting -= 1
+                group.completed += ok
+                group.failed += not ok
+                group.wait_ms.append(tracked.wait_ms)
+                group.run_ms.append(total_ms - tracked.wait_ms)
+            QUEUE_IN_FLIGHT.labels(name).dec()
+            if not tracked._started:
+                QUEUE_WAITING.labels(name).dec()
+            QUEUE_EVENTS.labels(name, "ok" if ok else "error").inc()
+            QUEUE_WAIT_SECONDS.labels(name).observe(tracked.wait_ms / 1000)
+            QUEUE_RUN_SECONDS.labels(name).observe((total_ms - tracked.wait_ms) / 1000)
+
+    def tracked(self, name: str) -> Callable[[F], F]:
+        """Decorator: run every call of a (sync or async) handler in track()."""
+
+        def decorate(fn: F) -> F:
+            if inspect.iscoroutinefunction(fn):
+
+                @functools.wraps(fn)
+                async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                    with self.track(name):
+                        return await fn(*args, **kwargs)
+
+                return async_wrapper  # type: ignore[return-value]
+
+            @functools.wraps(fn)
+            def wrapper(*args: Any, **kwargs: Any) -> Any:
+                with self.track(name):
+                    return fn(*args, **kwargs)
+
+            return wrapper  # type: ignore[return-value]
+
+        return decorate
+
+    def snapshot(self) -> dict[str, Any]:
+        """{group: counters and wait/run ms percentiles}."""
+        with self._lock:
+            return {
+                name: {
+                    "in_flight": g.in_flight,
+                    "waiting": g.waiting,
+                    "completed": g.completed,
+                    "failed": g.failed,
+                    "wait_ms": _percentiles(g.wait_ms),
+                    "run_ms": _percentiles(g.run_ms),
+                }
+                for name, g in sorted(self._groups.items())
+            }
+
+
+def gradio_queue_depths(demo: Any) -> dict[str, int]:
+    """
+    Events waiting in Gradio's queue per concurrency group.
+
+    Reads Gradio internals (stable since 4.0); returns {} if they change.
+    """
+    queues = getattr(getattr(demo, "_queue", None), "event_queue_per_concurrency_id", None)
+    if not isinstance(queues, dict):
+        return {}
+    return {name: len(getattr(q, "queue", ())) for name, q in queues.items()}
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+Fair scheduler: admission control and fair sharing of turn slots per user.
+
+    scheduler = FairScheduler(slots=8, rate_per_s=20 / 60, burst=5, max_queued=3)
+    ticket = scheduler.admit(user_id)   # SlowDown: rate or queue limit hit
+    try:
+        await scheduler.wait(ticket)    # a slot, in fair order
+        ...                             # the turn (LLM call)
+    finally:
+        scheduler.release(ticket)
+
+Admission (admit) is decided at once, before anything queues:
+
+- token bucket per user: `burst` turns at once, refilled at `rate_per_s`;
+- at most `max_queued` turns of a user waiting behind the running one.
+
+A rejected turn raises SlowDown (with a retry hint) instead of queueing, so a
+flooding user or script gets a clear answer and holds no slot or worker.
+
+Slots (wait) are shared by weighted fair queuing (start-time fair queuing):
+every admitted turn gets a start tag max(virtual time, user's last finish
+tag) and a finish tag start + 1 / weight; free slots go to the smallest start
+tag. A user with a backlog is served at their weighted share, and a user
+arriving fresh is served next instead of behind the whole backlog.
+
+Metrics: queueing delay (admission to slot) for all turns, per user for the
+users who waited longest recently, and rejected turns by reason.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Mapping, Optional
+
+from .metrics import REGISTRY
+
+QUEUE_SECONDS = REGISTRY.histogram(
+    "coach_scheduler_queue_seconds", "Turn queueing delay: admission to slot"
+)
+USER_QUEUE_SECONDS = REGISTRY.gauge(
+    "coach_scheduler_user_queue_seconds",
+    "Recent queueing delay per user (moving average; users who waited longest)",
+    ["user"],
+)
+REJECTED = REGISTRY.counter(
+    "coach_scheduler_rejected_total", "Turns refused by admission control", ["reason"]
+)
+SLOTS = REGISTRY.gauge("coach_scheduler_slots", "Turn slots by state", ["state"])
+
+
+class SlowDown(Exception):
+    """Raised by admit(): the user sends turns faster than allowed."""
+
+    def __init__(self, reason: str, message: str, retry_after_s: Optional[float]):
+        super().__init__(message)
+        self.reason = reason  # "rate" or "queue"
+        self.retry_after_s = retry_after_s
+
+
+@dataclass
+class Ticket:
+    """An admitted turn: queued for a slot, holding one, or released."""
+
+    key: str
+    start: float
+    seq: int
+    admitted_at: float = field(default_factory=time.monotonic)
+    granted: bool = False
+    released: bool = False
+    _wake: Any = field(default=None, repr=False)  # (loop, future) while waiting
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.updated = now
+
+
+class _UserDelay:
+    __slots__ = ("mean", "seen")
+
+    def __init__(self):
+        self.mean: Optional[float] = None
+        self.seen = 0.0
+
+
+def _wake(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class FairScheduler:
+    """Per-user token buckets and queue limits in front of weighted fair slots."""
+
+    def __init__(
+        self,
+        slots: int = 8,
+        rate_per_s: float = 1 / 3,
+        burst: int = 5,
+        max_queued: int = 3,
+        weights: Optional[Mapping[str, float]] = None,
+        metrics_users: int = 20,
+        idle_s: float = 600.0,
+    ):
+        """
+        Args:
+            slots: Turns running at once (all users)
+            rate_per_s: Sustained turn rate of one user
+            burst: Turns a user may send at once (bucket capacity)
+            max_queued: Turns a user may have waiting behind the running one
+            weights: Share of a user relative to the default weight 1.0
+            metrics_users: Users shown in the per-user delay gauge
+            idle_s: Per-user state is dropped after this long without turns
+
+        Raises:
+            ValueError: A weight is not positive
+        """
+        bad = {key: w for key, w in (weights or {}).items() if not w > 0}
+        if bad:
+            raise ValueError(f"User weights must be positive: {bad}")
+        self.slots = slots
+        self.rate_per_s = rate_per_s
+        self.burst = burst
+        self.max_queued = max_queued
+        self.weights = dict(weights or {})
+        self.metrics_users = metrics_users
+        self.idle_s = idle_s
+
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._busy = 0
+        self._waiting: list[tuple[float, int, Ticket]] = []
+        self._virtual = 0.0
+        self._last_finish: dict[str, float] = {}
+        self._buckets: dict[str, _Bucket] = {}
+        self._pending: dict[str, int] = {}
+        self._delays: dict[str, _UserDelay] = {}
+        self._admitted = 0
+
+        USER_QUEUE_SECONDS.set_function(self._user_delays)
+        SLOTS.set_function(lambda: {"busy": self._busy, "free": self.slots - self._busy})
+
+    def admit(self, key: str) -> Ticket:
+        """
+        Admit a turn of `key` or refuse it at once.
+
+        Raises:
+            SlowDown: Rate ("rate") or queue ("queue") limit of the user hit
+        """
+        now = time.monotonic()
+        with self._lock:
+            pending = self._pending.get(key, 0)
+            if pending > self.max_queued:
+                REJECTED.labels("queue").inc()
+                raise SlowDown(
+                    "queue",
+                    f"Slow down: {pending} messages are still waiting for a reply",
+                    None,
+                )
+
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = _Bucket(float(self.burst), now)
+            bucket.tokens = min(
+                float(self.burst), bucket.tokens + (now - bucket.updated) * self.rate_per_s
+            )
+            bucket.updated = now
+            if bucket.tokens < 1.0:
+                REJECTED.labels("rate").inc()
+                retry_after = round((1.0 - bucket.tokens) / self.rate_per_s, 3)
+                raise SlowDown(
+                    "rate",
+                    f"Slow down: too many messages, try again in {retry_after:.0f}s",
+                    retry_after,
+                )
+            bucket.tokens -= 1.0
+
+            start = max(self._virtual, self._last_finish.get(key, 0.0))
+            self._last_finish[key] = start + 1.0 / self.weights.get(key, 1.0)
+            self._pending[key] = pending + 1
+            self._admitted += 1
+            if self._admitted % 1000 == 0:
+                self._prune(now)
+            return Ticket(key=key, start=start, seq=next(self._seq), admitted_at=now)
+
+    async def wait(self, ticket: Ticket) -> float:
+        """
+        Wait for a slot (smallest start tag first).
+
+        A ticket released before its wait (the turn was abandoned) gets no
+        slot and returns at once.
+
+        Returns:
+            Queueing delay in seconds (since admit)
+        """
+        future = asyncio.get_running_loop().create_future()
+        with self._lock:
+            if ticket.released:
+                return 0.0
+            ticket._wake = (asyncio.get_running_loop(), future)
+            heapq.heappush(self._waiting, (ticket.start, ticket.seq, ticket))
+            self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            self.release(ticket)  # leaves the queue, or hands the slot on
+            raise
+
+        delay = time.monotonic() - ticket.admitted_at
+        QUEUE_SECONDS.observe(delay)
+        with self._lock:
+            stats = self._delays.get(ticket.key)
+            if stats is None:
+                stats = self._delays[ticket.key] = _UserDelay()
+            stats.mean = delay if stats.mean is None else stats.mean + 0.2 * (delay - stats.mean)
+            stats.seen = time.monotonic()
+        return delay
+
+    def release(self, ticket: Ticket) -> None:
+        """The turn ended (or gave up): free its slot and its place; idempotent."""
+        with self._lock:
+            if ticket.released:
+                return
+            ticket.released = True
+            pending = self._pending.get(ticket.key, 1) - 1
+            if pending > 0:
+                self._pending[ticket.key] = pending
+            else:
+                self._pending.pop(ticket.key, None)
+            if ticket.granted:
+                self._busy -= 1
+                self._dispatch()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            waiting = sum(1 for _, _, t in self._waiting if not t.released)
+            return {
+                "slots": self.slots,
+                "busy": self._busy,
+                "waiting": waiting,
+                "users_pending": len(self._pending),
+            }
+
+    # ------------------------------------------------------------------
+    # Internals (called with self._lock held unless noted)
+    # ------------------------------------------------------------------
+
+    def _dispatch(self) -> None:
+        while self._busy < self.slots and self._waiting:
+            _, _, ticket = heapq.heappop(self._waiting)
+            if ticket.released:  # gave up while queued
+                continue
+            ticket.granted = True
+            self._busy += 1
+            self._virtual = max(self._virtual, ticket.start)
+            loop, future = ticket._wake
+            loop.call_soon_threadsafe(_wake, future)
+
+    def _prune(self, now: float) -> None:
+        """Forget users idle for idle_s (a full bucket and no backlog)."""
+        for key in [k for k, b in self._buckets.items() if now - b.updated > self.idle_s]:
+            if key not in self._pending:
+                del self._buckets[key]
+        for key in [k for k, f in self._last_finish.items() if f <= self._virtual]:
+            del self._last_finish[key]
+        for key in [k for k, d in self._delays.items() if now - d.seen > self.idle_s]:
+            del self._delays[key]
+
+    def _user_delays(self) -> dict[str, float]:
+        """Scrape time (outside the lock): users with the longest recent delay."""
+        now = time.monotonic()
+        with self._lock:
+            recent = [
+                (key, stats.mean)
+                for key, stats in self._delays.items()
+                if stats.mean is not None and now - stats.seen <= self.idle_s
+            ]
+        recent.sort(key=lambda kv: -kv[1])
+        return dict(recent[: self.metrics_users])